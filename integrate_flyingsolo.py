@@ -5,25 +5,29 @@ Integrate FlyingSolo scraped data with the semantic search system.
 
 import os
 import sys
+import argparse
 import pandas as pd
 import numpy as np
 from pathlib import Path
 from sentence_transformers import SentenceTransformer
 from PIL import Image
-import faiss
-import pickle
-from rank_bm25 import BM25Okapi
 from sklearn.preprocessing import normalize
 import warnings
 warnings.filterwarnings("ignore")
 
-def integrate_flyingsolo_data():
+sys.path.append(str(Path(__file__).parent / "server"))
+from bm25_index import BM25Index
+from ann import add_index_arguments, build_ann_index, index_params_from_args, save_embeddings, write_index
+from artifacts import ArtifactStore
+from delta import publish_build
+
+def integrate_flyingsolo_data(index_type='flat', **index_params):
     """Integrate FlyingSolo data with existing semantic search indices"""
     
     # Paths
     project_root = Path(__file__).parent
     flyingsolo_csv = project_root / "public/data/flyingsolo/products.csv"
-    server_artifacts = project_root / "server/artifacts"
+    store = ArtifactStore(project_root / "server/artifacts")
     server_data = project_root / "server/data"
     
     # Check if FlyingSolo data exists
@@ -157,7 +161,7 @@ def integrate_flyingsolo_data():
         tokens = combined_text.replace(',', ' ').replace('.', ' ').split()
         tokenized_docs.append(tokens)
     
-    bm25 = BM25Okapi(tokenized_docs)
+    bm25 = BM25Index.from_tokenized(tokenized_docs)
     
     # Build FAISS indices
     print("Building FAISS indices...")
@@ -165,28 +169,26 @@ def integrate_flyingsolo_data():
     img_dim = image_embeddings.shape[1]
     
     # Text index
-    text_index = faiss.IndexFlatIP(text_dim)
-    text_index.add(text_embeddings.astype('float32'))
+    text_index, text_index_params = build_ann_index(text_embeddings, index_type, **index_params)
     
     # Image index
-    img_index = faiss.IndexFlatIP(img_dim)
-    img_index.add(image_embeddings.astype('float32'))
+    img_index, img_index_params = build_ann_index(image_embeddings, index_type, **index_params)
     
     # Save artifacts
     print("Saving artifacts...")
-    server_artifacts.mkdir(parents=True, exist_ok=True)
+    version = store.new_version()
+    server_artifacts = store.version_path(version)
     
     # Save FAISS indices
-    faiss.write_index(text_index, str(server_artifacts / "text.index"))
-    faiss.write_index(img_index, str(server_artifacts / "img.index"))
+    write_index(text_index, server_artifacts / "text.index")
+    write_index(img_index, server_artifacts / "img.index")
     
     # Save embeddings
-    np.save(str(server_artifacts / "E_text.npy"), text_embeddings)
-    np.save(str(server_artifacts / "E_img.npy"), image_embeddings)
+    save_embeddings(server_artifacts / "E_text.npy", text_embeddings)
+    save_embeddings(server_artifacts / "E_img.npy", image_embeddings)
     
-    # Save BM25
-    with open(server_artifacts / "bm25.pkl", 'wb') as f:
-        pickle.dump(bm25, f)
+    # Save BM25 posting lists
+    bm25.save(server_artifacts / "bm25_index.npz")
     
     # Save product catalog
     combined_df.to_parquet(server_artifacts / "catalog.parquet", index=False)
@@ -202,6 +204,11 @@ def integrate_flyingsolo_data():
             'image': 0.3,
             'keyword': 0.2
         },
+        'index': {
+            'text': text_index_params,
+            'image': img_index_params
+        },
+        'index_params': index_params,
         'data_sources': ['original', 'flyingsolo'],
         'flyingsolo_products': len(flyingsolo_df)
     }
@@ -209,20 +216,26 @@ def integrate_flyingsolo_data():
     with open(server_artifacts / "metadata.json", 'w') as f:
         json.dump(metadata, f, indent=2)
     
+    # Running servers switch to the new set once it is published; API product updates carry over
+    publish_build(store, version)
+    
     print(f"Integration completed!")
     print(f"Total products: {len(combined_df)}")
     print(f"FlyingSolo products: {len(flyingsolo_df)}")
     print(f"Text embeddings: {text_embeddings.shape}")
     print(f"Image embeddings: {image_embeddings.shape}")
-    print(f"Artifacts saved to: {server_artifacts}")
+    print(f"Artifacts saved to: {server_artifacts} (version {version})")
     
     return True
 
 if __name__ == "__main__":
-    success = integrate_flyingsolo_data()
+    parser = argparse.ArgumentParser(description="Merge FlyingSolo products into the catalog and rebuild the indices")
+    add_index_arguments(parser)
+    args = parser.parse_args()
+    success = integrate_flyingsolo_data(args.index_type, **index_params_from_args(args))
     if success:
         print("\n✅ Integration successful!")
-        print("You can now restart the backend server to see FlyingSolo products in the lab.")
+        print("Running backend servers will switch to the new indices within a few seconds.")
     else:
         print("\n❌ Integration failed!")
         sys.exit(1)
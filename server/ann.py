@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+FAISS index construction, search-time tuning and artifact IO.
+Supports exact (flat) search, flat search over 8-bit scalar-quantized codes (SQ8), plus
+HNSW, IVF and IVF-PQ approximate indices over normalized embeddings (inner product ==
+cosine similarity), and an overlay that adds and deletes rows without rebuilding them.
+"""
+
+import os
+import math
+import faiss
+import numpy as np
+from typing import Any, Dict, Optional, Tuple
+
+INDEX_TYPES = ('flat', 'sq8', 'hnsw', 'ivf', 'ivfpq')
+
+# Storage types of E_text.npy / E_img.npy; float16 halves them (FAISS indices are built from the
+# stored values, so they agree with the embeddings on disk)
+EMBEDDING_DTYPES = ('float32', 'float16')
+
+DEFAULT_INDEX_PARAMS = {
+    'hnsw': {'M': 32, 'efConstruction': 200, 'efSearch': 64},
+    'ivf': {'nlist': 1024, 'nprobe': 16},
+    'ivfpq': {'nlist': 1024, 'nprobe': 16, 'pq_m': 32, 'pq_nbits': 8},
+}
+
+# FAISS wants at least this many training points per IVF list
+MIN_POINTS_PER_CENTROID = 39
+
+# Build parameters and the command-line flags of build_index.py / integrate_flyingsolo.py setting them
+INDEX_PARAM_FLAGS = {
+    'nlist': '--nlist',
+    'nprobe': '--nprobe',
+    'M': '--hnsw-m',
+    'efConstruction': '--ef-construction',
+    'efSearch': '--ef-search',
+    'pq_m': '--pq-m',
+    'pq_nbits': '--pq-nbits',
+}
+# Parameters lowered to what the catalog size allows, so recorded values may not be the requested ones
+CLAMPED_PARAMS = ('nlist', 'nprobe', 'pq_nbits')
+
+
+def add_index_arguments(parser):
+    """Add --index-type and the INDEX_PARAM_FLAGS options to an argparse parser."""
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat",
+                        help="FAISS index type for text and image embeddings")
+    parser.add_argument("--nlist", type=int, help="IVF: number of inverted lists")
+    parser.add_argument("--nprobe", type=int, help="IVF: default lists probed per query")
+    parser.add_argument("--hnsw-m", type=int, dest="M", help="HNSW: neighbors per node")
+    parser.add_argument("--ef-construction", type=int, dest="efConstruction", help="HNSW: build-time beam width")
+    parser.add_argument("--ef-search", type=int, dest="efSearch", help="HNSW: default query-time beam width")
+    parser.add_argument("--pq-m", type=int, dest="pq_m", help="IVF-PQ: sub-quantizers (code size in bytes at 8 bits)")
+    parser.add_argument("--pq-nbits", type=int, dest="pq_nbits", help="IVF-PQ: bits per sub-quantizer code")
+
+
+def index_params_from_args(args) -> Dict[str, Any]:
+    """Build parameters given on the command line (see add_index_arguments)."""
+    return {key: getattr(args, key) for key in INDEX_PARAM_FLAGS if getattr(args, key) is not None}
+
+
+def index_config(metadata: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    """
+    Index type and requested build parameters recorded in an artifact set's metadata.json, to
+    build another set the same way. Sets written before 'index_params' was recorded only have
+    the effective parameters, of which the clamped ones are left to the defaults.
+    """
+    params = dict(metadata.get('index', {}).get('text', {}))
+    index_type = params.pop('type', 'flat')
+    if 'index_params' in metadata:
+        return index_type, dict(metadata['index_params'])
+    return index_type, {key: value for key, value in params.items()
+                        if key in INDEX_PARAM_FLAGS and key not in CLAMPED_PARAMS}
+
+
+def build_ann_index(embeddings: np.ndarray, index_type: str = 'flat',
+                    **overrides) -> Tuple[faiss.Index, Dict[str, Any]]:
+    """
+    Build and fill an inner-product index of the given type.
+
+    Returns the index and the effective parameters (after clamping nlist and
+    PQ settings to what the catalog size and dimension allow), suitable for
+    metadata.json.
+    """
+    x = np.ascontiguousarray(embeddings, dtype='float32')
+    index, params = create_ann_index(x.shape[1], x.shape[0], index_type, **overrides)
+    if not index.is_trained:
+        index.train(x)
+    index.add(x)
+    return index, params
+
+
+def create_ann_index(d: int, n: int, index_type: str = 'flat',
+                     **overrides) -> Tuple[faiss.Index, Dict[str, Any]]:
+    """
+    Empty index of the given type for n vectors of dimension d, and its
+    effective parameters (see build_ann_index). IVF indices still need
+    train() before vectors can be added.
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
+
+    params = dict(DEFAULT_INDEX_PARAMS.get(index_type, {}))
+    # Overrides that do not apply to this index type are ignored
+    params.update({key: value for key, value in overrides.items() if value is not None and key in params})
+
+    if index_type == 'flat':
+        index = faiss.IndexFlatIP(d)
+
+    elif index_type == 'sq8':
+        # One byte per dimension; training only records each dimension's value range
+        index = faiss.IndexScalarQuantizer(d, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+
+    elif index_type == 'hnsw':
+        index = faiss.IndexHNSWFlat(d, params['M'], faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = params['efConstruction']
+        index.hnsw.efSearch = params['efSearch']
+
+    else:
+        params['nlist'] = max(1, min(params['nlist'], n // MIN_POINTS_PER_CENTROID))
+        params['nprobe'] = min(params['nprobe'], params['nlist'])
+        quantizer = faiss.IndexFlatIP(d)
+        if index_type == 'ivf':
+            index = faiss.IndexIVFFlat(quantizer, d, params['nlist'], faiss.METRIC_INNER_PRODUCT)
+        else:
+            if d % params['pq_m'] != 0:
+                raise ValueError(f"pq_m={params['pq_m']} must divide the embedding dimension {d}")
+            # Each sub-quantizer trains 2**nbits centroids, which needs enough points per centroid
+            max_nbits = int(math.log2(max(n // MIN_POINTS_PER_CENTROID, 2)))
+            params['pq_nbits'] = max(1, min(params['pq_nbits'], max_nbits))
+            index = faiss.IndexIVFPQ(quantizer, d, params['nlist'], params['pq_m'],
+                                     params['pq_nbits'], faiss.METRIC_INNER_PRODUCT)
+        index.nprobe = params['nprobe']
+
+    return index, {'type': index_type, **params}
+
+
+def search_params(index: faiss.Index, nprobe: Optional[int] = None,
+                  ef_search: Optional[int] = None,
+                  sel: Optional[faiss.IDSelector] = None) -> Optional[faiss.SearchParameters]:
+    """
+    Per-call search parameters for the index, or None to use its defaults.
+    Passing these to index.search() avoids mutating a shared index from concurrent requests.
+    Only ids accepted by `sel` are returned.
+    """
+    # SearchParameters start from FAISS defaults, not the index's, so fill in the index's own
+    if isinstance(index, faiss.IndexIVF) and (nprobe is not None or sel is not None):
+        return faiss.SearchParametersIVF(nprobe=nprobe if nprobe is not None else index.nprobe, sel=sel)
+    if isinstance(index, faiss.IndexHNSW) and (ef_search is not None or sel is not None):
+        return faiss.SearchParametersHNSW(efSearch=ef_search if ef_search is not None else index.hnsw.efSearch,
+                                          sel=sel)
+    if sel is not None:
+        return faiss.SearchParameters(sel=sel)
+    return None
+
+
+def _search(index: faiss.Index, queries: np.ndarray, k: int,
+            params: Optional[faiss.SearchParameters]) -> Tuple[np.ndarray, np.ndarray]:
+    if params is None:
+        return index.search(queries, k)
+    return index.search(queries, k, params=params)
+
+
+def search(index: faiss.Index, queries: np.ndarray, k: int, nprobe: Optional[int] = None,
+           ef_search: Optional[int] = None, mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """index.search with optional per-call nprobe / efSearch; with a mask only rows set in it are returned."""
+    if isinstance(index, DeltaIndex):
+        return index.search(queries, k, nprobe, ef_search, mask)
+    selector = BitmapSelector(mask) if mask is not None else None
+    return _search(index, queries, k, search_params(index, nprobe, ef_search, selector.sel if selector else None))
+
+
+def search_rows(vectors: np.ndarray, rows: np.ndarray, queries: np.ndarray,
+                k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Exact inner-product search among a subset of rows whose vectors are given in the same order.
+    Results have index.search's layout: ids are rows, padded with -1 (and the lowest score).
+    """
+    scores = np.full((len(queries), k), np.finfo('float32').min, dtype='float32')
+    ids = np.full((len(queries), k), -1, dtype=np.int64)
+    found = min(k, len(rows))
+    if found:
+        similarities = queries @ vectors.T
+        top = np.argpartition(-similarities, found - 1, axis=1)[:, :found]
+        top_scores = np.take_along_axis(similarities, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        scores[:, :found] = np.take_along_axis(top_scores, order, axis=1)
+        ids[:, :found] = np.asarray(rows)[np.take_along_axis(top, order, axis=1)]
+    return scores, ids
+
+
+def merge_results(first: Tuple[np.ndarray, np.ndarray], second: Tuple[np.ndarray, np.ndarray],
+                  k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Top k of two (scores, ids) search results over disjoint rows, in index.search's layout."""
+    scores = np.hstack([first[0], second[0]])
+    ids = np.hstack([first[1], second[1]])
+    # Padding (-1) carries the lowest possible score and sorts last
+    order = np.argsort(-scores, axis=1, kind='stable')[:, :k]
+    return np.take_along_axis(scores, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+
+def selector_may_miss_rows(index) -> bool:
+    """
+    Whether a search behind an ID selector can return fewer than k allowed rows. HNSW and IVF
+    only visit part of the index; flat and SQ indices scan every allowed row.
+    """
+    base = index.base if isinstance(index, DeltaIndex) else index
+    return isinstance(base, (faiss.IndexHNSW, faiss.IndexIVF))
+
+
+class BitmapSelector:
+    """IDSelectorBitmap over a boolean mask; keeps the packed bits alive as long as the selector."""
+
+    def __init__(self, mask: np.ndarray):
+        self.bits = np.packbits(np.asarray(mask, dtype=bool), bitorder='little')
+        self.sel = faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(self.bits))
+
+
+class DeltaIndex:
+    """
+    A built index plus the rows added since and a mask of live rows.
+
+    Added rows are searched exactly in a flat index and take the ids after
+    the base rows, so ids stay aligned with catalog rows. Rows outside `live`
+    (replaced or deleted products) are skipped inside both FAISS searches by
+    ID selectors, so searches still fill k. Instances are never modified;
+    with_changes() returns a new one sharing the base index.
+    """
+
+    def __init__(self, base: faiss.Index, added_vectors: Optional[np.ndarray] = None,
+                 live: Optional[np.ndarray] = None):
+        self.base = base
+        self.d = base.d
+        if added_vectors is None:
+            added_vectors = np.empty((0, self.d), dtype='float32')
+        self.added_vectors = np.ascontiguousarray(added_vectors, dtype='float32')
+        self.added = faiss.IndexFlatIP(self.d)
+        if len(self.added_vectors):
+            self.added.add(self.added_vectors)
+        self.ntotal = base.ntotal + self.added.ntotal
+        self.live = live
+        self._selectors = None
+        if live is not None:
+            self._selectors = (BitmapSelector(live[:base.ntotal]), BitmapSelector(live[base.ntotal:]))
+
+    @classmethod
+    def wrap(cls, index) -> "DeltaIndex":
+        return index if isinstance(index, DeltaIndex) else cls(index)
+
+    def with_changes(self, vectors: np.ndarray, live: np.ndarray) -> "DeltaIndex":
+        """Index with vectors appended as new rows and the given live mask (over all rows)."""
+        if len(vectors):
+            vectors = np.vstack([self.added_vectors, np.asarray(vectors, dtype='float32')])
+        else:
+            vectors = self.added_vectors
+        return DeltaIndex(self.base, vectors, live)
+
+    def search(self, queries: np.ndarray, k: int, nprobe: Optional[int] = None,
+               ef_search: Optional[int] = None, mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Search the live rows, or only those also set in mask (over all rows)."""
+        selectors = self._selectors
+        if mask is not None:
+            allowed = mask if self.live is None else mask & self.live
+            selectors = (BitmapSelector(allowed[:self.base.ntotal]), BitmapSelector(allowed[self.base.ntotal:]))
+        base_sel, added_sel = (s.sel for s in selectors) if selectors else (None, None)
+        scores, ids = _search(self.base, queries, k, search_params(self.base, nprobe, ef_search, base_sel))
+        if not self.added.ntotal:
+            return scores, ids
+
+        added_scores, added_ids = _search(self.added, queries, min(k, self.added.ntotal),
+                                          search_params(self.added, sel=added_sel))
+        added_ids = np.where(added_ids >= 0, added_ids + self.base.ntotal, -1)
+        return merge_results((scores, ids), (added_scores, added_ids), k)
+
+
+def apply_index_params(index: faiss.Index, params: Dict[str, Any]):
+    """Set default query-time parameters recorded in metadata.json on a loaded index."""
+    if 'nprobe' in params and isinstance(index, faiss.IndexIVF):
+        index.nprobe = params['nprobe']
+    if 'efSearch' in params and isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = params['efSearch']
+
+
+def write_index(index: faiss.Index, path):
+    """Write via a temporary file and rename, so processes mapping the old file keep a valid view."""
+    tmp = f"{path}.tmp"
+    faiss.write_index(index, tmp)
+    os.replace(tmp, str(path))
+
+
+def read_index(path, mmap: bool = False) -> faiss.Index:
+    """
+    Load an index. With mmap the vector storage is mapped read-only from the
+    file, so every process loading it shares one page-cache copy; the index
+    must not be modified afterwards.
+    """
+    if not mmap:
+        return faiss.read_index(str(path))
+    # IO_FLAG_MMAP_IFC (faiss >= 1.10) also maps flat, SQ and HNSW vector storage; the HNSW
+    # graph links and IVF coarse quantizers are still read into memory. Older faiss only maps IVF lists
+    flags = getattr(faiss, 'IO_FLAG_MMAP_IFC', faiss.IO_FLAG_MMAP)
+    return faiss.read_index(str(path), flags | faiss.IO_FLAG_READ_ONLY)
+
+
+def save_embeddings(path, embeddings: np.ndarray):
+    """np.save through a temporary file and rename (see write_index)."""
+    tmp = f"{path}.tmp"
+    with open(tmp, 'wb') as f:
+        np.save(f, embeddings)
+    os.replace(tmp, str(path))
+
+
+def load_embeddings(path, mmap: bool = False) -> np.ndarray:
+    return np.load(str(path), mmap_mode='r' if mmap else None)
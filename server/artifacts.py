@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Versioned search artifacts.
+Every build writes a complete artifact set into artifacts/versions/<version>/ and the CURRENT
+file names the set to serve, so a new set can be built and validated next to the live one and
+published with a single rename. An artifacts/ directory without CURRENT is served as-is.
+"""
+
+import os
+import json
+import time
+import shutil
+import pickle
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional
+import faiss
+from ann import apply_index_params, load_embeddings, read_index, save_embeddings, write_index
+from attributes import AttributeIndex
+from bm25_index import BM25Index
+from catalog import ColumnarCatalog
+
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+# Query encoders exported by build_index.py --export-onnx, inside an artifact set
+ONNX_DIR = "onnx"
+
+
+class ArtifactStore:
+    """Layout of versioned artifact sets under one root directory."""
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def current_version(self) -> Optional[str]:
+        try:
+            return (self.root / CURRENT_FILE).read_text().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def current_path(self) -> Path:
+        version = self.current_version()
+        return self.version_path(version) if version else self.root
+
+    def version_path(self, version: str) -> Path:
+        return self.root / VERSIONS_DIR / version
+
+    def versions(self) -> List[str]:
+        versions_dir = self.root / VERSIONS_DIR
+        if not versions_dir.exists():
+            return []
+        return sorted(p.name for p in versions_dir.iterdir() if p.is_dir())
+
+    def new_version(self) -> str:
+        """Create and return an empty, not yet published version directory."""
+        base = time.strftime("%Y%m%d-%H%M%S")
+        version, n = base, 1
+        while self.version_path(version).exists():
+            version, n = f"{base}-{n}", n + 1
+        self.version_path(version).mkdir(parents=True)
+        return version
+
+    def publish(self, version: str):
+        """Point CURRENT at version (atomic rename)."""
+        tmp = self.root / f"{CURRENT_FILE}.tmp"
+        tmp.write_text(version + "\n")
+        os.replace(tmp, self.root / CURRENT_FILE)
+
+    def discard(self, version: str):
+        shutil.rmtree(self.version_path(version), ignore_errors=True)
+
+    def prune(self, keep: int):
+        """Delete all but the newest `keep` versions, never the published one."""
+        current = self.current_version()
+        for version in self.versions()[:-keep] if keep > 0 else self.versions():
+            if version != current:
+                self.discard(version)
+
+
+class SearchArtifacts(NamedTuple):
+    """
+    One loaded artifact set. Searches take a reference once, so a swap never mixes two sets.
+    After incremental updates (see delta.py) the indices are DeltaIndex overlays, catalog rows
+    continue past the built ones, `live` masks out replaced and deleted rows and `delta_seq`
+    is the last delta log segment applied (or already folded into the set by compaction, see
+    compacted_seq). The embedding arrays always hold the built rows only.
+    """
+    version: Optional[str]
+    path: Path
+    text_index: faiss.Index
+    img_index: faiss.Index
+    text_embeddings: np.ndarray
+    img_embeddings: np.ndarray
+    bm25: BM25Index
+    catalog: ColumnarCatalog
+    metadata: Dict[str, Any]
+    attributes: AttributeIndex
+    live: Optional[np.ndarray] = None
+    delta_seq: int = 0
+
+
+def save_artifacts(path: Path, text_index: faiss.Index, img_index: faiss.Index,
+                   text_embeddings: np.ndarray, img_embeddings: np.ndarray, bm25: BM25Index,
+                   catalog: pd.DataFrame, metadata: Dict[str, Any]):
+    """Write a complete artifact set into path."""
+    path = Path(path)
+    # Save FAISS indices
+    write_index(text_index, path / "text.index")
+    write_index(img_index, path / "img.index")
+    
+    # Save embeddings
+    save_embeddings(path / "E_text.npy", text_embeddings)
+    save_embeddings(path / "E_img.npy", img_embeddings)
+    
+    # Save BM25 posting lists
+    bm25.save(path / "bm25_index.npz")
+    
+    # Save product catalog and its filter indexes
+    catalog.to_parquet(path / "catalog.parquet", index=False)
+    AttributeIndex.from_dataframe(catalog).save(path / "attributes.npz")
+    
+    with open(path / "metadata.json", 'w') as f:
+        json.dump(metadata, f, indent=2)
+
+
+def compacted_seq(metadata: Dict[str, Any]) -> int:
+    """Last delta log segment already contained in a compacted set's built rows (0 for a fresh build)."""
+    return metadata.get('compacted_from', {}).get('delta_seq', 0)
+
+
+def load_artifacts(path: Path, version: Optional[str] = None, mmap: bool = False) -> SearchArtifacts:
+    path = Path(path)
+    text_index = read_index(path / "text.index", mmap=mmap)
+    img_index = read_index(path / "img.index", mmap=mmap)
+
+    # Load BM25 (legacy artifact sets only ship a pickled BM25Okapi)
+    bm25_path = path / "bm25_index.npz"
+    if bm25_path.exists():
+        bm25 = BM25Index.load(bm25_path)
+    else:
+        with open(path / "bm25.pkl", 'rb') as f:
+            bm25 = BM25Index.from_okapi(pickle.load(f))
+
+    with open(path / "metadata.json", 'r') as f:
+        metadata = json.load(f)
+
+    # Sets built before filtered search have no attribute indexes yet
+    attributes_path = path / "attributes.npz"
+    if attributes_path.exists():
+        attributes = AttributeIndex.load(attributes_path)
+    else:
+        attributes = AttributeIndex.from_parquet(path / "catalog.parquet")
+
+    # Default nprobe / efSearch the indices were built with
+    index_meta = metadata.get('index', {})
+    apply_index_params(text_index, index_meta.get('text', {}))
+    apply_index_params(img_index, index_meta.get('image', {}))
+
+    return SearchArtifacts(
+        version=version,
+        path=path,
+        text_index=text_index,
+        img_index=img_index,
+        text_embeddings=load_embeddings(path / "E_text.npy", mmap=mmap),
+        img_embeddings=load_embeddings(path / "E_img.npy", mmap=mmap),
+        bm25=bm25,
+        catalog=ColumnarCatalog.from_parquet(path / "catalog.parquet"),
+        metadata=metadata,
+        attributes=attributes,
+        delta_seq=compacted_seq(metadata)
+    )
+
+
+def check_artifacts(artifacts: SearchArtifacts):
+    """Raise ValueError if the parts of an artifact set do not describe the same products."""
+    sizes = {
+        'catalog': len(artifacts.catalog),
+        'text.index': artifacts.text_index.ntotal,
+        'img.index': artifacts.img_index.ntotal,
+        'E_text.npy': len(artifacts.text_embeddings),
+        'E_img.npy': len(artifacts.img_embeddings),
+        'bm25': artifacts.bm25.corpus_size,
+        'attributes': len(artifacts.attributes)
+    }
+    if len(set(sizes.values())) != 1:
+        raise ValueError(f"Artifact sizes disagree: {sizes}")
+    if sizes['catalog'] == 0:
+        raise ValueError("Artifact set is empty")
+    expected = artifacts.metadata.get('num_products')
+    if expected is not None and expected != sizes['catalog']:
+        raise ValueError(f"metadata.json lists {expected} products, catalog has {sizes['catalog']}")
+    for name, index, key in (('text.index', artifacts.text_index, 'text_dim'),
+                             ('img.index', artifacts.img_index, 'img_dim')):
+        if key in artifacts.metadata and artifacts.metadata[key] != index.d:
+            raise ValueError(f"{name} has dimension {index.d}, metadata.json says {artifacts.metadata[key]}")
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Attribute indexes for filtered search.
+Built next to the FAISS indices: every color, material, size and store value has a packed bitmap
+of the rows carrying it, and prices are kept as a sorted array with the rows in that order, so a
+filter is a few bitmap ORs/ANDs and two binary searches instead of a scan over the catalog.
+"""
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+# Filterable attributes and the catalog column each one is read from
+ATTRIBUTE_COLUMNS = {'color': 'color', 'material': 'material', 'size': 'sizes', 'store': 'store'}
+
+# Attributes counted by facet_counts, and the upper edges of its price buckets (the last one is open)
+FACET_ATTRIBUTES = ('color', 'material', 'size')
+PRICE_BUCKET_EDGES = (25, 50, 100, 200, 500)
+
+# sizes lists several values per product ("XS, S, M" or "Choose an option|S|M")
+SIZE_SEPARATORS = (',', '|')
+SIZE_PLACEHOLDERS = {'choose an option'}
+
+
+class AttributeFilter(NamedTuple):
+    """
+    Structured search filter. Values match case-insensitively; a product passes when it has any
+    of the listed values of every attribute given and a price in [price_min, price_max].
+    Hashable, so it can be part of cache keys.
+    """
+    price_min: Optional[float] = None
+    price_max: Optional[float] = None
+    color: Tuple[str, ...] = ()
+    material: Tuple[str, ...] = ()
+    size: Tuple[str, ...] = ()
+    store: Tuple[str, ...] = ()
+
+    @classmethod
+    def from_dict(cls, filters: Optional[Dict[str, Any]]) -> Optional["AttributeFilter"]:
+        """Canonical filter from request fields (None or empty lists mean no constraint)."""
+        if not filters:
+            return None
+        values = {name: tuple(sorted({str(v).strip().lower() for v in filters.get(name) or []}))
+                  for name in ATTRIBUTE_COLUMNS}
+        attribute_filter = cls(filters.get('price_min'), filters.get('price_max'), **values)
+        return None if attribute_filter.is_empty() else attribute_filter
+
+    def is_empty(self) -> bool:
+        return self.price_min is None and self.price_max is None and not any(
+            getattr(self, name) for name in ATTRIBUTE_COLUMNS)
+
+
+def attribute_values(name: str, value) -> List[str]:
+    """Values of one attribute for a catalog cell; missing cells have none."""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return []
+    value = str(value).strip()
+    if name != 'size':
+        return [value] if value else []
+    for separator in SIZE_SEPARATORS[1:]:
+        value = value.replace(separator, SIZE_SEPARATORS[0])
+    sizes = (size.strip() for size in value.split(SIZE_SEPARATORS[0]))
+    return [size for size in sizes if size and size.lower() not in SIZE_PLACEHOLDERS]
+
+
+class AttributeColumn:
+    """
+    Dictionary-encoded attribute with any number of values per row, in CSR form: the codes of
+    row r are codes[offsets[r]:offsets[r + 1]]. `values` keeps the first spelling seen of each
+    value; `lookup` maps lowercased values to codes.
+    """
+
+    def __init__(self, values: List[str], offsets: np.ndarray, codes: np.ndarray):
+        self.values = list(values)
+        self.lookup = {}
+        for code, value in enumerate(self.values):
+            self.lookup.setdefault(value.lower(), code)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.codes = np.asarray(codes, dtype=np.int32)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @classmethod
+    def from_lists(cls, rows: List[List[str]]) -> "AttributeColumn":
+        position: Dict[str, int] = {}
+        values: List[str] = []
+        codes: List[int] = []
+        offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        for r, row in enumerate(rows):
+            row_codes = set()
+            for value in row:
+                code = position.get(value.lower())
+                if code is None:
+                    code = position[value.lower()] = len(values)
+                    values.append(value)
+                row_codes.add(code)
+            codes.extend(sorted(row_codes))
+            offsets[r + 1] = len(codes)
+        return cls(values, offsets, np.array(codes, dtype=np.int32))
+
+    def take(self, rows: np.ndarray) -> "AttributeColumn":
+        """Column of the given rows (-1 gives a row without values), sharing this dictionary."""
+        rows = np.asarray(rows, dtype=np.int64)
+        lengths = np.append(np.diff(self.offsets), 0)[rows]
+        starts = np.append(self.offsets[:-1], 0)[rows]
+        offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        entries = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+        return AttributeColumn(self.values, offsets, self.codes[entries])
+
+    def concat(self, other: "AttributeColumn") -> "AttributeColumn":
+        """Column with other's rows appended, re-coded against one merged dictionary."""
+        values = list(self.values)
+        lookup = dict(self.lookup)
+        for value in other.values:
+            if value.lower() not in lookup:
+                lookup[value.lower()] = len(values)
+                values.append(value)
+        remap = np.array([lookup[value.lower()] for value in other.values], dtype=np.int32)
+        return AttributeColumn(
+            values,
+            np.concatenate([self.offsets, other.offsets[1:] + self.offsets[-1]]),
+            np.concatenate([self.codes, remap[other.codes]])
+        )
+
+    def row_of_entry(self) -> np.ndarray:
+        return np.repeat(np.arange(len(self)), np.diff(self.offsets))
+
+    def bitmaps(self) -> np.ndarray:
+        """Packed (little bit order) row bitmap per value, shape (len(values), ceil(rows / 8))."""
+        bitmaps = np.zeros((len(self.values), (len(self) + 7) // 8), dtype=np.uint8)
+        rows = self.row_of_entry()
+        order = np.argsort(self.codes, kind='stable')
+        bounds = np.searchsorted(self.codes[order], np.arange(len(self.values) + 1))
+        mask = np.zeros(len(self), dtype=bool)
+        for code in range(len(self.values)):
+            value_rows = rows[order[bounds[code]:bounds[code + 1]]]
+            mask[value_rows] = True
+            bitmaps[code] = np.packbits(mask, bitorder='little')
+            mask[value_rows] = False
+        return bitmaps
+
+    def rows_with(self, codes: List[int], start: int = 0) -> np.ndarray:
+        """Boolean mask over rows start.. of the rows carrying any of codes."""
+        hit = np.isin(self.codes[self.offsets[start]:], codes)
+        rows = np.repeat(np.arange(len(self) - start), np.diff(self.offsets[start:]))[hit]
+        mask = np.zeros(len(self) - start, dtype=bool)
+        mask[rows] = True
+        return mask
+
+
+class AttributeIndex:
+    """
+    Filter indexes over catalog rows. Bitmaps and the price order cover the rows present at build
+    time; rows appended by incremental updates (see delta.py) are matched from their codes and
+    prices directly until the next build or compaction indexes them.
+    """
+
+    def __init__(self, columns: Dict[str, AttributeColumn], prices: np.ndarray,
+                 bitmaps: Optional[Dict[str, np.ndarray]] = None, price_order: Optional[np.ndarray] = None):
+        self.columns = columns
+        self.prices = np.asarray(prices, dtype=np.float64)
+        if bitmaps is None:
+            bitmaps = {name: column.bitmaps() for name, column in columns.items()}
+        if price_order is None:
+            price_order = np.argsort(self.prices, kind='stable')
+        self.bitmaps = bitmaps
+        self.price_order = np.asarray(price_order, dtype=np.int64)
+        self.num_indexed = len(self.price_order)
+        self.sorted_prices = self.prices[self.price_order]
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame) -> "AttributeIndex":
+        """Indexes over catalog rows; missing columns leave every row without values."""
+        columns = {}
+        for name, column in ATTRIBUTE_COLUMNS.items():
+            cells = df[column] if column in df.columns else pd.Series([None] * len(df), dtype=object)
+            # Parse each distinct cell once; missing cells factorize to -1, a row without values
+            rows, distinct = pd.factorize(cells)
+            column_of_distinct = AttributeColumn.from_lists([attribute_values(name, cell) for cell in distinct])
+            columns[name] = column_of_distinct.take(rows)
+        # Missing prices count as 0, as in the served catalog
+        prices = pd.to_numeric(df['price'], errors='coerce').fillna(0) if 'price' in df.columns else np.zeros(len(df))
+        return cls(columns, np.asarray(prices, dtype=np.float64))
+
+    @classmethod
+    def from_parquet(cls, path) -> "AttributeIndex":
+        available = pq.read_schema(path).names
+        wanted = [c for c in ('price', *ATTRIBUTE_COLUMNS.values()) if c in available]
+        return cls.from_dataframe(pq.read_table(path, columns=wanted).to_pandas())
+
+    def concat(self, other: "AttributeIndex") -> "AttributeIndex":
+        """Index with other's rows appended; the bitmaps and price order still cover this index's rows."""
+        columns = {name: column.concat(other.columns[name]) for name, column in self.columns.items()}
+        return AttributeIndex(columns, np.concatenate([self.prices, other.prices]),
+                              self.bitmaps, self.price_order)
+
+    def mask(self, attribute_filter: Optional[AttributeFilter]) -> Optional[np.ndarray]:
+        """Boolean mask of the rows passing the filter, or None without a filter."""
+        if attribute_filter is None or attribute_filter.is_empty():
+            return None
+        indexed = np.ones(self.num_indexed, dtype=bool)
+        appended = np.ones(len(self) - self.num_indexed, dtype=bool)
+
+        # Any listed value of an attribute (OR of its bitmaps), every listed attribute (AND)
+        packed = None
+        for name, column in self.columns.items():
+            wanted = getattr(attribute_filter, name)
+            if not wanted:
+                continue
+            codes = [column.lookup[value] for value in wanted if value in column.lookup]
+            bitmaps = self.bitmaps[name]
+            # Values first seen in appended rows have no bitmap (no indexed row carries them)
+            known = [code for code in codes if code < len(bitmaps)]
+            bits = np.bitwise_or.reduce(bitmaps[known], axis=0) if known else np.zeros(bitmaps.shape[1], dtype=np.uint8)
+            packed = bits if packed is None else packed & bits
+            if len(appended):
+                appended &= column.rows_with(codes, start=self.num_indexed)
+        if packed is not None:
+            indexed = np.unpackbits(packed, count=self.num_indexed, bitorder='little').view(bool)
+
+        # Price range: a slice of the rows in price order
+        low, high = attribute_filter.price_min, attribute_filter.price_max
+        if low is not None or high is not None:
+            start = 0 if low is None else np.searchsorted(self.sorted_prices, low, side='left')
+            end = self.num_indexed if high is None else np.searchsorted(self.sorted_prices, high, side='right')
+            in_range = np.zeros(self.num_indexed, dtype=bool)
+            in_range[self.price_order[start:end]] = True
+            indexed &= in_range
+            tail = self.prices[self.num_indexed:]
+            if low is not None:
+                appended &= tail >= low
+            if high is not None:
+                appended &= tail <= high
+
+        return np.concatenate([indexed, appended]) if len(appended) else indexed
+
+    def facet_counts(self, rows: np.ndarray) -> Dict[str, Any]:
+        """
+        Products per value of each facet attribute among rows, most frequent first, and per
+        price bucket [price_min, price_max) in PRICE_BUCKET_EDGES order.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        facets: Dict[str, Any] = {}
+        for name in FACET_ATTRIBUTES:
+            column = self.columns[name]
+            counts = np.bincount(column.take(rows).codes, minlength=len(column.values))
+            present = np.flatnonzero(counts)
+            present = present[np.argsort(-counts[present], kind='stable')]
+            facets[name] = {column.values[code]: int(counts[code]) for code in present}
+
+        edges = np.asarray(PRICE_BUCKET_EDGES, dtype=np.float64)
+        counts = np.bincount(np.searchsorted(edges, self.prices[rows], side='right'), minlength=len(edges) + 1)
+        lower = (0.0,) + PRICE_BUCKET_EDGES
+        upper = PRICE_BUCKET_EDGES + (None,)
+        facets['price'] = [{'price_min': low, 'price_max': high, 'count': int(count)}
+                           for low, high, count in zip(lower, upper, counts)]
+        return facets
+
+    def save(self, path: Path):
+        arrays = {'prices': self.prices, 'price_order': self.price_order}
+        for name, column in self.columns.items():
+            arrays[f"{name}_values"] = np.array(column.values, dtype=str)
+            arrays[f"{name}_offsets"] = column.offsets
+            arrays[f"{name}_codes"] = column.codes
+            arrays[f"{name}_bitmaps"] = self.bitmaps[name]
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path: Path) -> "AttributeIndex":
+        with np.load(path, allow_pickle=False) as data:
+            columns = {name: AttributeColumn(data[f"{name}_values"].tolist(), data[f"{name}_offsets"],
+                                             data[f"{name}_codes"])
+                       for name in ATTRIBUTE_COLUMNS}
+            bitmaps = {name: data[f"{name}_bitmaps"] for name in ATTRIBUTE_COLUMNS}
+            return cls(columns, data['prices'], bitmaps, data['price_order'])
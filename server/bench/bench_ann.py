@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+ANN index benchmark: recall@k against exact (flat) search and per-query latency
+for HNSW, IVF and IVF-PQ over a sweep of efSearch / nprobe values.
+Uses clustered synthetic embeddings; pass --artifacts DIR to use E_text.npy from a build.
+"""
+
+import sys
+import time
+import argparse
+import faiss
+import numpy as np
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+from ann import build_ann_index, search
+
+NUM_DOCS = 100_000
+DIM = 384
+NUM_CLUSTERS = 500
+NUM_QUERIES = 500
+K = 20
+
+EF_SEARCH = [16, 32, 64, 128, 256]
+NPROBE = [1, 4, 16, 64]
+
+
+def synthetic_embeddings(rng, n, d):
+    centers = rng.standard_normal((NUM_CLUSTERS, d)).astype('float32')
+    x = centers[rng.integers(0, NUM_CLUSTERS, n)] + 0.5 * rng.standard_normal((n, d)).astype('float32')
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def recall(found: np.ndarray, truth: np.ndarray) -> float:
+    return np.mean([len(np.intersect1d(f, t)) / len(t) for f, t in zip(found, truth)])
+
+
+def timed_search(index, queries, **params):
+    # One query per call, as the server issues them for single searches
+    start = time.perf_counter()
+    found = np.vstack([search(index, q[None, :], K, **params)[1] for q in queries])
+    return found, (time.perf_counter() - start) / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--artifacts", help="Directory with E_text.npy")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.artifacts:
+        embeddings = np.load(Path(args.artifacts) / "E_text.npy").astype('float32')
+    else:
+        embeddings = synthetic_embeddings(rng, NUM_DOCS, DIM)
+    queries = embeddings[rng.choice(len(embeddings), NUM_QUERIES, replace=False)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape).astype('float32')
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    flat, _ = build_ann_index(embeddings, 'flat')
+    truth, flat_t = timed_search(flat, queries)
+
+    print(f"docs: {len(embeddings)}, dim: {embeddings.shape[1]}, k={K}")
+    print(f"{'index':>8} {'param':>14} {'build (s)':>10} {'recall@k':>9} {'ms/query':>9} {'MB':>8}")
+    print(f"{'flat':>8} {'':>14} {'':>10} {1.0:>9.3f} {flat_t * 1000:>9.3f} {embeddings.nbytes / 2**20:>8.1f}")
+
+    sweeps = [('hnsw', 'ef_search', EF_SEARCH), ('ivf', 'nprobe', NPROBE), ('ivfpq', 'nprobe', NPROBE)]
+    for index_type, knob, values in sweeps:
+        start = time.perf_counter()
+        index, params = build_ann_index(embeddings, index_type)
+        build_t = time.perf_counter() - start
+        # Serialized size approximates resident index memory
+        size_mb = len(faiss.serialize_index(index)) / 2**20
+        for value in values:
+            found, t = timed_search(index, queries, **{knob: value})
+            label = f"{knob}={value}"
+            print(f"{index_type:>8} {label:>14} {build_t:>10.1f} {recall(found, truth):>9.3f} "
+                  f"{t * 1000:>9.3f} {size_mb:>8.1f}")
+        print(f"{'':>8} built with {params}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+BM25 latency benchmark against catalog size.
+Compares rank_bm25.BM25Okapi.get_scores with the inverted BM25Index on a synthetic corpus.
+"""
+
+import sys
+import time
+import numpy as np
+from pathlib import Path
+from rank_bm25 import BM25Okapi
+
+sys.path.append(str(Path(__file__).parent.parent))
+from bm25_index import BM25Index
+
+CATALOG_SIZES = [1_000, 10_000, 50_000, 100_000]
+VOCAB_SIZE = 20_000
+DOC_LENGTH = 40
+QUERIES = 50
+
+
+def make_corpus(rng, num_docs):
+    """Zipf-distributed tokens, roughly like product titles and descriptions."""
+    ranks = rng.zipf(1.3, size=(num_docs, DOC_LENGTH)) % VOCAB_SIZE
+    return [[f"w{r}" for r in row] for row in ranks]
+
+
+def make_queries(rng):
+    return [[f"w{r}" for r in rng.integers(1, 2_000, size=rng.integers(1, 5))] for _ in range(QUERIES)]
+
+
+def main():
+    rng = np.random.default_rng(0)
+    queries = make_queries(rng)
+    print(f"{'docs':>8} {'BM25Okapi (ms)':>15} {'BM25Index (ms)':>15} {'top-20 (ms)':>12} {'speedup':>9}")
+    for num_docs in CATALOG_SIZES:
+        corpus = make_corpus(rng, num_docs)
+        okapi = BM25Okapi(corpus)
+        index = BM25Index.from_tokenized(corpus)
+
+        for q in queries[:5]:
+            assert np.array_equal(okapi.get_scores(q), index.get_scores(q))
+
+        start = time.perf_counter()
+        for q in queries:
+            okapi.get_scores(q)
+        okapi_t = (time.perf_counter() - start) / len(queries)
+
+        start = time.perf_counter()
+        for q in queries:
+            index.score_sparse(q)
+        index_t = (time.perf_counter() - start) / len(queries)
+
+        start = time.perf_counter()
+        for q in queries:
+            index.top_n(q, 20)
+        top_t = (time.perf_counter() - start) / len(queries)
+
+        print(f"{num_docs:>8} {okapi_t * 1000:>15.2f} {index_t * 1000:>15.3f} {top_t * 1000:>12.3f} "
+              f"{okapi_t / index_t:>8.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Catalog memory and result-materialization benchmark at 100k products.
+Compares the pandas DataFrame + per-row iloc path with ColumnarCatalog.gather.
+"""
+
+import gc
+import sys
+import time
+import tempfile
+import multiprocessing
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+from catalog import ColumnarCatalog
+
+NUM_PRODUCTS = 100_000
+K = 20
+QUERIES = 500
+
+COLORS = ['black', 'white', 'red', 'blue', 'green', 'beige', 'brown', 'pink', None]
+MATERIALS = ['leather', 'denim', 'cotton', 'silk', 'wool', 'linen', None]
+SIZES = ['XS, S, M, L, XL', 'One Size', 'S, M, L', '36, 37, 38, 39, 40']
+
+
+def make_catalog(rng) -> pd.DataFrame:
+    n = NUM_PRODUCTS
+    has_path = rng.random(n) < 0.6
+    return pd.DataFrame({
+        'product_id': [f"prod_{i:06d}" for i in range(n)],
+        'title': [f"{COLORS[i % 8] or 'Mixed'} item {i}".title() for i in range(n)],
+        'description': [f"Beautiful piece number {i} perfect for any occasion." for i in range(n)],
+        'tags': ['casual, vintage'] * n,
+        'color': rng.choice(np.array(COLORS, dtype=object), n),
+        'material': rng.choice(np.array(MATERIALS, dtype=object), n),
+        'sizes': rng.choice(np.array(SIZES, dtype=object), n),
+        'price': rng.integers(20, 400, n),
+        'image_path': [f"/Products/{i}.png" if p else None for i, p in enumerate(has_path)],
+        'image_paths': [None if p else f"/data/img/{i}_0.png|/data/img/{i}_1.png" for i, p in enumerate(has_path)],
+    })
+
+
+def legacy_materialize(df: pd.DataFrame, indices, query: str):
+    """Per-row iloc materialization as previously done in SemanticSearchEngine.search."""
+    out = []
+    for idx in indices:
+        row = df.iloc[idx]
+        query_lower = query.lower()
+        chips = [w for w in query_lower.split() if w in str(row['title']).lower()]
+        chips += [w for w in query_lower.split() if w in str(row['color']).lower()]
+        chips += [w for w in query_lower.split() if w in str(row['material']).lower()]
+        image_path = ''
+        if pd.notna(row['image_path']) and str(row['image_path']).strip():
+            image_path = str(row['image_path']).strip()
+        elif pd.notna(row.get('image_paths', '')) and str(row.get('image_paths', '')).strip():
+            image_path = str(row.get('image_paths', '')).strip().split('|')[0].strip()
+        out.append({
+            'product_id': str(row['product_id']),
+            'title': str(row['title']),
+            'price': int(row['price']) if pd.notna(row['price']) else 0,
+            'color': str(row['color']) if pd.notna(row['color']) else 'mixed',
+            'material': str(row['material']) if pd.notna(row['material']) else 'mixed',
+            'sizes': str(row['sizes']) if pd.notna(row['sizes']) else 'One Size',
+            'image_path': image_path,
+            'why_chips': chips
+        })
+    return out
+
+
+def columnar_materialize(catalog: ColumnarCatalog, indices, query: str):
+    rows = catalog.gather(indices)
+    query_words = query.lower().split()
+    out = []
+    for i in range(len(indices)):
+        title_lower = rows['title'][i].lower()
+        chips = [w for w in query_words if w in title_lower]
+        chips += [w for w in query_words if w in rows['color_match'][i]]
+        chips += [w for w in query_words if w in rows['material_match'][i]]
+        out.append({
+            'product_id': rows['product_id'][i],
+            'title': rows['title'][i],
+            'price': rows['price'][i],
+            'color': rows['color'][i],
+            'material': rows['material'][i],
+            'sizes': rows['sizes'][i],
+            'image_path': rows['image_path'][i],
+            'why_chips': chips
+        })
+    return out
+
+
+def rss_mb() -> float:
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return float('nan')
+
+
+def load(path, columnar):
+    return ColumnarCatalog.from_parquet(path) if columnar else pd.read_parquet(path)
+
+
+def measure_rss(path, warmup_path, columnar, result):
+    """Runs in a fresh process so each representation is measured from the same baseline."""
+    # Loading a tiny file first keeps one-time library initialization out of the measurement
+    load(warmup_path, columnar)
+    gc.collect()
+    before = rss_mb()
+    catalog = load(path, columnar)
+    gc.collect()
+    result.put(rss_mb() - before)
+    del catalog
+
+
+def rss_delta(path, warmup_path, columnar) -> float:
+    ctx = multiprocessing.get_context('spawn')
+    result = ctx.Queue()
+    proc = ctx.Process(target=measure_rss, args=(path, warmup_path, columnar, result))
+    proc.start()
+    delta = result.get()
+    proc.join()
+    return delta
+
+
+def main():
+    rng = np.random.default_rng(0)
+    df = make_catalog(rng)
+    catalog = ColumnarCatalog.from_dataframe(df)
+    queries = [(rng.integers(0, NUM_PRODUCTS, K), "black leather dress") for _ in range(QUERIES)]
+
+    for indices, query in queries[:20]:
+        assert legacy_materialize(df, indices, query) == columnar_materialize(catalog, indices, query)
+
+    start = time.perf_counter()
+    for indices, query in queries:
+        legacy_materialize(df, indices, query)
+    legacy_t = (time.perf_counter() - start) / QUERIES
+
+    start = time.perf_counter()
+    for indices, query in queries:
+        columnar_materialize(catalog, indices, query)
+    columnar_t = (time.perf_counter() - start) / QUERIES
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "catalog.parquet"
+        warmup_path = Path(tmp) / "warmup.parquet"
+        df.to_parquet(path, index=False)
+        df.head(100).to_parquet(warmup_path, index=False)
+        df_rss = rss_delta(path, warmup_path, columnar=False)
+        col_rss = rss_delta(path, warmup_path, columnar=True)
+
+    print(f"products: {NUM_PRODUCTS}, k={K}")
+    print(f"{'':>12} {'RSS (MB)':>10} {'data (MB)':>10} {'materialize (ms)':>17}")
+    print(f"{'DataFrame':>12} {df_rss:>10.1f} {df.memory_usage(deep=True).sum() / 2**20:>10.1f} "
+          f"{legacy_t * 1000:>17.3f}")
+    print(f"{'Columnar':>12} {col_rss:>10.1f} {catalog.nbytes() / 2**20:>10.1f} {columnar_t * 1000:>17.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Memory and recall of the embedding storage modes: float32 or float16 E_*.npy, each with a flat
+(float32) or SQ8 FAISS index. Recall@k is against exact float32 search; memory is the size of
+the embedding matrices plus the serialized indices, for the text (384) and image (512) sides.
+Uses clustered synthetic embeddings; pass --artifacts DIR to use E_text.npy/E_img.npy from a build.
+"""
+
+import sys
+import time
+import argparse
+import faiss
+import numpy as np
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+from ann import build_ann_index, search
+from bench_ann import recall, synthetic_embeddings
+
+NUM_DOCS = 100_000
+DIMS = {'text': 384, 'image': 512}
+NUM_QUERIES = 500
+K = 20
+MODES = [('float32', 'flat'), ('float16', 'flat'), ('float32', 'sq8'), ('float16', 'sq8')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--artifacts", help="Directory with E_text.npy and E_img.npy")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    sides = {}
+    for name, dim in DIMS.items():
+        if args.artifacts:
+            file = "E_text.npy" if name == 'text' else "E_img.npy"
+            embeddings = np.load(Path(args.artifacts) / file).astype('float32')
+        else:
+            embeddings = synthetic_embeddings(rng, NUM_DOCS, dim)
+        queries = embeddings[rng.choice(len(embeddings), NUM_QUERIES, replace=False)]
+        queries = queries + 0.05 * rng.standard_normal(queries.shape).astype('float32')
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+        exact, _ = build_ann_index(embeddings, 'flat')
+        sides[name] = (embeddings, queries, search(exact, queries, K)[1])
+
+    print(f"{len(embeddings)} docs, recall@{K} against float32 flat search")
+    print(f"{'embeddings':>10} {'index':>6} {'emb MB':>8} {'index MB':>9} {'total MB':>9} "
+          f"{'recall text':>12} {'recall img':>11} {'ms/query':>9}")
+    for dtype, index_type in MODES:
+        emb_mb = index_mb = latency = 0.0
+        recalls = []
+        for name, (embeddings, queries, truth) in sides.items():
+            # As build_index.py does: the index is built from the stored values
+            stored = embeddings.astype(dtype)
+            index, _ = build_ann_index(stored, index_type)
+            start = time.perf_counter()
+            found = np.vstack([search(index, q[None, :], K)[1] for q in queries])
+            latency += (time.perf_counter() - start) / len(queries) * 1000
+            recalls.append(recall(found, truth))
+            emb_mb += stored.nbytes / 2**20
+            index_mb += faiss.serialize_index(index).nbytes / 2**20
+        print(f"{dtype:>10} {index_type:>6} {emb_mb:>8.1f} {index_mb:>9.1f} {emb_mb + index_mb:>9.1f} "
+              f"{recalls[0]:>12.4f} {recalls[1]:>11.4f} {latency:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for hybrid score fusion.
+Times the serving path (candidate_rows, exact embedding scores, gather_sparse and combine_scores,
+as SemanticSearchEngine._fuse runs them) against a per-candidate Python loop over the same
+candidates, on synthetic hits, embeddings and sparse BM25 scores.
+"""
+
+import sys
+import time
+import numpy as np
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+from fusion import candidate_rows, combine_scores, gather_sparse, top_order
+
+NUM_DOCS = 100_000
+DIM = 384
+K_VALUES = [20, 50, 100, 200, 500, 1000]
+REPEATS = 50
+
+
+def loop_fusion(text_embeddings, img_embeddings, q_text, q_img, text_indices, img_indices,
+                kw_ids, kw_scores, k, w_text=0.5, w_img=0.3, w_kw=0.2):
+    """The original per-candidate loop, scoring every candidate exactly in both modalities."""
+    kw = dict(zip(kw_ids.tolist(), kw_scores.tolist()))
+    kw_top = set(kw_ids[top_order(kw_scores, k)].tolist())
+    results = []
+    for idx in set(text_indices.tolist()) | set(img_indices.tolist()) | kw_top:
+        text_score = float(text_embeddings[idx] @ q_text)
+        img_score = float(img_embeddings[idx] @ q_img)
+        kw_score = kw.get(idx, 0.0)
+        results.append({
+            'idx': idx,
+            'score': w_text * text_score + w_img * img_score + w_kw * kw_score,
+            'text_score': text_score,
+            'img_score': img_score,
+            'kw_score': kw_score
+        })
+    results.sort(key=lambda x: x['score'], reverse=True)
+    return results[:k]
+
+
+def array_fusion(text_embeddings, img_embeddings, q_text, q_img, text_indices, img_indices,
+                 kw_ids, kw_scores, k, mode='weighted'):
+    """SemanticSearchEngine._fuse on plain embedding matrices."""
+    candidates = candidate_rows(NUM_DOCS, text_indices, img_indices, kw_ids[top_order(kw_scores, k)])
+    text_scores = text_embeddings[candidates] @ q_text
+    img_scores = img_embeddings[candidates] @ q_img
+    kw = gather_sparse(candidates, kw_ids, kw_scores)
+    return combine_scores(candidates, text_scores, img_scores, kw, k, mode=mode)
+
+
+def unit_rows(rng, n, dim):
+    rows = rng.standard_normal((n, dim)).astype('float32')
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+def make_hits(rng, k):
+    """Random FAISS-style hits, half shared between modalities, and sparse BM25 scores."""
+    text_indices = rng.choice(NUM_DOCS, k, replace=False)
+    img_indices = np.concatenate([text_indices[:k // 2], rng.choice(NUM_DOCS, k - k // 2, replace=False)])
+    kw_ids = np.sort(rng.choice(NUM_DOCS, 20 * k, replace=False))
+    kw_scores = rng.random(len(kw_ids)) * 10
+    return text_indices, img_indices, kw_ids, kw_scores
+
+
+def time_call(fn, args, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn(*args)
+    return (time.perf_counter() - start) / repeats
+
+
+def main():
+    rng = np.random.default_rng(0)
+    text_embeddings = unit_rows(rng, NUM_DOCS, DIM)
+    img_embeddings = unit_rows(rng, NUM_DOCS, DIM)
+    q_text, q_img = unit_rows(rng, 2, DIM)
+    print(f"{'k':>6} {'loop (ms)':>12} {'vectorized (ms)':>16} {'rrf (ms)':>9} {'speedup':>9}")
+    for k in K_VALUES:
+        args = (text_embeddings, img_embeddings, q_text, q_img) + make_hits(rng, k) + (k,)
+        loop = loop_fusion(*args)
+        fused = array_fusion(*args)
+        assert np.allclose([r['score'] for r in loop], fused.scores, atol=1e-5)
+        assert np.allclose([r['text_score'] for r in loop], fused.text_scores, atol=1e-5)
+        assert np.allclose([r['kw_score'] for r in loop], fused.kw_scores)
+
+        loop_t = time_call(loop_fusion, args, max(3, REPEATS // 10))
+        vec_t = time_call(array_fusion, args, REPEATS)
+        rrf_t = time_call(lambda *a: array_fusion(*a, mode='rrf'), args, REPEATS)
+        print(f"{k:>6} {loop_t * 1000:>12.3f} {vec_t * 1000:>16.3f} {rrf_t * 1000:>9.3f} {loop_t / vec_t:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
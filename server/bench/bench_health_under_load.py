@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Health-check responsiveness under concurrent search load.
+Fires slow concurrent searches at the app in-process and measures /health latency meanwhile.
+"""
+
+import sys
+import time
+import asyncio
+import numpy as np
+from pathlib import Path
+import httpx
+
+sys.path.append(str(Path(__file__).parent.parent))
+import serve
+
+CONCURRENT_SEARCHES = 64
+SEARCH_SECONDS = 0.5
+HEALTH_PROBES = 50
+
+
+def slow_search(*args, **kwargs):
+    """Stand-in for a slow rerank: blocks its worker thread like the real search does."""
+    time.sleep(SEARCH_SECONDS)
+    return serve.SearchResponse(results=[], total_time=SEARCH_SECONDS, num_results=0)
+
+
+async def main():
+    serve.search_engine.search = slow_search
+    transport = httpx.ASGITransport(app=serve.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        searches = [asyncio.create_task(client.get("/search", params={"q": f"dress {i}"}))
+                    for i in range(CONCURRENT_SEARCHES)]
+        await asyncio.sleep(0.05)
+
+        latencies = []
+        for _ in range(HEALTH_PROBES):
+            start = time.perf_counter()
+            response = await client.get("/health")
+            assert response.status_code == 200
+            latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(0.01)
+
+        statuses = [r.status_code for r in await asyncio.gather(*searches)]
+
+    rejected = [s for s in statuses if s == 503]
+    print(f"searches: {CONCURRENT_SEARCHES} x {SEARCH_SECONDS}s, "
+          f"workers={serve.SEARCH_WORKERS}, queue={serve.SEARCH_QUEUE_DEPTH}")
+    print(f"  completed: {statuses.count(200)}  rejected with 503: {len(rejected)}")
+    print(f"  /health p50: {np.percentile(latencies, 50) * 1000:.2f} ms  "
+          f"max: {max(latencies) * 1000:.2f} ms")
+    assert max(latencies) < SEARCH_SECONDS, "health check waited behind a search"
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
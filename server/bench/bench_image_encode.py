@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Image encoding throughput: the old one-image-at-a-time loop against the decode/encode pipeline.
+Decodes synthetic product photos written to a temporary directory. The encoder is synthetic (a
+fixed per-call overhead plus a per-image cost); pass --real to encode with clip-ViT-B-32 instead.
+"""
+
+import sys
+import time
+import tempfile
+import numpy as np
+from pathlib import Path
+from PIL import Image
+
+sys.path.append(str(Path(__file__).parent.parent))
+from image_pipeline import ImageManifest, encode_images
+
+NUM_IMAGES = 256
+PHOTO_SIZE = (900, 1200)
+CONFIGS = [(1, 1), (8, 4), (32, 4), (32, 8)]  # (batch size, decode workers)
+
+# Synthetic forward pass: a batch of n costs CALL_COST + n * ITEM_COST seconds
+CALL_COST = 0.015
+ITEM_COST = 0.004
+
+
+def synthetic_encode(images):
+    time.sleep(CALL_COST + ITEM_COST * len(images))
+    return np.ones((len(images), 512), dtype='float32')
+
+
+def load_encoder():
+    if "--real" not in sys.argv:
+        return synthetic_encode
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer('clip-ViT-B-32')
+    return lambda images: model.encode(images)
+
+
+def write_images(directory: Path):
+    """JPEG photos plus one missing and one corrupt file, like a real catalog."""
+    rng = np.random.default_rng(0)
+    base = rng.integers(0, 256, size=(PHOTO_SIZE[1] // 8, PHOTO_SIZE[0] // 8, 3), dtype=np.uint8)
+    paths = []
+    for i in range(NUM_IMAGES):
+        path = directory / f"product_{i:04d}.jpg"
+        tile = np.roll(base, i, axis=0)
+        Image.fromarray(tile).resize(PHOTO_SIZE).save(path, quality=90)
+        paths.append(path)
+    (directory / "corrupt.jpg").write_bytes(b"not a jpeg")
+    return paths + [directory / "missing.jpg", directory / "corrupt.jpg"]
+
+
+def serial_loop(paths, encode):
+    """The previous load_and_encode_images loop."""
+    embeddings = []
+    for path in paths:
+        try:
+            if path.exists():
+                image = Image.open(path).convert('RGB').resize((224, 224))
+                embeddings.append(encode([image])[0])
+            else:
+                embeddings.append(np.zeros(512))
+        except Exception:
+            embeddings.append(np.zeros(512))
+    return np.array(embeddings)
+
+
+def main():
+    encode = load_encoder()
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = write_images(Path(tmp))
+        images = NUM_IMAGES
+
+        start = time.perf_counter()
+        serial_loop(paths, encode)
+        serial_t = time.perf_counter() - start
+        print(f"{'mode':>22} {'images/sec':>11} {'speedup':>8}")
+        print(f"{'serial loop':>22} {images / serial_t:>11.1f} {1.0:>7.1f}x")
+
+        for batch_size, workers in CONFIGS:
+            manifest = ImageManifest()
+            start = time.perf_counter()
+            encode_images(paths, encode, 512, batch_size=batch_size, workers=workers, manifest=manifest)
+            t = time.perf_counter() - start
+            assert manifest.summary() == {'encoded': images, 'missing': 1, 'failed': 1}
+            label = f"batch {batch_size}, {workers} workers"
+            print(f"{label:>22} {images / t:>11.1f} {serial_t / t:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
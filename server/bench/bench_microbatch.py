@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Query-encoding throughput with and without micro-batching.
+Measures QPS at 1, 8 and 32 concurrent clients. Uses a synthetic encoder whose cost is a fixed
+per-call overhead plus a small per-item cost; pass --real to encode with all-MiniLM-L6-v2 instead.
+"""
+
+import sys
+import time
+import threading
+import numpy as np
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+from concurrency import MicroBatcher
+
+CLIENTS = [1, 8, 32]
+DURATION = 3.0
+MAX_WAIT = 0.002
+
+# Synthetic forward pass: a batch of n costs CALL_COST + n * ITEM_COST seconds
+CALL_COST = 0.008
+ITEM_COST = 0.0004
+
+
+def synthetic_encode(texts):
+    time.sleep(CALL_COST + ITEM_COST * len(texts))
+    return np.ones((len(texts), 384), dtype='float32')
+
+
+def load_encoder():
+    if "--real" not in sys.argv:
+        return synthetic_encode
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer('all-MiniLM-L6-v2')
+    return lambda texts: model.encode(texts)
+
+
+def run_clients(batcher, num_clients):
+    """Each client encodes distinct queries back to back; returns (QPS, p50 latency)."""
+    stop = time.monotonic() + DURATION
+    latencies = [[] for _ in range(num_clients)]
+
+    def client(i):
+        n = 0
+        while time.monotonic() < stop:
+            start = time.perf_counter()
+            batcher.submit([f"client {i} query {n}"])
+            latencies[i].append(time.perf_counter() - start)
+            n += 1
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(num_clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    flat = [x for per_client in latencies for x in per_client]
+    return len(flat) / DURATION, np.percentile(flat, 50)
+
+
+def main():
+    encode = load_encoder()
+    print(f"{'clients':>8} {'mode':>10} {'QPS':>9} {'p50 (ms)':>10} {'mean batch':>11}")
+    for num_clients in CLIENTS:
+        for mode, max_wait in (("unbatched", 0.0), ("batched", MAX_WAIT)):
+            # Unbatched clients share one model, so serialize them like a single torch instance would
+            lock = threading.Lock()
+
+            def locked_encode(texts):
+                with lock:
+                    return encode(texts)
+
+            batcher = MicroBatcher(locked_encode, max_batch_size=64, max_wait=max_wait)
+            qps, p50 = run_clients(batcher, num_clients)
+            mean_batch = batcher.stats()['mean_batch_size'] if max_wait > 0 else 1.0
+            print(f"{num_clients:>8} {mode:>10} {qps:>9.1f} {p50 * 1000:>10.2f} {mean_batch:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
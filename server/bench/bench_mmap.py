@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Memory of N search workers with heap-loaded vs memory-mapped artifacts.
+Each worker process loads both embedding matrices and FAISS indices the way serve.py does and
+runs searches over them, then the parent reads its RSS, PSS (shared pages split between the
+processes mapping them) and private memory from /proc/<pid>/smaps_rollup.
+Pass --artifacts DIR to use a real build instead of synthetic flat indices.
+"""
+
+import sys
+import argparse
+import tempfile
+import multiprocessing
+import numpy as np
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+from ann import build_ann_index, load_embeddings, read_index, save_embeddings, write_index
+
+NUM_DOCS = 100_000
+TEXT_DIM = 384
+IMG_DIM = 512
+WORKERS = [1, 2, 4]
+SEARCHES = 20
+
+
+def make_artifacts(path: Path):
+    rng = np.random.default_rng(0)
+    for name, dim in (("text", TEXT_DIM), ("img", IMG_DIM)):
+        embeddings = rng.standard_normal((NUM_DOCS, dim)).astype('float32')
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        index, _ = build_ann_index(embeddings, 'flat')
+        write_index(index, path / f"{name}.index")
+        save_embeddings(path / f"E_{name}.npy", embeddings)
+
+
+def worker(path, mmap, ready, done):
+    path = Path(path)
+    indices = [read_index(path / f"{name}.index", mmap=mmap) for name in ("text", "img")]
+    embeddings = [load_embeddings(path / f"E_{name}.npy", mmap=mmap) for name in ("text", "img")]
+    # Searching a flat index touches every vector, so all mapped pages become resident
+    for index, matrix in zip(indices, embeddings):
+        for _ in range(SEARCHES):
+            index.search(np.asarray(matrix[:1], dtype='float32'), 20)
+    ready.set()
+    done.wait()
+
+
+def smaps_mb(pid: int) -> dict:
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    return {
+        'rss': fields['Rss'],
+        'pss': fields['Pss'],
+        'private': fields['Private_Clean'] + fields['Private_Dirty']
+    }
+
+
+def measure(path, mmap, num_workers) -> dict:
+    ctx = multiprocessing.get_context('spawn')
+    done = ctx.Event()
+    procs, readies = [], []
+    for _ in range(num_workers):
+        ready = ctx.Event()
+        proc = ctx.Process(target=worker, args=(str(path), mmap, ready, done))
+        proc.start()
+        procs.append(proc)
+        readies.append(ready)
+    for ready in readies:
+        ready.wait()
+    usage = [smaps_mb(proc.pid) for proc in procs]
+    done.set()
+    for proc in procs:
+        proc.join()
+    return {key: sum(u[key] for u in usage) for key in usage[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--artifacts", help="Artifacts directory from build_index.py")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(args.artifacts) if args.artifacts else Path(tmp)
+        if not args.artifacts:
+            make_artifacts(path)
+        artifact_mb = sum((path / name).stat().st_size
+                          for name in ("text.index", "img.index", "E_text.npy", "E_img.npy")) / 2**20
+
+        print(f"artifacts on disk: {artifact_mb:.1f} MB (totals over all workers, MB)")
+        print(f"{'workers':>8} {'mode':>6} {'RSS':>9} {'PSS':>9} {'private':>9}")
+        for num_workers in WORKERS:
+            for mode, mmap in (("heap", False), ("mmap", True)):
+                usage = measure(path, mmap, num_workers)
+                print(f"{num_workers:>8} {mode:>6} {usage['rss']:>9.1f} {usage['pss']:>9.1f} "
+                      f"{usage['private']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+fp32 against int8 dynamically quantized models (QUANTIZE_MODELS=1) on the /evaluate queries.
+Each mode runs in a fresh process that loads the engine, warms it up and evaluates
+eval/queries.txt REPEATS times; the report has hit@1, ndcg@10, p50/p99 search latency, resident
+memory and how close the int8 query embeddings stay to the fp32 ones.
+Needs a built artifacts directory and the models (downloaded on first use).
+"""
+
+import sys
+import json
+import argparse
+import subprocess
+import tempfile
+import numpy as np
+from pathlib import Path
+
+SERVER_DIR = Path(__file__).parent.parent
+sys.path.append(str(SERVER_DIR))
+
+QUERIES_FILE = SERVER_DIR / "eval" / "queries.txt"
+REPEATS = 5
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def run_mode(args):
+    """Child process: one engine in one mode; prints its report as JSON."""
+    from serve import SemanticSearchEngine
+    queries = [line.strip() for line in open(QUERIES_FILE) if line.strip()]
+    labels = json.load(open(args.labels)) if args.labels else None
+    engine = SemanticSearchEngine(args.artifacts, quantize=args.quantize)
+    engine.load_models()
+    engine.warm_up()
+    report = engine.evaluate(queries * REPEATS, labels).model_dump()
+    text, img = engine._encode_queries(queries)
+    np.savez(args.embeddings_out, text=text, img=img)
+    report['rss_mb'] = rss_mb()
+    report['load_seconds'] = engine.load_times
+    print(json.dumps(report))
+
+
+def measure(args, quantize: bool, embeddings_out: str) -> dict:
+    cmd = [sys.executable, __file__, "--child", "--artifacts", args.artifacts, "--embeddings-out", embeddings_out]
+    if quantize:
+        cmd.append("--quantize")
+    if args.labels:
+        cmd += ["--labels", args.labels]
+    out = subprocess.run(cmd, check=True, capture_output=True, text=True, cwd=SERVER_DIR).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--artifacts", default=str(SERVER_DIR / "artifacts"), help="Artifact root from build_index.py")
+    parser.add_argument("--labels", help="JSON {query: [relevant product ids]}; heuristic scores without it")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--quantize", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--embeddings-out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return run_mode(args)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        reports = {mode: measure(args, mode == 'int8', f"{tmp}/{mode}.npz") for mode in ('fp32', 'int8')}
+        fp32, int8 = np.load(f"{tmp}/fp32.npz"), np.load(f"{tmp}/int8.npz")
+        # Rows are normalized, so row-wise dot products are cosines
+        cosines = {name: (fp32[name] * int8[name]).sum(axis=1) for name in ('text', 'img')}
+
+    print(f"{'mode':>6} {'hit@1':>7} {'ndcg@10':>8} {'p50 ms':>8} {'p99 ms':>8} {'RSS MB':>8}")
+    for mode, r in reports.items():
+        print(f"{mode:>6} {r['hit_at_1']:>7.3f} {r['ndcg_at_10']:>8.3f} {r['latency_p50_ms']:>8.1f} "
+              f"{r['latency_p99_ms']:>8.1f} {r['rss_mb']:>8.0f}")
+    for name, label in (('text', 'MiniLM'), ('img', 'CLIP text')):
+        print(f"{label} query embeddings int8 vs fp32: mean cosine {cosines[name].mean():.4f}, "
+              f"min {cosines[name].min():.4f}")
+
+
+if __name__ == "__main__":
+    main()
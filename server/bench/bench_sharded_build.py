@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Text encoding throughput of the sharded build encoder with 1, 2, 4 and 8 worker processes.
+Each worker gets cores / workers torch threads. The model has the all-MiniLM-L6-v2 architecture
+with random weights, built locally so no download is needed; pass --real to use the real model
+(throughput only depends on the architecture).
+"""
+
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+from encoder_pool import EncoderPool
+
+NUM_TEXTS = 4096
+WORKERS = [1, 2, 4, 8]
+WORDS = ("black linen midi dress with square neckline vintage wool coat relaxed fit cotton shirt "
+         "silk slip skirt leather ankle boots cropped denim jacket ribbed knit cardigan").split()
+
+
+def make_model(path: Path) -> str:
+    """all-MiniLM-L6-v2 shaped sentence-transformers model with random weights."""
+    from transformers import BertConfig, BertModel, BertTokenizerFast
+    from sentence_transformers import SentenceTransformer, models
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + sorted(set(WORDS))
+    (path / "vocab.txt").write_text("\n".join(vocab))
+    BertTokenizerFast(str(path / "vocab.txt")).save_pretrained(path / "bert")
+    config = BertConfig(vocab_size=len(vocab), hidden_size=384, num_hidden_layers=6, num_attention_heads=12,
+                        intermediate_size=1536)
+    BertModel(config).save_pretrained(path / "bert")
+    transformer = models.Transformer(str(path / "bert"), max_seq_length=256)
+    pooling = models.Pooling(transformer.get_word_embedding_dimension(), pooling_mode="mean")
+    SentenceTransformer(modules=[transformer, pooling]).save(str(path / "model"))
+    return str(path / "model")
+
+
+def make_texts():
+    rng = np.random.default_rng(0)
+    return [" ".join(rng.choice(WORDS, size=rng.integers(8, 40))) for _ in range(NUM_TEXTS)]
+
+
+def main():
+    texts = make_texts()
+    cores = os.cpu_count() or 1
+    print(f"{NUM_TEXTS} texts, {cores} cores")
+    print(f"{'workers':>8} {'threads':>8} {'texts/sec':>10} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        model = 'all-MiniLM-L6-v2' if "--real" in sys.argv else make_model(Path(tmp))
+        base = None
+        for workers in WORKERS:
+            pool = EncoderPool(workers)
+            try:
+                # Loads the model in every worker
+                pool.encode_texts(model, texts[:64 * workers])
+                start = time.perf_counter()
+                embeddings = pool.encode_texts(model, texts)
+                t = time.perf_counter() - start
+            finally:
+                pool.close()
+            assert embeddings.shape == (NUM_TEXTS, 384)
+            base = base or t
+            print(f"{workers:>8} {pool.threads_per_worker:>8} {NUM_TEXTS / t:>10.1f} {base / t:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Parity of the ONNX query encoders in an artifact set with the sentence-transformers models.
+Encodes eval/queries.txt with both backends and exits non-zero if any query's cosine is below
+onnx_encoder.MIN_PARITY_COSINE (build_index.py --export-onnx runs the same check on catalog texts).
+"""
+
+import sys
+import argparse
+from pathlib import Path
+
+SERVER_DIR = Path(__file__).parent.parent
+sys.path.append(str(SERVER_DIR))
+from sentence_transformers import SentenceTransformer
+from artifacts import ONNX_DIR, ArtifactStore
+from onnx_encoder import MIN_PARITY_COSINE, OnnxTextEncoder, parity_cosine
+from serve import CLIP_MODEL_NAME, TEXT_MODEL_NAME
+
+QUERIES_FILE = SERVER_DIR / "eval" / "queries.txt"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--artifacts", default=str(SERVER_DIR / "artifacts"), help="Artifact root from build_index.py")
+    args = parser.parse_args()
+
+    onnx_dir = ArtifactStore(args.artifacts).current_path() / ONNX_DIR
+    queries = [line.strip() for line in open(QUERIES_FILE) if line.strip()]
+    failed = False
+    for name, model_name in (('text', TEXT_MODEL_NAME), ('clip_text', CLIP_MODEL_NAME)):
+        cosine = parity_cosine(SentenceTransformer(model_name), OnnxTextEncoder(onnx_dir / name), queries)
+        ok = cosine >= MIN_PARITY_COSINE
+        failed |= not ok
+        print(f"{name:>10}: min cosine {cosine:.6f} over {len(queries)} queries {'ok' if ok else 'FAILED'}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Inverted-index BM25.
+Scores match rank_bm25.BM25Okapi, but only the postings of the query terms are touched.
+"""
+
+import math
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+# Catalog fields indexed for keyword search
+BM25_FIELDS = ('title', 'description', 'tags', 'color', 'material')
+
+
+def tokenize_product(product: Dict[str, Any]) -> List[str]:
+    """BM25 tokens of a catalog row (dict or DataFrame row)."""
+    text_parts = [str(product[field]) for field in BM25_FIELDS
+                  if field in product and pd.notna(product[field])]
+    combined_text = ' '.join(text_parts).lower()
+    # Simple tokenization (split on whitespace and common punctuation)
+    return combined_text.replace(',', ' ').replace('.', ' ').split()
+
+
+class BM25Builder:
+    """
+    Accumulates BM25 statistics batch by batch, keeping postings as compact
+    arrays instead of the tokenized documents. The result equals
+    BM25Index.from_tokenized over all batches in order.
+    """
+
+    def __init__(self):
+        self.vocab: Dict[str, int] = {}
+        self._term_ids: List[np.ndarray] = []
+        self._doc_ids: List[np.ndarray] = []
+        self._tfs: List[np.ndarray] = []
+        self._doc_len: List[np.ndarray] = []
+        self.num_docs = 0
+
+    def add(self, tokenized_docs: List[List[str]]):
+        term_ids, doc_ids, tfs = [], [], []
+        doc_len = np.zeros(len(tokenized_docs), dtype=np.int64)
+        for i, tokens in enumerate(tokenized_docs):
+            doc_len[i] = len(tokens)
+            frequencies: Dict[str, int] = {}
+            for token in tokens:
+                frequencies[token] = frequencies.get(token, 0) + 1
+            for token, tf in frequencies.items():
+                term_ids.append(self.vocab.setdefault(token, len(self.vocab)))
+                doc_ids.append(self.num_docs + i)
+                tfs.append(tf)
+        self._term_ids.append(np.array(term_ids, dtype=np.int64))
+        self._doc_ids.append(np.array(doc_ids, dtype=np.int32))
+        self._tfs.append(np.array(tfs, dtype=np.int32))
+        self._doc_len.append(doc_len)
+        self.num_docs += len(tokenized_docs)
+
+    def build(self, **params) -> "BM25Index":
+        term_ids = np.concatenate(self._term_ids) if self._term_ids else np.empty(0, dtype=np.int64)
+        # Stable sort by term keeps each posting list in document order
+        order = np.argsort(term_ids, kind='stable')
+        offsets = np.zeros(len(self.vocab) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(term_ids, minlength=len(self.vocab)))
+        return BM25Index(
+            list(self.vocab), offsets,
+            np.concatenate(self._doc_ids)[order] if self._doc_ids else np.empty(0, dtype=np.int32),
+            np.concatenate(self._tfs)[order] if self._tfs else np.empty(0, dtype=np.int32),
+            np.concatenate(self._doc_len) if self._doc_len else np.empty(0, dtype=np.int64),
+            **params
+        )
+
+
+class BM25Index:
+    """
+    BM25Okapi over CSR posting lists.
+
+    Postings of term t are doc_ids[offsets[t]:offsets[t + 1]] (ascending)
+    with term frequencies tfs at the same positions. Per-posting impact
+    scores (idf * saturated tf) are precomputed, so a query is a gather
+    and a bincount over its terms' postings.
+
+    Deleted documents keep their ids but lose their postings and no longer
+    count towards the corpus statistics, so scores equal those of an index
+    built from the remaining documents only.
+    """
+
+    def __init__(self, terms: List[str], offsets: np.ndarray, doc_ids: np.ndarray,
+                 tfs: np.ndarray, doc_len: np.ndarray,
+                 k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25,
+                 deleted: Optional[np.ndarray] = None):
+        self.terms = list(terms)
+        self.vocab = {term: i for i, term in enumerate(self.terms)}
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.doc_ids = np.asarray(doc_ids, dtype=np.int32)
+        self.tfs = np.asarray(tfs, dtype=np.int32)
+        self.doc_len = np.asarray(doc_len, dtype=np.int64)
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self.deleted = None if deleted is None else np.asarray(deleted, dtype=bool)
+        self._compute_impacts()
+
+    @property
+    def corpus_size(self) -> int:
+        """Number of document ids, deleted ones included."""
+        return len(self.doc_len)
+
+    @property
+    def num_live(self) -> int:
+        return self.corpus_size - (int(self.deleted.sum()) if self.deleted is not None else 0)
+
+    def _compute_impacts(self):
+        """Recompute idf and per-posting impacts from the raw statistics."""
+        n = self.num_live
+        self.avgdl = int(self.doc_len.sum()) / n if n else 0.0
+        doc_freq = np.diff(self.offsets)
+
+        # Same arithmetic (and summation order) as BM25Okapi._calc_idf; terms left
+        # without documents by deletions are not part of the corpus vocabulary
+        idf = np.empty(len(self.terms))
+        idf_sum = 0
+        vocab_size = 0
+        for t, freq in enumerate(doc_freq.tolist()):
+            idf[t] = math.log(n - freq + 0.5) - math.log(freq + 0.5)
+            if freq:
+                idf_sum += idf[t]
+                vocab_size += 1
+        self.average_idf = idf_sum / vocab_size if vocab_size else 0.0
+        idf[idf < 0] = self.epsilon * self.average_idf
+        self.idf = idf
+
+        term_of_posting = np.repeat(np.arange(len(self.terms)), doc_freq)
+        tf = self.tfs
+        dl = self.doc_len[self.doc_ids]
+        self.impacts = idf[term_of_posting] * (
+            tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * dl / self.avgdl))
+        )
+
+    @classmethod
+    def from_tokenized(cls, tokenized_docs: List[List[str]], **params) -> "BM25Index":
+        """Build the index from tokenized documents (same input as BM25Okapi)."""
+        builder = BM25Builder()
+        builder.add(tokenized_docs)
+        return builder.build(**params)
+
+    @classmethod
+    def from_okapi(cls, bm25) -> "BM25Index":
+        """Convert a fitted rank_bm25.BM25Okapi (e.g. a legacy bm25.pkl)."""
+        vocab: Dict[str, int] = {}
+        postings: List[List[Tuple[int, int]]] = []
+        for doc_id, frequencies in enumerate(bm25.doc_freqs):
+            for token, tf in frequencies.items():
+                t = vocab.setdefault(token, len(vocab))
+                if t == len(postings):
+                    postings.append([])
+                postings[t].append((doc_id, tf))
+        return cls._from_postings(list(vocab), postings, np.array(bm25.doc_len, dtype=np.int64),
+                                  k1=bm25.k1, b=bm25.b, epsilon=bm25.epsilon)
+
+    @classmethod
+    def _from_postings(cls, terms: List[str], postings: List[List[Tuple[int, int]]],
+                       doc_len: np.ndarray, **params) -> "BM25Index":
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(p) for p in postings])
+        flat = [pair for plist in postings for pair in plist]
+        doc_ids = np.fromiter((d for d, _ in flat), dtype=np.int32, count=len(flat))
+        tfs = np.fromiter((tf for _, tf in flat), dtype=np.int32, count=len(flat))
+        return cls(terms, offsets, doc_ids, tfs, doc_len, **params)
+
+    def _term_of_posting(self) -> np.ndarray:
+        return np.repeat(np.arange(len(self.terms)), np.diff(self.offsets))
+
+    def add_documents(self, tokenized_docs: List[List[str]]) -> "BM25Index":
+        """
+        New index with the documents appended; their ids continue after the
+        existing ones. Only the new documents are tokenized and counted, the
+        existing postings are merged in as arrays.
+        """
+        added = BM25Index.from_tokenized(tokenized_docs)
+        vocab = dict(self.vocab)
+        for term in added.terms:
+            vocab.setdefault(term, len(vocab))
+        remap = np.array([vocab[term] for term in added.terms], dtype=np.int64)
+
+        # Stable sort by term keeps each list's existing postings first, so doc ids stay ascending
+        term_ids = np.concatenate([self._term_of_posting(), remap[added._term_of_posting()]])
+        order = np.argsort(term_ids, kind='stable')
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(term_ids, minlength=len(vocab)))
+        deleted = None
+        if self.deleted is not None:
+            deleted = np.concatenate([self.deleted, np.zeros(added.corpus_size, dtype=bool)])
+
+        return BM25Index(
+            list(vocab), offsets,
+            np.concatenate([self.doc_ids, added.doc_ids + self.corpus_size])[order],
+            np.concatenate([self.tfs, added.tfs])[order],
+            np.concatenate([self.doc_len, added.doc_len]),
+            k1=self.k1, b=self.b, epsilon=self.epsilon, deleted=deleted
+        )
+
+    def remove_documents(self, doc_ids: np.ndarray) -> "BM25Index":
+        """New index without the given documents' postings; other ids are unchanged."""
+        drop = np.zeros(self.corpus_size, dtype=bool)
+        drop[doc_ids] = True
+        keep = ~drop[self.doc_ids]
+        offsets = np.zeros(len(self.terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(self._term_of_posting()[keep], minlength=len(self.terms)))
+        doc_len = self.doc_len.copy()
+        doc_len[drop] = 0
+        return BM25Index(
+            self.terms, offsets, self.doc_ids[keep], self.tfs[keep], doc_len,
+            k1=self.k1, b=self.b, epsilon=self.epsilon,
+            deleted=drop if self.deleted is None else self.deleted | drop
+        )
+
+    def save(self, path: Path):
+        arrays = {}
+        if self.deleted is not None:
+            arrays['deleted'] = self.deleted
+        np.savez(
+            path,
+            terms=np.array(self.terms, dtype=str),
+            offsets=self.offsets,
+            doc_ids=self.doc_ids,
+            tfs=self.tfs,
+            doc_len=self.doc_len,
+            params=np.array([self.k1, self.b, self.epsilon]),
+            **arrays
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> "BM25Index":
+        with np.load(path, allow_pickle=False) as data:
+            k1, b, epsilon = data['params'].tolist()
+            return cls(data['terms'].tolist(), data['offsets'], data['doc_ids'], data['tfs'],
+                       data['doc_len'], k1=k1, b=b, epsilon=epsilon,
+                       deleted=data['deleted'] if 'deleted' in data.files else None)
+
+    def score_sparse(self, tokens: List[str], mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Scores of the documents containing at least one query token, as (sorted doc ids, scores).
+        With a mask, only documents set in it are scored.
+        """
+        spans = [(self.offsets[t], self.offsets[t + 1])
+                 for t in (self.vocab.get(token) for token in tokens) if t is not None]
+        if not spans:
+            return np.empty(0, dtype=np.int32), np.empty(0)
+        doc_ids = np.concatenate([self.doc_ids[s:e] for s, e in spans])
+        impacts = np.concatenate([self.impacts[s:e] for s, e in spans])
+        if mask is not None:
+            # Corpus statistics stay those of the whole index, so scores do not depend on the filter
+            keep = mask[doc_ids]
+            doc_ids, impacts = doc_ids[keep], impacts[keep]
+        # bincount accumulates in posting order, i.e. term by term like BM25Okapi
+        docs, inverse = np.unique(doc_ids, return_inverse=True)
+        return docs, np.bincount(inverse, weights=impacts, minlength=len(docs))
+
+    def get_scores(self, tokens: List[str]) -> np.ndarray:
+        """Dense scores for every document (drop-in for BM25Okapi.get_scores)."""
+        scores = np.zeros(self.corpus_size)
+        docs, values = self.score_sparse(tokens)
+        scores[docs] = values
+        return scores
+
+    def top_n(self, tokens: List[str], n: int) -> Tuple[np.ndarray, np.ndarray]:
+        """The n best-scoring documents containing a query token, best first."""
+        docs, values = self.score_sparse(tokens)
+        if n < len(docs):
+            part = np.argpartition(-values, n - 1)[:n]
+            docs, values = docs[part], values[part]
+        order = np.argsort(-values, kind='stable')
+        return docs[order], values[order]
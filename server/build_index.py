@@ -7,39 +7,91 @@ Creates text embeddings, image embeddings, and BM25 index.
 import os
 import sys
 import json
-import pickle
+import time
+import argparse
+import resource
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from pathlib import Path
-from typing import List, Dict, Any, Tuple
-import faiss
+from typing import List, Dict, Any, Optional, Tuple
 from sentence_transformers import SentenceTransformer
-from PIL import Image
 import torch
-from rank_bm25 import BM25Okapi
+from bm25_index import BM25Builder, BM25Index, tokenize_product
+from ann import (EMBEDDING_DTYPES, add_index_arguments, build_ann_index, create_ann_index, index_params_from_args,
+                 load_embeddings, write_index)
+from artifacts import ONNX_DIR, ArtifactStore, save_artifacts
+from delta import publish_build
+from attributes import AttributeIndex
+from catalog import product_text
+from embedding_cache import EmbeddingCache
+from encoder_pool import EncoderPool
+from image_pipeline import ImageManifest, encode_images
 from sklearn.preprocessing import normalize
 import warnings
 warnings.filterwarnings("ignore")
 
+TEXT_MODEL_NAME = 'all-MiniLM-L6-v2'
+CLIP_MODEL_NAME = 'clip-ViT-B-32'
+CLIP_DIM = 512  # CLIP ViT-B-32 embedding size
+
+# Shared by all builds, including /rebuild's, so unchanged products are never re-encoded
+DEFAULT_EMBEDDING_CACHE_DIR = Path(__file__).parent / "embedding_cache"
+
+# ONNX exports are compared with torch on this many catalog texts plus the eval queries
+ONNX_PARITY_SAMPLE = 256
+EVAL_QUERIES_FILE = Path(__file__).parent / "eval" / "queries.txt"
+
 class SearchIndexBuilder:
-    def __init__(self, data_dir: str = "data", artifacts_dir: str = "artifacts"):
+    def __init__(self, data_dir: str = "data", artifacts_dir: str = "artifacts",
+                 index_type: str = "flat", index_params: Dict[str, Any] = None,
+                 embedding_cache_dir: Optional[str] = None, prune_embedding_cache: bool = False,
+                 image_batch_size: int = 32, image_workers: int = 4,
+                 workers: int = 1, threads_per_worker: Optional[int] = None, export_onnx: bool = False,
+                 embedding_dtype: str = 'float32'):
         self.data_dir = Path(data_dir)
         self.artifacts_dir = Path(artifacts_dir)
+        # FAISS index type (flat, hnsw, ivf, ivfpq) and overrides for its parameters
+        self.index_type = index_type
+        self.index_params = index_params or {}
+        # dtype of the stored embeddings (float32 or float16)
+        self.embedding_dtype = np.dtype(embedding_dtype)
         self.artifacts_dir.mkdir(parents=True, exist_ok=True)
         
-        # Initialize models
-        print("Loading models...")
-        self.text_model = SentenceTransformer('all-MiniLM-L6-v2')
-        self.clip_model = SentenceTransformer('clip-ViT-B-32')
-        print("Models loaded successfully!")
+        # Initialize models; with several workers each worker process loads its own copy instead
+        if workers > 1:
+            self.encoder_pool = EncoderPool(workers, threads_per_worker)
+            self.text_model = self.clip_model = None
+            print(f"Encoding with {workers} worker processes, {self.encoder_pool.threads_per_worker} threads each")
+        else:
+            self.encoder_pool = None
+            print("Loading models...")
+            self.text_model = SentenceTransformer(TEXT_MODEL_NAME)
+            self.clip_model = SentenceTransformer(CLIP_MODEL_NAME)
+            print("Models loaded successfully!")
+        
+        # Content-hash embedding caches (None disables caching); pruning drops entries this build did not use
+        self.text_cache = EmbeddingCache(embedding_cache_dir, TEXT_MODEL_NAME) if embedding_cache_dir else None
+        self.clip_cache = EmbeddingCache(embedding_cache_dir, CLIP_MODEL_NAME) if embedding_cache_dir else None
+        self.prune_embedding_cache = prune_embedding_cache
+        
+        # Images per CLIP forward pass and threads decoding images ahead of it
+        self.image_batch_size = image_batch_size
+        self.image_workers = image_workers
+        self.image_manifest = ImageManifest()
+        self.image_seconds = 0.0
+        
+        # Also write the query encoders as ONNX graphs for serve.py's onnx backend
+        self.export_onnx = export_onnx
         
         # Default weights
         self.W_TEXT = 0.5
         self.W_IMG = 0.3
         self.W_KW = 0.2
         
-    def load_products(self) -> pd.DataFrame:
-        """Load products from CSV, create if missing."""
+    def ensure_products_csv(self) -> Path:
+        """Path of products.csv, running ingestion first if it is missing."""
         csv_path = self.data_dir / "products.csv"
         
         if not csv_path.exists():
@@ -55,7 +107,11 @@ class SearchIndexBuilder:
                 sys.exit(1)
             print("Ingestion completed!")
         
-        df = pd.read_csv(csv_path)
+        return csv_path
+    
+    def load_products(self) -> pd.DataFrame:
+        """Load products from CSV, create if missing."""
+        df = pd.read_csv(self.ensure_products_csv())
         print(f"Loaded {len(df)} products")
         
         # Ensure minimum items
@@ -65,72 +121,155 @@ class SearchIndexBuilder:
         return df
     
     def prepare_text_data(self, df: pd.DataFrame) -> List[str]:
-        """Prepare text data for embedding."""
-        texts = []
-        for _, row in df.iterrows():
-            # Combine title, description, and tags
-            text_parts = []
-            if pd.notna(row['title']):
-                text_parts.append(str(row['title']))
-            if pd.notna(row['description']):
-                text_parts.append(str(row['description']))
-            if pd.notna(row['tags']):
-                text_parts.append(str(row['tags']))
-            
-            combined_text = ' '.join(text_parts)
-            texts.append(combined_text)
-        
-        return texts
+        """Prepare text data for embedding (title, description and tags)."""
+        return [product_text(row) for _, row in df.iterrows()]
     
     def prepare_bm25_data(self, df: pd.DataFrame) -> List[List[str]]:
         """Prepare tokenized data for BM25."""
-        tokenized_docs = []
-        for _, row in df.iterrows():
-            # Combine all text fields and tokenize
-            text_parts = []
-            for field in ['title', 'description', 'tags', 'color', 'material']:
-                if pd.notna(row[field]):
-                    text_parts.append(str(row[field]))
-            
-            combined_text = ' '.join(text_parts).lower()
-            # Simple tokenization (split on whitespace and common punctuation)
-            tokens = combined_text.replace(',', ' ').replace('.', ' ').split()
-            tokenized_docs.append(tokens)
-        
-        return tokenized_docs
+        return [tokenize_product(row) for _, row in df.iterrows()]
+    
+    def text_dim(self) -> int:
+        if self.encoder_pool is not None:
+            return self.encoder_pool.dimension(TEXT_MODEL_NAME)
+        return self.text_model.get_sentence_embedding_dimension()
+    
+    def encode_text_batch(self, texts: List[str]) -> np.ndarray:
+        """Text model embeddings, sharded across the worker processes if there are several."""
+        if self.encoder_pool is not None:
+            return self.encoder_pool.encode_texts(TEXT_MODEL_NAME, texts)
+        return self.text_model.encode(texts, show_progress_bar=True)
+    
+    def encode_texts(self, texts: List[str]) -> np.ndarray:
+        """Encode texts with the text model, taking unchanged texts from the embedding cache."""
+        if self.text_cache is None:
+            return self.encode_text_batch(texts)
+        keys = [self.text_cache.key(text.encode('utf-8')) for text in texts]
+        return self.text_cache.get_or_encode(
+            keys, lambda missing: self.encode_text_batch([texts[i] for i in missing])
+        )
+    
+    def encode_image_files(self, image_paths: List[Path], product_ids: List[str]) -> np.ndarray:
+        """CLIP embeddings of image files, decoded in parallel and encoded in batches."""
+        if self.encoder_pool is not None:
+            return self.encoder_pool.encode_images(CLIP_MODEL_NAME, image_paths, product_ids, CLIP_DIM,
+                                                   self.image_batch_size, self.image_workers, self.image_manifest)
+        return encode_images(
+            image_paths, lambda images: self.clip_model.encode(images, batch_size=self.image_batch_size),
+            CLIP_DIM, batch_size=self.image_batch_size, workers=self.image_workers,
+            manifest=self.image_manifest, labels=product_ids
+        )
     
     def load_and_encode_images(self, df: pd.DataFrame) -> np.ndarray:
-        """Load and encode images using CLIP."""
+        """Load and encode images using CLIP; missing and unreadable images go to the image manifest."""
         print("Encoding images...")
-        image_embeddings = []
         project_root = Path(__file__).parent.parent
+        image_paths = [project_root / "public" / row['image_path'].lstrip('/') for _, row in df.iterrows()]
+        product_ids = df['product_id'].astype(str).tolist()
+        start = time.perf_counter()
         
-        for idx, row in df.iterrows():
-            image_path = project_root / "public" / row['image_path'].lstrip('/')
-            
-            try:
-                if image_path.exists():
-                    image = Image.open(image_path).convert('RGB')
-                    # Resize to reasonable size for CLIP
-                    image = image.resize((224, 224))
-                    embedding = self.clip_model.encode([image])
-                    image_embeddings.append(embedding[0])
-                else:
-                    print(f"Warning: Image not found: {image_path}")
-                    # Use zero embedding as fallback
-                    embedding = np.zeros(512)  # CLIP ViT-B-32 has 512 dims
-                    image_embeddings.append(embedding)
-            except Exception as e:
-                print(f"Error processing image {image_path}: {e}")
-                # Use zero embedding as fallback
-                embedding = np.zeros(512)
-                image_embeddings.append(embedding)
-        
-        return np.array(image_embeddings)
-    
-    def build_indices(self):
-        """Build all search indices."""
+        if self.clip_cache is None:
+            image_embeddings = self.encode_image_files(image_paths, product_ids)
+        else:
+            # Cached by file contents, so a replaced image is re-encoded even under the same path
+            image_embeddings = np.zeros((len(image_paths), CLIP_DIM), dtype=np.float32)
+            keyed = [i for i, image_path in enumerate(image_paths) if image_path.is_file()]
+            for i in sorted(set(range(len(image_paths))) - set(keyed)):
+                self.image_manifest.add_missing(image_paths[i], product_ids[i])
+            if keyed:
+                keys = [self.clip_cache.key(image_paths[i].read_bytes()) for i in keyed]
+                image_embeddings[keyed] = self.clip_cache.get_or_encode(
+                    keys, lambda missing: self.encode_image_files([image_paths[keyed[j]] for j in missing],
+                                                                  [product_ids[keyed[j]] for j in missing])
+                )
+        
+        self.image_seconds += time.perf_counter() - start
+        return image_embeddings
+    
+    def image_stats(self) -> Dict[str, Any]:
+        """Image encoding counts and throughput of this build; prints a summary."""
+        summary = self.image_manifest.summary()
+        elapsed = self.image_seconds
+        stats = {**summary, 'seconds': round(elapsed, 3),
+                 'images_per_sec': round(summary['encoded'] / elapsed, 1) if elapsed > 0 else 0.0}
+        print(f"Images: {summary['encoded']} encoded at {stats['images_per_sec']} images/sec, "
+              f"{summary['missing']} missing, {summary['failed']} unreadable (see image_manifest.json)")
+        return stats
+    
+    def save_embedding_caches(self) -> List[Dict[str, Any]]:
+        """Persist the embedding caches, print their hit rates and return their stats."""
+        stats = []
+        for cache in (self.text_cache, self.clip_cache):
+            if cache is None:
+                continue
+            pruned = cache.prune() if self.prune_embedding_cache else 0
+            cache.save()
+            cache_stats = {**cache.stats(), 'pruned': pruned}
+            stats.append(cache_stats)
+            print(f"Embedding cache ({cache.model_name}): {cache.hits} hits, {cache.misses} misses, "
+                  f"{cache.encode_seconds:.1f}s encoding, ~{cache.saved_seconds:.1f}s saved"
+                  + (f", {pruned} unused entries pruned" if pruned else ""))
+        return stats
+    
+    def export_onnx_encoders(self) -> Dict[str, Any]:
+        """
+        Export the text model and the CLIP text tower to <artifacts>/onnx. Each export is checked
+        against torch on catalog texts and the eval queries and fails below MIN_PARITY_COSINE.
+        """
+        from onnx_encoder import ENCODERS, export_encoder
+        print("Exporting query encoders to ONNX...")
+        sample = self.prepare_text_data(pd.read_csv(self.ensure_products_csv(), nrows=ONNX_PARITY_SAMPLE))
+        if EVAL_QUERIES_FILE.exists():
+            sample += [line.strip() for line in open(EVAL_QUERIES_FILE) if line.strip()]
+        # Encoding ran in worker processes if the builder has no models of its own
+        if self.text_model is None:
+            self.text_model = SentenceTransformer(TEXT_MODEL_NAME)
+            self.clip_model = SentenceTransformer(CLIP_MODEL_NAME)
+        models = {'text': self.text_model, 'clip_text': self.clip_model}
+        exports = {}
+        for name, kind in ENCODERS.items():
+            exports[name] = export_encoder(models[name], kind, self.artifacts_dir / ONNX_DIR / name, sample)
+            print(f"ONNX {name} encoder: min cosine to torch {exports[name]['parity_min_cosine']}")
+        return exports
+    
+    def build_metadata(self, num_products: int, text_dim: int, img_dim: int,
+                       text_index_params: Dict[str, Any], img_index_params: Dict[str, Any]) -> Dict[str, Any]:
+        """metadata.json contents; also persists the embedding caches and reports image stats."""
+        return {
+            'num_products': num_products,
+            'text_dim': text_dim,
+            'img_dim': img_dim,
+            'embedding_dtype': self.embedding_dtype.name,
+            'weights': {
+                'text': self.W_TEXT,
+                'image': self.W_IMG,
+                'keyword': self.W_KW
+            },
+            'index': {
+                'text': text_index_params,
+                'image': img_index_params
+            },
+            # Requested before clamping to the catalog size; rebuilds and compactions reuse them
+            'index_params': self.index_params,
+            'embedding_cache': self.save_embedding_caches(),
+            'images': self.image_stats(),
+            'onnx': self.export_onnx_encoders() if self.export_onnx else None
+        }
+    
+    def build_indices(self, chunk_size: Optional[int] = None):
+        """Build all search indices (in chunks of chunk_size products if given)."""
+        try:
+            if chunk_size:
+                self.build_indices_streaming(chunk_size)
+            else:
+                self.build_indices_in_memory()
+        finally:
+            if self.encoder_pool is not None:
+                self.encoder_pool.close()
+    
+    def build_indices_in_memory(self):
+        """Build all search indices from the whole catalog loaded at once."""
         print("Building search indices...")
+        self.image_manifest, self.image_seconds = ImageManifest(), 0.0
         
         # Load products
         df = self.load_products()
@@ -141,74 +280,203 @@ class SearchIndexBuilder:
         
         # Encode text embeddings
         print("Encoding text embeddings...")
-        text_embeddings = self.text_model.encode(texts, show_progress_bar=True)
-        text_embeddings = normalize(text_embeddings, axis=1)
+        text_embeddings = self.encode_texts(texts)
+        text_embeddings = normalize(text_embeddings, axis=1).astype(self.embedding_dtype, copy=False)
         
         # Encode image embeddings
         image_embeddings = self.load_and_encode_images(df)
-        image_embeddings = normalize(image_embeddings, axis=1)
+        image_embeddings = normalize(image_embeddings, axis=1).astype(self.embedding_dtype, copy=False)
         
         # Build BM25 index
         print("Building BM25 index...")
         tokenized_docs = self.prepare_bm25_data(df)
-        bm25 = BM25Okapi(tokenized_docs)
+        bm25 = BM25Index.from_tokenized(tokenized_docs)
         
         # Build FAISS indices
-        print("Building FAISS indices...")
+        print(f"Building FAISS indices ({self.index_type})...")
         text_dim = text_embeddings.shape[1]
         img_dim = image_embeddings.shape[1]
         
         # Text index (Inner Product for cosine similarity)
-        text_index = faiss.IndexFlatIP(text_dim)
-        text_index.add(text_embeddings.astype('float32'))
+        text_index, text_index_params = build_ann_index(text_embeddings, self.index_type, **self.index_params)
         
         # Image index
-        img_index = faiss.IndexFlatIP(img_dim)
-        img_index.add(image_embeddings.astype('float32'))
+        img_index, img_index_params = build_ann_index(image_embeddings, self.index_type, **self.index_params)
         
         # Save artifacts
         print("Saving artifacts...")
+        metadata = self.build_metadata(len(df), text_dim, img_dim, text_index_params, img_index_params)
+        save_artifacts(self.artifacts_dir, text_index, img_index, text_embeddings, image_embeddings,
+                       bm25, df, metadata)
+        self.image_manifest.save(self.artifacts_dir / "image_manifest.json")
         
-        # Save FAISS indices
-        faiss.write_index(text_index, str(self.artifacts_dir / "text.index"))
-        faiss.write_index(img_index, str(self.artifacts_dir / "img.index"))
+        print(f"Indices built successfully!")
+        print(f"Products: {len(df)}")
+        print(f"Text embeddings: {text_embeddings.shape}")
+        print(f"Image embeddings: {image_embeddings.shape}")
+        print(f"Artifacts saved to: {self.artifacts_dir}")
+    
+    def scan_products(self, csv_path: Path, chunk_size: int) -> Tuple[int, Dict[str, Any]]:
+        """Row count of products.csv and the column dtypes a single pd.read_csv would infer."""
+        num_products, dtypes = 0, {}
+        for chunk in pd.read_csv(csv_path, chunksize=chunk_size):
+            num_products += len(chunk)
+            for column, dtype in chunk.dtypes.items():
+                dtypes[column] = common_dtype(dtypes[column], dtype) if column in dtypes else dtype
+        return num_products, dtypes
+    
+    def build_index_chunked(self, embeddings: np.ndarray, chunk_size: int) -> Tuple[Any, Dict[str, Any]]:
+        """build_ann_index over a memory-mapped embedding matrix, adding chunk_size rows at a time."""
+        index, params = create_ann_index(embeddings.shape[1], len(embeddings), self.index_type, **self.index_params)
+        if not index.is_trained:
+            # Same training input as the in-memory build; FAISS subsamples it for k-means and PQ.
+            # float16 embeddings are widened for this, the one step not done chunk by chunk
+            index.train(np.ascontiguousarray(embeddings, dtype='float32'))
+        for start in range(0, len(embeddings), chunk_size):
+            index.add(np.ascontiguousarray(embeddings[start:start + chunk_size], dtype='float32'))
+        return index, params
+    
+    def build_indices_streaming(self, chunk_size: int):
+        """
+        Build the same artifacts as build_indices while holding one chunk of products at a time.
+        Embeddings are written into preallocated .npy memmaps, the catalog is appended to parquet
+        chunk by chunk, BM25 postings are accumulated as arrays and the FAISS indices are filled
+        from the memmaps. Memory then grows only with the indices themselves.
+        """
+        print(f"Building search indices in chunks of {chunk_size} products...")
+        self.image_manifest, self.image_seconds = ImageManifest(), 0.0
+        csv_path = self.ensure_products_csv()
+        num_products, dtypes = self.scan_products(csv_path, chunk_size)
+        print(f"Loaded {num_products} products")
         
-        # Save embeddings
-        np.save(str(self.artifacts_dir / "E_text.npy"), text_embeddings)
-        np.save(str(self.artifacts_dir / "E_img.npy"), image_embeddings)
+        text_dim = self.text_dim()
+        img_dim = CLIP_DIM
+        # Written under temporary names and renamed when complete (see ann.save_embeddings)
+        text_path, img_path = self.artifacts_dir / "E_text.npy", self.artifacts_dir / "E_img.npy"
+        catalog_path = self.artifacts_dir / "catalog.parquet"
+        text_embeddings = np.lib.format.open_memmap(f"{text_path}.tmp", mode='w+', dtype=self.embedding_dtype,
+                                                    shape=(num_products, text_dim))
+        image_embeddings = np.lib.format.open_memmap(f"{img_path}.tmp", mode='w+', dtype=self.embedding_dtype,
+                                                     shape=(num_products, img_dim))
+        bm25 = BM25Builder()
+        schema = catalog_schema(dtypes)
         
-        # Save BM25
-        with open(self.artifacts_dir / "bm25.pkl", 'wb') as f:
-            pickle.dump(bm25, f)
+        with pq.ParquetWriter(f"{catalog_path}.tmp", schema) as writer:
+            start = 0
+            for chunk in pd.read_csv(csv_path, chunksize=chunk_size, dtype=dtypes):
+                end = start + len(chunk)
+                print(f"Encoding products {start}-{end} of {num_products}...")
+                text_embeddings[start:end] = normalize(self.encode_texts(self.prepare_text_data(chunk)), axis=1)
+                image_embeddings[start:end] = normalize(self.load_and_encode_images(chunk), axis=1)
+                bm25.add(self.prepare_bm25_data(chunk))
+                writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+                start = end
         
-        # Save product catalog
-        df.to_parquet(self.artifacts_dir / "catalog.parquet", index=False)
+        text_embeddings.flush()
+        image_embeddings.flush()
+        del text_embeddings, image_embeddings
+        os.replace(f"{text_path}.tmp", text_path)
+        os.replace(f"{img_path}.tmp", img_path)
+        os.replace(f"{catalog_path}.tmp", catalog_path)
+        # Reads back only the price and attribute columns
+        AttributeIndex.from_parquet(catalog_path).save(self.artifacts_dir / "attributes.npz")
         
-        # Save metadata
-        metadata = {
-            'num_products': len(df),
-            'text_dim': text_dim,
-            'img_dim': img_dim,
-            'weights': {
-                'text': self.W_TEXT,
-                'image': self.W_IMG,
-                'keyword': self.W_KW
-            }
-        }
+        print(f"Building FAISS indices ({self.index_type})...")
+        text_index, text_index_params = self.build_index_chunked(load_embeddings(text_path, mmap=True), chunk_size)
+        img_index, img_index_params = self.build_index_chunked(load_embeddings(img_path, mmap=True), chunk_size)
         
+        print("Saving artifacts...")
+        write_index(text_index, self.artifacts_dir / "text.index")
+        write_index(img_index, self.artifacts_dir / "img.index")
+        del text_index, img_index
+        bm25.build().save(self.artifacts_dir / "bm25_index.npz")
+        metadata = self.build_metadata(num_products, text_dim, img_dim, text_index_params, img_index_params)
         with open(self.artifacts_dir / "metadata.json", 'w') as f:
             json.dump(metadata, f, indent=2)
+        self.image_manifest.save(self.artifacts_dir / "image_manifest.json")
         
+        peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
         print(f"Indices built successfully!")
-        print(f"Products: {len(df)}")
-        print(f"Text embeddings: {text_embeddings.shape}")
-        print(f"Image embeddings: {image_embeddings.shape}")
+        print(f"Products: {num_products}")
+        print(f"Peak RSS: {peak_rss_mb:.0f} MB")
         print(f"Artifacts saved to: {self.artifacts_dir}")
 
+def common_dtype(a, b):
+    """dtype pd.read_csv infers for a whole column whose chunks were inferred as a and b."""
+    if a == b:
+        return a
+    # A chunk where a text column is all NaN is read as float64
+    for dtype in (a, b):
+        if pd.api.types.is_string_dtype(dtype) and dtype != object:
+            return dtype
+    if (pd.api.types.is_numeric_dtype(a) and pd.api.types.is_numeric_dtype(b)
+            and not pd.api.types.is_bool_dtype(a) and not pd.api.types.is_bool_dtype(b)):
+        return np.result_type(a, b)
+    return np.dtype(object)
+
+def catalog_schema(dtypes: Dict[str, Any]) -> pa.Schema:
+    """Parquet schema of the catalog; text columns that are empty in a chunk still get a string type."""
+    empty = pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in dtypes.items()})
+    schema = pa.Schema.from_pandas(empty, preserve_index=False)
+    return pa.schema([field.with_type(pa.string()) if pa.types.is_null(field.type) else field for field in schema],
+                     metadata=schema.metadata)
+
 def main():
     """Main function."""
-    builder = SearchIndexBuilder()
-    builder.build_indices()
+    parser = argparse.ArgumentParser(description="Build search indices")
+    parser.add_argument("--artifacts-dir", default="artifacts",
+                        help="Artifact root; the build becomes a new published version under it")
+    parser.add_argument("--output-dir",
+                        help="Write the artifact set here without publishing it (used by the server's /rebuild)")
+    parser.add_argument("--keep-versions", type=int, default=3, help="Published versions to keep on disk")
+    add_index_arguments(parser)
+    parser.add_argument("--embedding-cache-dir", default=str(DEFAULT_EMBEDDING_CACHE_DIR),
+                        help="Content-hash cache of text and image embeddings reused across builds")
+    parser.add_argument("--no-embedding-cache", action="store_true", help="Encode every product")
+    parser.add_argument("--prune-embedding-cache", action="store_true",
+                        help="Drop cached embeddings of texts and images no longer in the catalog")
+    parser.add_argument("--chunk-size", type=int,
+                        help="Stream products.csv in chunks of this many products to bound memory on large catalogs")
+    parser.add_argument("--image-batch-size", type=int, default=32, help="Images per CLIP forward pass")
+    parser.add_argument("--image-workers", type=int, default=min(8, os.cpu_count() or 1),
+                        help="Threads decoding and resizing images ahead of the encoder")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker processes encoding shards of the catalog, each with its own model copy")
+    parser.add_argument("--threads-per-worker", type=int,
+                        help="Torch threads per worker process (default: cores divided by workers)")
+    parser.add_argument("--embedding-dtype", choices=EMBEDDING_DTYPES, default="float32",
+                        help="Storage type of E_text.npy/E_img.npy; pair float16 with --index-type sq8 to shrink memory")
+    parser.add_argument("--export-onnx", action="store_true",
+                        help="Also export the query encoders to ONNX for serving with ENCODER_BACKEND=onnx")
+    args = parser.parse_args()
+    
+    builder_args = dict(
+        index_type=args.index_type,
+        index_params=index_params_from_args(args),
+        embedding_cache_dir=None if args.no_embedding_cache else args.embedding_cache_dir,
+        prune_embedding_cache=args.prune_embedding_cache,
+        image_batch_size=args.image_batch_size,
+        image_workers=args.image_workers,
+        workers=args.workers,
+        threads_per_worker=args.threads_per_worker,
+        export_onnx=args.export_onnx,
+        embedding_dtype=args.embedding_dtype
+    )
+    if args.output_dir:
+        SearchIndexBuilder(artifacts_dir=args.output_dir, **builder_args).build_indices(args.chunk_size)
+        return
+    
+    store = ArtifactStore(args.artifacts_dir)
+    version = store.new_version()
+    try:
+        SearchIndexBuilder(artifacts_dir=store.version_path(version), **builder_args).build_indices(args.chunk_size)
+    except BaseException:
+        store.discard(version)
+        raise
+    # Running servers switch to the new set once it is published; API product updates carry over
+    publish_build(store, version)
+    store.prune(args.keep_versions)
+    print(f"Published artifact version {version}")
 
 if __name__ == "__main__":
     main()
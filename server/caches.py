@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+In-process caches for the search server.
+Thread-safe LRU with optional TTL expiry, byte budget, stale serving and hit/miss counters.
+"""
+
+import time
+import base64
+import binascii
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+def normalize_query(query: str) -> str:
+    """Canonical form of a query used for cache keys (case and whitespace insensitive)."""
+    return ' '.join(query.lower().split())
+
+
+def encode_cursor(list_id: str, offset: int) -> str:
+    """Opaque pagination cursor: a cached ranked list and the position of the next page in it."""
+    return base64.urlsafe_b64encode(f"{list_id}:{offset}".encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    """(list id, offset) of a cursor from encode_cursor; ValueError if it is malformed."""
+    try:
+        list_id, offset = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode().rsplit(':', 1)
+        offset = int(offset)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("Malformed cursor")
+    if offset < 0:
+        raise ValueError("Malformed cursor")
+    return list_id, offset
+
+
+class LRUCache:
+    """
+    Bounded least-recently-used cache.
+
+    Entries older than `ttl` seconds are misses for get(). With `stale_ttl`
+    set, get_stale() keeps returning them for that many extra seconds,
+    flagged as stale, so callers can serve them while refreshing. When
+    `max_bytes` is set, put() callers pass each entry's size and the
+    least recently used entries are evicted to stay under the budget.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = None,
+                 max_bytes: Optional[int] = None, stale_ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.stale_ttl = stale_ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _lookup(self, key: Hashable, allow_stale: bool) -> Optional[Tuple[Any, bool]]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at, _ = entry
+            now = time.monotonic()
+            if expires_at is not None and expires_at < now:
+                in_stale_window = bool(self.stale_ttl) and now < expires_at + self.stale_ttl
+                if allow_stale and in_stale_window:
+                    self._data.move_to_end(key)
+                    self.stale_hits += 1
+                    return value, True
+                if not in_stale_window:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value, False
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._lookup(key, allow_stale=False)
+        return entry[0] if entry is not None else default
+
+    def get_stale(self, key: Hashable) -> Optional[Tuple[Any, bool]]:
+        """Return (value, is_stale), or None on a miss."""
+        return self._lookup(key, allow_stale=True)
+
+    def put(self, key: Hashable, value: Any, size: int = 0):
+        if self.max_entries <= 0 or (self.max_bytes is not None and size > self.max_bytes):
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, expires_at, size)
+            self.nbytes += size
+            while len(self._data) > self.max_entries or (
+                    self.max_bytes is not None and self.nbytes > self.max_bytes):
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+
+    def _remove(self, key: Hashable):
+        _, _, size = self._data.pop(key)
+        self.nbytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        served = self.hits + self.stale_hits
+        lookups = served + self.misses
+        return {
+            'size': len(self._data),
+            'max_entries': self.max_entries,
+            'ttl': self.ttl,
+            'nbytes': self.nbytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': served / lookups if lookups else 0.0
+        }
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Columnar product catalog for serving.
+Strings live in Arrow arrays, low-cardinality attributes are dictionary-encoded,
+and display fallbacks are resolved once at load time instead of per query.
+"""
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from typing import Any, Dict, List
+
+# Parquet columns needed for serving
+SERVING_COLUMNS = ['product_id', 'title', 'description', 'price', 'color', 'material',
+                   'sizes', 'image_path', 'image_paths']
+
+# Fields combined into the text embedded for a product
+TEXT_FIELDS = ('title', 'description', 'tags')
+
+
+def product_text(product: Dict[str, Any]) -> str:
+    """Text embedded for a catalog row (dict or DataFrame row)."""
+    return ' '.join(str(product[field]) for field in TEXT_FIELDS
+                    if field in product and pd.notna(product[field]))
+
+
+def _string_column(table: pa.Table, name: str) -> pa.Array:
+    """Column as a single string array; missing columns are all-null."""
+    if name not in table.column_names:
+        return pa.nulls(table.num_rows, type=pa.string())
+    return pc.cast(table.column(name).combine_chunks(), pa.string())
+
+
+def _resolve_image_paths(image_path: pa.Array, image_paths: pa.Array) -> pa.Array:
+    """Prefer image_path, fall back to the first entry of the '|'-separated image_paths."""
+    primary = pc.utf8_trim_whitespace(image_path)
+    use_primary = pc.fill_null(pc.greater(pc.utf8_length(primary), 0), False)
+    first = pc.list_element(pc.split_pattern(pc.utf8_trim_whitespace(image_paths), '|'), 0)
+    fallback = pc.fill_null(pc.utf8_trim_whitespace(first), '')
+    return pc.if_else(use_primary, primary, fallback)
+
+
+class DictColumn:
+    """
+    Dictionary-encoded attribute: int32 codes into a table of distinct values.
+    `display` holds the value shown to clients (missing -> fallback) and `match`
+    the lowercased raw value used for query-term matching (missing -> 'nan',
+    as str() of a pandas NaN).
+    """
+
+    def __init__(self, column: pa.Array, fallback: str):
+        encoded = pc.dictionary_encode(column)
+        values = encoded.dictionary.to_pylist()
+        # Nulls get their own trailing code
+        self.codes = np.asarray(pc.fill_null(encoded.indices, len(values))).astype(np.int32)
+        self.display = values + [fallback]
+        self.match = [v.lower() for v in values] + ['nan']
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def concat(self, other: "DictColumn") -> "DictColumn":
+        """Column with other's rows appended, re-coded against one merged dictionary."""
+        position = {value: i for i, value in enumerate(self.display[:-1])}
+        for value in other.display[:-1]:
+            position.setdefault(value, len(position))
+        values = list(position)
+        null_code = len(values)
+        own = np.append(np.arange(len(self.display) - 1), null_code).astype(np.int32)
+        theirs = np.array([position[value] for value in other.display[:-1]] + [null_code], dtype=np.int32)
+
+        column = object.__new__(DictColumn)
+        column.codes = np.concatenate([own[self.codes], theirs[other.codes]])
+        column.display = values + [self.display[-1]]
+        column.match = [v.lower() for v in values] + ['nan']
+        return column
+
+
+class ColumnarCatalog:
+    """Read-only, array-backed view of catalog.parquet used to build search results."""
+
+    def __init__(self, table: pa.Table):
+        title = _string_column(table, 'title')
+        description = _string_column(table, 'description')
+
+        self.product_ids = pc.fill_null(_string_column(table, 'product_id'), 'nan')
+        self.titles = pc.fill_null(title, 'nan')
+        self.prices = np.asarray(pc.fill_null(table.column('price').combine_chunks(), 0)).astype(np.int64)
+        self.color = DictColumn(_string_column(table, 'color'), 'mixed')
+        self.material = DictColumn(_string_column(table, 'material'), 'mixed')
+        self.sizes = DictColumn(_string_column(table, 'sizes'), 'One Size')
+        self.image_paths = _resolve_image_paths(_string_column(table, 'image_path'),
+                                                _string_column(table, 'image_paths'))
+        # Reranker input, same text as f"{row['title']} {row['description']}"
+        self.passages = pc.binary_join_element_wise(self.titles, pc.fill_null(description, 'nan'), ' ')
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+    @classmethod
+    def from_parquet(cls, path) -> "ColumnarCatalog":
+        available = pq.read_schema(path).names
+        catalog = cls(pq.read_table(path, columns=[c for c in SERVING_COLUMNS if c in available]))
+        # Hand the parquet decode buffers back to the OS rather than keeping them pooled
+        pa.default_memory_pool().release_unused()
+        return catalog
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame) -> "ColumnarCatalog":
+        return cls(pa.Table.from_pandas(df, preserve_index=False))
+
+    def concat(self, other: "ColumnarCatalog") -> "ColumnarCatalog":
+        """Catalog with other's rows appended after this one's."""
+        catalog = object.__new__(ColumnarCatalog)
+        for name in ('product_ids', 'titles', 'image_paths', 'passages'):
+            setattr(catalog, name, pa.concat_arrays([getattr(self, name), getattr(other, name)]))
+        catalog.prices = np.concatenate([self.prices, other.prices])
+        for name in ('color', 'material', 'sizes'):
+            setattr(catalog, name, getattr(self, name).concat(getattr(other, name)))
+        return catalog
+
+    def rows_of(self, product_ids: List[str]) -> np.ndarray:
+        """Rows whose product id is in product_ids (every row of a repeated id)."""
+        matches = pc.is_in(self.product_ids, value_set=pa.array(product_ids, type=pa.string()))
+        return np.flatnonzero(matches.to_numpy(zero_copy_only=False))
+
+    def ids_for(self, indices: np.ndarray) -> List[str]:
+        return self.product_ids.take(pa.array(indices)).to_pylist()
+
+    def passages_for(self, indices: np.ndarray) -> List[str]:
+        return self.passages.take(pa.array(indices)).to_pylist()
+
+    def gather(self, indices: np.ndarray) -> Dict[str, list]:
+        """Display fields for the given rows, as parallel lists."""
+        take = pa.array(indices)
+        return {
+            'product_id': self.product_ids.take(take).to_pylist(),
+            'title': self.titles.take(take).to_pylist(),
+            'price': self.prices[indices].tolist(),
+            'color': [self.color.display[c] for c in self.color.codes[indices]],
+            'material': [self.material.display[c] for c in self.material.codes[indices]],
+            'sizes': [self.sizes.display[c] for c in self.sizes.codes[indices]],
+            'image_path': self.image_paths.take(take).to_pylist(),
+            'color_match': [self.color.match[c] for c in self.color.codes[indices]],
+            'material_match': [self.material.match[c] for c in self.material.codes[indices]]
+        }
+
+    def nbytes(self) -> int:
+        """Approximate resident size of the columnar data."""
+        arrow = sum(a.nbytes for a in (self.product_ids, self.titles, self.image_paths, self.passages))
+        numpy = self.prices.nbytes + sum(c.codes.nbytes for c in (self.color, self.material, self.sizes))
+        return arrow + numpy
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Concurrency helpers for CPU-bound request work.
+A bounded thread pool that keeps blocking search calls off the event loop and sheds load once
+full, and a micro-batcher that coalesces concurrent encoder calls into one forward pass.
+"""
+
+import time
+import queue
+import asyncio
+import threading
+import numpy as np
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Hashable, List, Tuple
+
+
+class ExecutorSaturated(Exception):
+    """Raised when both the worker slots and the wait queue are full."""
+
+
+class BoundedExecutor:
+    """
+    Thread pool that admits at most `max_workers` running plus `max_queue`
+    waiting calls. Further calls are rejected immediately instead of piling
+    up behind slow ones.
+    """
+
+    def __init__(self, max_workers: int = 4, max_queue: int = 32):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="search")
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _admit(self) -> bool:
+        with self._lock:
+            if self.in_flight >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                return False
+            self.in_flight += 1
+            return True
+
+    def _release(self):
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run fn in the pool and await its result; raises ExecutorSaturated when full."""
+        if not self._admit():
+            raise ExecutorSaturated()
+        try:
+            future = self._pool.submit(partial(fn, *args, **kwargs))
+        except Exception:
+            self._release()
+            raise
+        # Release on completion, not on await: a cancelled request still occupies its worker
+        future.add_done_callback(lambda _: self._release())
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'in_flight': self.in_flight,
+                'queued': max(0, self.in_flight - self.max_workers),
+                'completed': self.completed,
+                'rejected': self.rejected
+            }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent calls of a batch function.
+
+    Callers block in submit() while a single worker thread gathers requests
+    for up to `max_wait` seconds after the first one arrives (or until
+    `max_batch_size` items are queued), runs `fn` once on the de-duplicated
+    items and hands each caller its own rows back. A request that finds the
+    queue otherwise empty is run at once, so a lone client never waits for
+    the window; under load, requests queue up while fn runs. With
+    max_wait <= 0 the batcher is bypassed and fn runs on the caller's thread.
+    """
+
+    def __init__(self, fn: Callable[[List[Hashable]], np.ndarray],
+                 max_batch_size: int = 64, max_wait: float = 0.002, name: str = "batcher"):
+        self.fn = fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.name = name
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+        self.items = 0
+        self.encoded = 0
+        self.largest_batch = 0
+        self.total_wait = 0.0
+        self.max_wait_seen = 0.0
+
+    def submit(self, items: List[Hashable]) -> np.ndarray:
+        """Run fn on items, possibly batched with other callers; returns one row per item."""
+        if self.max_wait <= 0:
+            return self.fn(items)
+        self._ensure_started()
+        future = Future()
+        self._queue.put((items, future, time.monotonic()))
+        return future.result()
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            size = len(batch[0][0])
+            deadline = batch[0][2] + self.max_wait
+            # Only wait for more requests when others are already queued
+            wait = not self._queue.empty()
+            while size < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    request = self._queue.get(timeout=remaining) if wait and remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(request)
+                size += len(request[0])
+            self._process(batch)
+
+    def _process(self, batch: List[Tuple[List[Hashable], Future, float]]):
+        started = time.monotonic()
+        items = [item for request_items, _, _ in batch for item in request_items]
+        unique = list(dict.fromkeys(items))
+        try:
+            rows = self.fn(unique)
+            position = {item: i for i, item in enumerate(unique)}
+            for request_items, future, _ in batch:
+                future.set_result(rows[[position[item] for item in request_items]])
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+        waits = [started - enqueued for _, _, enqueued in batch]
+        with self._stats_lock:
+            self.batches += 1
+            self.requests += len(batch)
+            self.items += len(items)
+            self.encoded += len(unique)
+            self.largest_batch = max(self.largest_batch, len(unique))
+            self.total_wait += sum(waits)
+            self.max_wait_seen = max(self.max_wait_seen, max(waits))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000,
+                'batches': self.batches,
+                'requests': self.requests,
+                'items': self.items,
+                'mean_batch_size': self.encoded / self.batches if self.batches else 0.0,
+                'largest_batch': self.largest_batch,
+                'mean_queue_wait_ms': self.total_wait / self.requests * 1000 if self.requests else 0.0,
+                'max_queue_wait_ms': self.max_wait_seen * 1000
+            }
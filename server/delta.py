@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Incremental catalog updates.
+Upserts and deletes are applied to a loaded artifact set without re-embedding the catalog and
+recorded in a delta log inside the artifact set's directory, so a restart replays them instead
+of rebuilding. Compaction folds the log into a new artifact set and keeps its net changes as a
+single history segment, since products.csv never sees these changes: a full rebuild rebases that
+history onto the freshly built catalog, keeping only the changes the build does not already have.
+"""
+
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional
+from ann import DeltaIndex, build_ann_index, index_config
+from artifacts import ONNX_DIR, ArtifactStore, SearchArtifacts, compacted_seq, save_artifacts
+from attributes import AttributeIndex
+from bm25_index import BM25Index, tokenize_product
+from catalog import ColumnarCatalog
+
+DELTA_DIR = "delta"
+
+
+class DeltaSegment(NamedTuple):
+    """One upsert or delete call: full product records with their embeddings, and deleted ids."""
+    products: List[Dict[str, Any]]
+    text_embeddings: np.ndarray
+    img_embeddings: np.ndarray
+    deleted: List[str]
+
+
+def _to_json(value):
+    # numpy scalars from DataFrame records
+    return value.item() if hasattr(value, 'item') else str(value)
+
+
+class DeltaLog:
+    """Numbered .npz segments under <artifact set>/delta/, applied in order on top of the set."""
+
+    def __init__(self, artifacts_path):
+        self.path = Path(artifacts_path) / DELTA_DIR
+
+    def _segment_path(self, seq: int) -> Path:
+        return self.path / f"{seq:08d}.npz"
+
+    def segments(self) -> List[int]:
+        if not self.path.exists():
+            return []
+        return sorted(int(p.stem) for p in self.path.glob("*.npz"))
+
+    def last_seq(self) -> int:
+        segments = self.segments()
+        return segments[-1] if segments else 0
+
+    def write(self, seq: int, segment: DeltaSegment) -> bool:
+        """Write segment seq; False if another process already wrote that number."""
+        self.path.mkdir(parents=True, exist_ok=True)
+        tmp = self.path / f"{seq:08d}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            np.savez(
+                f,
+                products=np.array(json.dumps(segment.products, default=_to_json)),
+                text_embeddings=segment.text_embeddings,
+                img_embeddings=segment.img_embeddings,
+                deleted=np.array(json.dumps(segment.deleted))
+            )
+        try:
+            # link() fails if the name exists, so concurrent writers never overwrite each other
+            os.link(tmp, self._segment_path(seq))
+            return True
+        except FileExistsError:
+            return False
+        finally:
+            tmp.unlink()
+
+    def read(self, seq: int) -> DeltaSegment:
+        with np.load(self._segment_path(seq), allow_pickle=False) as data:
+            return DeltaSegment(
+                products=json.loads(str(data['products'])),
+                text_embeddings=data['text_embeddings'],
+                img_embeddings=data['img_embeddings'],
+                deleted=json.loads(str(data['deleted']))
+            )
+
+    def copy_to(self, other: "DeltaLog", after: int = 0, through: Optional[int] = None):
+        """
+        Copy segments in (after, through] into another artifact set's log, keeping their numbers;
+        segments the other log already has are left alone.
+        """
+        for seq in self.segments():
+            if seq > after and (through is None or seq <= through) and not other._segment_path(seq).exists():
+                other.path.mkdir(parents=True, exist_ok=True)
+                shutil.copyfile(self._segment_path(seq), other._segment_path(seq))
+
+
+def fold_segments(segments: List[DeltaSegment]) -> DeltaSegment:
+    """
+    One segment with the net effect of segments applied in order: the last upsert of each
+    product not deleted after it, in the order of those upserts, and the ids deleted last.
+    """
+    upserts: Dict[str, tuple] = {}
+    deleted: Dict[str, None] = {}
+    for segment in segments:
+        for row, product in enumerate(segment.products):
+            product_id = str(product['product_id'])
+            upserts.pop(product_id, None)
+            deleted.pop(product_id, None)
+            upserts[product_id] = (product, segment.text_embeddings[row], segment.img_embeddings[row])
+        for product_id in segment.deleted:
+            upserts.pop(product_id, None)
+            deleted[product_id] = None
+    kept = list(upserts.values())
+    text_dim, img_dim = segments[0].text_embeddings.shape[1], segments[0].img_embeddings.shape[1]
+    return DeltaSegment(
+        [product for product, _, _ in kept],
+        np.array([text for _, text, _ in kept], dtype='float32').reshape(-1, text_dim),
+        np.array([img for _, _, img in kept], dtype='float32').reshape(-1, img_dim),
+        list(deleted)
+    )
+
+
+def _is_null(value) -> bool:
+    return value is None or (isinstance(value, (float, np.floating)) and np.isnan(value))
+
+
+def _same_value(a, b) -> bool:
+    if _is_null(a) or _is_null(b):
+        return _is_null(a) and _is_null(b)
+    if isinstance(a, (int, float, np.number)) and isinstance(b, (int, float, np.number)):
+        return float(a) == float(b)
+    return str(a) == str(b)
+
+
+def drop_built_changes(segment: DeltaSegment, built: pd.DataFrame) -> DeltaSegment:
+    """
+    The changes of segment a build from the catalog `built` does not already have: upserts whose
+    fields differ from its row for the product (or that it lacks) and deletes of ids it has.
+    """
+    rows = {str(row['product_id']): row for row in built.to_dict('records')}
+    keep = [i for i, product in enumerate(segment.products)
+            if str(product['product_id']) not in rows
+            or not all(_same_value(value, rows[str(product['product_id'])].get(key))
+                       for key, value in product.items())]
+    return DeltaSegment(
+        [segment.products[i] for i in keep],
+        segment.text_embeddings[keep],
+        segment.img_embeddings[keep],
+        [product_id for product_id in segment.deleted if product_id in rows]
+    )
+
+
+def rebase_log(source: DeltaLog, target: DeltaLog, through: Optional[int] = None,
+               built: Optional[pd.DataFrame] = None) -> int:
+    """
+    Write the net changes of source's segments up to through into target as a single segment,
+    numbered like the last of them so that later segments follow it, and return that number
+    (0 for an empty log). With built, the catalog a new version was built from, changes it
+    already has are dropped, so the log of a rebuilt set only holds what products.csv lacks.
+    """
+    seqs = [seq for seq in source.segments() if through is None or seq <= through]
+    if not seqs:
+        return 0
+    segment = fold_segments([source.read(seq) for seq in seqs])
+    if built is not None:
+        segment = drop_built_changes(segment, built)
+    target.write(seqs[-1], segment)
+    return seqs[-1]
+
+
+def publish_build(store: ArtifactStore, version: str):
+    """
+    Publish a version built offline from products.csv, rebasing the published set's delta log
+    onto it as /rebuild does: products.csv does not hold changes made through /products, and
+    running servers follow CURRENT on their own. Segments logged meanwhile are copied after the
+    switch.
+    """
+    source = DeltaLog(store.current_path())
+    target_path = store.version_path(version)
+    seq = rebase_log(source, DeltaLog(target_path), built=pd.read_parquet(target_path / "catalog.parquet"))
+    store.publish(version)
+    source.copy_to(DeltaLog(target_path), after=seq)
+
+
+def _added_vectors(index) -> np.ndarray:
+    return index.added_vectors if isinstance(index, DeltaIndex) else np.empty((0, index.d), dtype='float32')
+
+
+def embedding_rows(embeddings: np.ndarray, index, rows: np.ndarray) -> np.ndarray:
+    """float32 embeddings of catalog rows: built rows from the stored matrix, added rows from the index overlay."""
+    rows = np.asarray(rows, dtype=np.int64)
+    out = np.empty((len(rows), embeddings.shape[1]), dtype='float32')
+    built = rows < len(embeddings)
+    out[built] = embeddings[rows[built]]
+    if not built.all():
+        out[~built] = _added_vectors(index)[rows[~built] - len(embeddings)]
+    return out
+
+
+def pending_rows(artifacts: SearchArtifacts) -> int:
+    """Rows added or retired since the artifact set was built; what compaction would fold in."""
+    added = len(_added_vectors(artifacts.text_index))
+    retired = 0 if artifacts.live is None else int(len(artifacts.live) - artifacts.live.sum())
+    return added + retired
+
+
+def apply_segment(artifacts: SearchArtifacts, segment: DeltaSegment, seq: int) -> SearchArtifacts:
+    """
+    Artifacts with one segment applied. Upserted products become new rows and
+    retire the live rows with the same product id; deleted ids retire theirs.
+    """
+    return apply_segments(artifacts, [segment], seq)
+
+
+def apply_segments(artifacts: SearchArtifacts, segments: List[DeltaSegment], seq: int) -> SearchArtifacts:
+    """
+    Artifacts with segments applied in order, as one update: the rows are those apply_segment
+    would add one segment at a time, but the catalog, BM25 and FAISS overlays are extended once.
+    """
+    catalog, bm25, attributes = artifacts.catalog, artifacts.bm25, artifacts.attributes
+    live = artifacts.live if artifacts.live is not None else np.ones(len(catalog), dtype=bool)
+    products = [product for segment in segments for product in segment.products]
+
+    # Every changed id retires its live rows; of the new rows, only each id's last upsert stays
+    # live, unless the id was deleted after it
+    last_change = {}
+    row = 0
+    for segment in segments:
+        for product in segment.products:
+            last_change[str(product['product_id'])] = row
+            row += 1
+        for product_id in segment.deleted:
+            last_change[product_id] = None
+    ids = list(last_change)
+    retired = catalog.rows_of(ids) if ids else np.empty(0, dtype=np.int64)
+    retired = retired[live[retired]]
+    added_live = np.zeros(len(products), dtype=bool)
+    added_live[[row for row in last_change.values() if row is not None]] = True
+
+    if products:
+        added = pd.DataFrame(products)
+        retired = np.concatenate([retired, len(catalog) + np.flatnonzero(~added_live)])
+        catalog = catalog.concat(ColumnarCatalog.from_dataframe(added))
+        attributes = attributes.concat(AttributeIndex.from_dataframe(added))
+        bm25 = bm25.add_documents([tokenize_product(product) for product in products])
+    live = np.concatenate([live, added_live])
+    if len(retired):
+        live[retired] = False
+        bm25 = bm25.remove_documents(retired)
+
+    text_vectors = np.concatenate([segment.text_embeddings for segment in segments])
+    img_vectors = np.concatenate([segment.img_embeddings for segment in segments])
+    return artifacts._replace(
+        catalog=catalog,
+        bm25=bm25,
+        attributes=attributes,
+        text_index=DeltaIndex.wrap(artifacts.text_index).with_changes(text_vectors, live),
+        img_index=DeltaIndex.wrap(artifacts.img_index).with_changes(img_vectors, live),
+        live=live,
+        delta_seq=seq
+    )
+
+
+def replay(artifacts: SearchArtifacts) -> SearchArtifacts:
+    """Apply the segments of the set's delta log newer than artifacts.delta_seq, in one update."""
+    log = DeltaLog(artifacts.path)
+    seqs = [seq for seq in log.segments() if seq > artifacts.delta_seq]
+    if not seqs:
+        return artifacts
+    return apply_segments(artifacts, [log.read(seq) for seq in seqs], seqs[-1])
+
+
+def compact(artifacts: SearchArtifacts, output_dir: Path):
+    """
+    Write the live rows of artifacts (delta included) to output_dir as an artifact set whose
+    delta log holds the net changes of the applied segments as history. Embeddings are reused;
+    only the FAISS and BM25 indices are rebuilt.
+    """
+    rows = np.arange(len(artifacts.catalog)) if artifacts.live is None else np.flatnonzero(artifacts.live)
+
+    # Catalog rows are the built rows followed by every product upserted since the set was built, in log order
+    log = DeltaLog(artifacts.path)
+    frames = [pd.read_parquet(artifacts.path / "catalog.parquet")]
+    for seq in log.segments():
+        if compacted_seq(artifacts.metadata) < seq <= artifacts.delta_seq:
+            products = log.read(seq).products
+            if products:
+                frames.append(pd.DataFrame(products))
+    catalog_df = pd.concat(frames, ignore_index=True).iloc[rows].reset_index(drop=True)
+
+    # Kept in the stored dtype (float16 builds stay float16)
+    text_embeddings = np.concatenate([artifacts.text_embeddings,
+                                      _added_vectors(artifacts.text_index).astype(artifacts.text_embeddings.dtype)])[rows]
+    img_embeddings = np.concatenate([artifacts.img_embeddings,
+                                     _added_vectors(artifacts.img_index).astype(artifacts.img_embeddings.dtype)])[rows]
+
+    # Same index type and requested parameters as the set being compacted
+    index_type, index_params = index_config(artifacts.metadata)
+    indices = {name: build_ann_index(embeddings, index_type, **index_params)
+               for name, embeddings in (('text', text_embeddings), ('image', img_embeddings))}
+
+    bm25 = BM25Index.from_tokenized([tokenize_product(row) for row in catalog_df.to_dict('records')])
+
+    metadata = dict(artifacts.metadata)
+    metadata['num_products'] = len(catalog_df)
+    metadata['index'] = {'text': indices['text'][1], 'image': indices['image'][1]}
+    metadata['compacted_from'] = {'version': artifacts.version, 'delta_seq': artifacts.delta_seq}
+
+    save_artifacts(output_dir, indices['text'][0], indices['image'][0], text_embeddings, img_embeddings,
+                   bm25, catalog_df, metadata)
+    # Loading skips the history (compacted_seq), but a rebuild from products.csv rebases it
+    rebase_log(log, DeltaLog(output_dir), through=artifacts.delta_seq)
+    # Exported query encoders do not depend on the catalog
+    if (artifacts.path / ONNX_DIR).is_dir():
+        shutil.copytree(artifacts.path / ONNX_DIR, Path(output_dir) / ONNX_DIR)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Persistent embedding cache for index builds.
+Embeddings are keyed by a content hash of (model name, prepared text or image file bytes), so a
+rebuild only encodes products whose text or image actually changed.
+"""
+
+import os
+import re
+import time
+import hashlib
+import numpy as np
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+
+class EmbeddingCache:
+    """
+    Content-addressed store of one model's embeddings, kept in <cache_dir>/<model>.npz.
+
+    Besides the vectors it records what encoding each entry cost, so a build
+    can report the encoder time its hits saved.
+    """
+
+    def __init__(self, cache_dir, model_name: str):
+        self.model_name = model_name
+        self.path = Path(cache_dir) / f"{re.sub(r'[^A-Za-z0-9._-]', '_', model_name)}.npz"
+        self.keys: List[str] = []
+        self.vectors: Optional[np.ndarray] = None
+        self.costs = np.empty(0, dtype=np.float32)
+        if self.path.exists():
+            with np.load(self.path, allow_pickle=False) as data:
+                self.keys = [key.decode() for key in data['keys'].tolist()]
+                self.vectors = data['vectors']
+                self.costs = data['costs']
+        self.rows: Dict[str, int] = {key: i for i, key in enumerate(self.keys)}
+        self.used = set()
+        self.hits = 0
+        self.misses = 0
+        self.encode_seconds = 0.0
+        self.saved_seconds = 0.0
+        self._added_keys: List[str] = []
+        self._added_vectors: List[np.ndarray] = []
+        self._added_costs: List[float] = []
+        self._dirty = False
+
+    def key(self, content: bytes) -> str:
+        return hashlib.sha256(self.model_name.encode() + b"\0" + content).hexdigest()
+
+    def get_or_encode(self, keys: List[str], encode: Callable[[List[int]], np.ndarray]) -> np.ndarray:
+        """
+        Embeddings for keys, in order. encode(positions) is called once with the
+        positions of the cache misses and must return their embeddings.
+        All-zero rows (failed encodes) are returned but not stored, so they are retried.
+        """
+        if not keys:
+            return np.empty((0, 0), dtype=np.float32)
+        self.used.update(keys)
+        hit_rows = [self.rows.get(key) for key in keys]
+        missing = [i for i, row in enumerate(hit_rows) if row is None]
+        hits = [(i, row) for i, row in enumerate(hit_rows) if row is not None]
+
+        encoded = None
+        if missing:
+            start = time.perf_counter()
+            encoded = np.asarray(encode(missing), dtype=np.float32)
+            seconds = time.perf_counter() - start
+            self.encode_seconds += seconds
+            cost = seconds / len(missing)
+            for i, vector in zip(missing, encoded):
+                if keys[i] not in self.rows and np.any(vector):
+                    self.rows[keys[i]] = len(self.keys) + len(self._added_keys)
+                    self._added_keys.append(keys[i])
+                    self._added_vectors.append(vector)
+                    self._added_costs.append(cost)
+
+        out = None if encoded is None else np.zeros((len(keys), encoded.shape[1]), dtype=np.float32)
+        for i, row in hits:
+            # Entries added earlier in this run are not merged into the stored arrays until save()
+            if row < len(self.keys):
+                vector, cost = self.vectors[row], self.costs[row]
+            else:
+                vector, cost = self._added_vectors[row - len(self.keys)], self._added_costs[row - len(self.keys)]
+            if out is None:
+                out = np.zeros((len(keys), len(vector)), dtype=np.float32)
+            out[i] = vector
+            self.saved_seconds += float(cost)
+        if missing:
+            out[missing] = encoded
+
+        self.hits += len(hits)
+        self.misses += len(missing)
+        return out
+
+    def prune(self) -> int:
+        """Drop entries not requested since this cache was opened; returns how many were dropped."""
+        self._merge()
+        keep = [i for i, key in enumerate(self.keys) if key in self.used]
+        dropped = len(self.keys) - len(keep)
+        if dropped:
+            self.keys = [self.keys[i] for i in keep]
+            self.vectors = self.vectors[keep]
+            self.costs = self.costs[keep]
+            self.rows = {key: i for i, key in enumerate(self.keys)}
+            self._dirty = True
+        return dropped
+
+    def _merge(self):
+        """Fold entries added since loading into the stored arrays."""
+        if not self._added_keys:
+            return
+        added = np.vstack(self._added_vectors)
+        self.vectors = added if self.vectors is None else np.vstack([self.vectors, added])
+        self.costs = np.concatenate([self.costs, np.array(self._added_costs, dtype=np.float32)])
+        self.keys.extend(self._added_keys)
+        self._added_keys, self._added_vectors, self._added_costs = [], [], []
+        self._dirty = True
+
+    def save(self):
+        """Write the cache if it changed (temporary file and rename)."""
+        self._merge()
+        if not self._dirty or self.vectors is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'wb') as f:
+            np.savez(f, keys=np.array(self.keys, dtype='S64'), vectors=self.vectors, costs=self.costs)
+        os.replace(tmp, self.path)
+        self._dirty = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'model': self.model_name,
+            'entries': len(self.keys) + len(self._added_keys),
+            'hits': self.hits,
+            'misses': self.misses,
+            'encode_seconds': round(self.encode_seconds, 3),
+            'saved_seconds': round(self.saved_seconds, 3)
+        }
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Sharded encoding for index builds.
+Inputs are split into contiguous shards, one per worker process; each worker holds its own copy of
+the sentence-transformers models and a pinned torch thread count, and the parent concatenates the
+shard outputs in order.
+"""
+
+import os
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from image_pipeline import ImageManifest, encode_images
+
+# Models loaded by this worker process, by name
+_models: Dict[str, Any] = {}
+
+
+def _init_worker(threads: int):
+    import torch
+    torch.set_num_threads(threads)
+
+
+def _model(name: str):
+    if name not in _models:
+        from sentence_transformers import SentenceTransformer
+        _models[name] = SentenceTransformer(name)
+    return _models[name]
+
+
+def _dimension(name: str) -> int:
+    return _model(name).get_sentence_embedding_dimension()
+
+
+def _encode_texts(name: str, texts: List[str]) -> np.ndarray:
+    return np.asarray(_model(name).encode(texts, show_progress_bar=False), dtype=np.float32)
+
+
+def _encode_images(name: str, paths: List[Path], labels: List[str], dim: int,
+                   batch_size: int, decode_workers: int) -> Tuple[np.ndarray, ImageManifest]:
+    model = _model(name)
+    manifest = ImageManifest()
+    embeddings = encode_images(paths, lambda images: model.encode(images, batch_size=batch_size), dim,
+                               batch_size=batch_size, workers=decode_workers, manifest=manifest, labels=labels)
+    return embeddings, manifest
+
+
+class EncoderPool:
+    """
+    Worker processes that each load the models they are asked for on first use.
+
+    Workers are spawned rather than forked, since torch's thread pools do not
+    survive a fork; threads_per_worker defaults to an even split of the cores.
+    """
+
+    def __init__(self, workers: int, threads_per_worker: Optional[int] = None):
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker, initargs=(self.threads_per_worker,)
+        )
+
+    def shards(self, n: int) -> List[Tuple[int, int]]:
+        """Contiguous (start, end) row ranges, at most one per worker."""
+        bounds = np.linspace(0, n, min(self.workers, n) + 1).astype(int)
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def dimension(self, name: str) -> int:
+        return self.executor.submit(_dimension, name).result()
+
+    def encode_texts(self, name: str, texts: List[str]) -> np.ndarray:
+        futures = [self.executor.submit(_encode_texts, name, texts[start:end]) for start, end in self.shards(len(texts))]
+        return np.vstack([future.result() for future in futures]) if futures else np.empty((0, 0), dtype=np.float32)
+
+    def encode_images(self, name: str, paths: List[Path], labels: List[str], dim: int, batch_size: int,
+                      decode_workers: int, manifest: ImageManifest) -> np.ndarray:
+        """Like image_pipeline.encode_images; shard manifests are merged into manifest in order."""
+        futures = [self.executor.submit(_encode_images, name, paths[start:end], labels[start:end], dim,
+                                        batch_size, decode_workers)
+                   for start, end in self.shards(len(paths))]
+        embeddings = [np.empty((0, dim), dtype=np.float32)]
+        for future in futures:
+            shard_embeddings, shard_manifest = future.result()
+            embeddings.append(shard_embeddings)
+            manifest.merge(shard_manifest)
+        return np.vstack(embeddings)
+
+    def close(self):
+        self.executor.shutdown()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Array-based hybrid score fusion.
+Combines text, image and BM25 scores for a candidate set without per-candidate Python work,
+as a weighted sum or by reciprocal-rank fusion.
+"""
+
+import numpy as np
+from typing import NamedTuple
+
+# How modality scores are combined: their weighted sum, or reciprocal-rank fusion of their rankings
+FUSION_MODES = ('weighted', 'rrf')
+# RRF rank offset; larger values flatten the gap between top ranks
+RRF_K = 60
+
+
+class FusedCandidates(NamedTuple):
+    """Candidates ordered by combined score, with per-modality scores aligned by position."""
+    indices: np.ndarray
+    scores: np.ndarray
+    text_scores: np.ndarray
+    img_scores: np.ndarray
+    kw_scores: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+
+def gather_sparse(candidates: np.ndarray, ids: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """Look up sparse (sorted ids, values) scores for each candidate; absent ids score 0."""
+    out = np.zeros(len(candidates), dtype=np.float64)
+    if len(ids):
+        pos = np.minimum(np.searchsorted(ids, candidates), len(ids) - 1)
+        found = ids[pos] == candidates
+        out[found] = values[pos[found]]
+    return out
+
+
+def top_order(scores: np.ndarray, n: int) -> np.ndarray:
+    """Positions of the n highest scores, best first (ties keep input order)."""
+    n = min(n, len(scores))
+    if n <= 0:
+        return np.empty(0, dtype=np.int64)
+    if n < len(scores):
+        part = np.argpartition(-scores, n - 1)[:n]
+        part.sort()
+    else:
+        part = np.arange(len(scores))
+    return part[np.argsort(-scores[part], kind='stable')]
+
+
+def candidate_rows(num_docs: int, *hit_lists: np.ndarray) -> np.ndarray:
+    """Sorted distinct rows among FAISS-style hit arrays, without -1 padding and out-of-range ids."""
+    hits = np.concatenate([np.asarray(hits, dtype=np.int64).ravel() for hits in hit_lists])
+    return np.unique(hits[(hits >= 0) & (hits < num_docs)])
+
+
+def rrf_scores(rankings, k: int = RRF_K) -> np.ndarray:
+    """
+    Weighted reciprocal-rank fusion of (scores, weight, ranked mask) per modality, all aligned
+    with one candidate array. A candidate earns weight / (k + rank) from every modality that
+    ranks it, ranks being 1-based by descending score; the result is scaled so that a candidate
+    ranked first everywhere scores 1.
+    """
+    fused = np.zeros(len(rankings[0][0]), dtype=np.float64)
+    total = 0.0
+    for scores, weight, ranked in rankings:
+        positions = np.flatnonzero(ranked)
+        order = positions[np.argsort(-scores[positions], kind='stable')]
+        fused[order] += weight / (k + np.arange(1, len(order) + 1))
+        total += weight
+    return fused * (k + 1) / total if total > 0 else fused
+
+
+def combine_scores(candidates: np.ndarray, text_scores: np.ndarray, img_scores: np.ndarray,
+                   kw_scores: np.ndarray, k: int, w_text: float = 0.5, w_img: float = 0.3,
+                   w_kw: float = 0.2, depth: int = None, mode: str = 'weighted') -> FusedCandidates:
+    """
+    Fuse per-modality scores aligned with candidates: their weighted sum, or with mode 'rrf' a
+    weighted reciprocal-rank fusion (candidates without a keyword match are not ranked by BM25).
+    The top `depth` candidates (default k) are returned sorted by combined score.
+    """
+    if mode not in FUSION_MODES:
+        raise ValueError(f"Unknown fusion mode '{mode}', expected one of {FUSION_MODES}")
+    t = np.asarray(text_scores, dtype=np.float64)
+    i = np.asarray(img_scores, dtype=np.float64)
+    kw = np.asarray(kw_scores, dtype=np.float64)
+    if mode == 'rrf':
+        everywhere = np.ones(len(candidates), dtype=bool)
+        combined = rrf_scores([(t, w_text, everywhere), (i, w_img, everywhere), (kw, w_kw, kw > 0)])
+    else:
+        combined = w_text * t + w_img * i + w_kw * kw
+
+    order = top_order(combined, depth if depth is not None else k)
+    return FusedCandidates(candidates[order], combined[order], t[order], i[order], kw[order])
+
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Image decoding and encoding pipeline for index builds and product upserts.
+A thread pool decodes and resizes images ahead of the encoder, which sees them in batches;
+missing and unreadable images are recorded in a manifest and get zero embeddings.
+"""
+
+import json
+import numpy as np
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+from PIL import Image
+
+# Images are resized to the CLIP input resolution before encoding
+IMAGE_SIZE = (224, 224)
+
+
+def load_image(path: Optional[Path]) -> Image.Image:
+    """Decode, convert to RGB and resize; raises FileNotFoundError without a file at path."""
+    if path is None or not path.is_file():
+        raise FileNotFoundError(f"No image file at {path}")
+    with Image.open(path) as image:
+        return image.convert('RGB').resize(IMAGE_SIZE)
+
+
+class ImageManifest:
+    """Images that could not be encoded, with the product they belong to and why."""
+
+    def __init__(self):
+        self.missing: List[Dict[str, Any]] = []
+        self.failed: List[Dict[str, Any]] = []
+        self.encoded = 0
+
+    def add_missing(self, path: Optional[Path], label: Optional[str] = None):
+        self.missing.append({'product_id': label, 'path': '' if path is None else str(path)})
+
+    def add_failed(self, path: Path, error: Exception, label: Optional[str] = None):
+        self.failed.append({'product_id': label, 'path': str(path), 'error': f"{type(error).__name__}: {error}"})
+
+    def merge(self, other: "ImageManifest"):
+        self.missing.extend(other.missing)
+        self.failed.extend(other.failed)
+        self.encoded += other.encoded
+
+    def summary(self) -> Dict[str, int]:
+        return {'encoded': self.encoded, 'missing': len(self.missing), 'failed': len(self.failed)}
+
+    def save(self, path: Path):
+        with open(path, 'w') as f:
+            json.dump({**self.summary(), 'missing_images': self.missing, 'failed_images': self.failed}, f, indent=2)
+
+
+def encode_images(paths: List[Optional[Path]], encode: Callable[[List[Image.Image]], np.ndarray], dim: int,
+                  batch_size: int = 32, workers: int = 4, manifest: Optional[ImageManifest] = None,
+                  labels: Optional[List[str]] = None) -> np.ndarray:
+    """
+    Embeddings of the images at paths, in order; rows of missing (or None) and unreadable images
+    are zero.
+
+    Up to 2 * batch_size images are decoded ahead by `workers` threads (PIL
+    releases the GIL while decoding and resizing) while encode() runs on the
+    previous batch.
+    """
+    manifest = manifest if manifest is not None else ImageManifest()
+    labels = labels if labels is not None else [None] * len(paths)
+    embeddings = np.zeros((len(paths), dim), dtype=np.float32)
+    rows, images = [], []
+
+    def flush():
+        if images:
+            embeddings[rows] = encode(images)
+            manifest.encoded += len(images)
+            rows.clear()
+            images.clear()
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="decode") as pool:
+        todo = iter(range(len(paths)))
+        pending = deque()
+
+        def prefetch():
+            while len(pending) < 2 * batch_size:
+                i = next(todo, None)
+                if i is None:
+                    return
+                pending.append((i, pool.submit(load_image, paths[i])))
+
+        prefetch()
+        while pending:
+            i, future = pending.popleft()
+            prefetch()
+            try:
+                images.append(future.result())
+                rows.append(i)
+            except FileNotFoundError:
+                manifest.add_missing(paths[i], labels[i])
+            except Exception as e:
+                manifest.add_failed(paths[i], e, labels[i])
+            if len(images) >= batch_size:
+                flush()
+        flush()
+
+    return embeddings
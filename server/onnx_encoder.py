@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+ONNX Runtime query encoders.
+build_index.py --export-onnx writes MiniLM and the CLIP text tower as ONNX graphs, with pooling and
+projection folded in, next to the FAISS artifacts. serve.py can then encode queries with
+onnxruntime and the tokenizers library, without torch.
+"""
+
+import json
+import inspect
+import numpy as np
+import onnxruntime as ort
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from tokenizers import Tokenizer
+from artifacts import ONNX_DIR
+
+# Exported query encoders: directory name -> model kind
+ENCODERS = {'text': 'mean_pooling', 'clip_text': 'clip_text'}
+# Export fails if any sample text's ONNX embedding is further than this from the torch one
+MIN_PARITY_COSINE = 0.999
+
+
+class OnnxTextEncoder:
+    """Drop-in for SentenceTransformer.encode on texts, backed by onnxruntime on CPU."""
+
+    def __init__(self, path: Path, threads: Optional[int] = None):
+        path = Path(path)
+        with open(path / "config.json") as f:
+            config = json.load(f)
+        self.tokenizer = Tokenizer.from_file(str(path / "tokenizer.json"))
+        self.tokenizer.enable_truncation(config['max_length'])
+        self.tokenizer.enable_padding(pad_id=config['pad_id'], pad_token=config['pad_token'])
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(str(path / "model.onnx"), options, providers=['CPUExecutionProvider'])
+        self.dim = config['dim']
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def encode(self, texts: List[str], **kwargs) -> np.ndarray:
+        """Unnormalized float32 embeddings, shape (len(texts), dim); kwargs are ignored."""
+        if not texts:
+            return np.empty((0, self.dim), dtype=np.float32)
+        encodings = self.tokenizer.encode_batch(list(texts))
+        feed = {
+            'input_ids': np.array([e.ids for e in encodings], dtype=np.int64),
+            'attention_mask': np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        }
+        return self.session.run(None, feed)[0]
+
+
+def load_encoders(artifacts_path: Path, threads: Optional[int] = None) -> Dict[str, OnnxTextEncoder]:
+    """The exported encoders of an artifact set, by directory name; raises if they were not exported."""
+    onnx_dir = Path(artifacts_path) / ONNX_DIR
+    if not all((onnx_dir / name / "model.onnx").exists() for name in ENCODERS):
+        raise FileNotFoundError(f"No ONNX encoders in {onnx_dir}; build with build_index.py --export-onnx")
+    return {name: OnnxTextEncoder(onnx_dir / name, threads) for name in ENCODERS}
+
+
+def _hf_tokenizer(module):
+    """The fast tokenizer of a sentence-transformers Transformer or CLIPModel module."""
+    tokenizer = getattr(module, 'tokenizer', None) or module.processor
+    return getattr(tokenizer, 'tokenizer', tokenizer)
+
+
+def export_encoder(model, kind: str, out_dir: Path, sample_texts: List[str]) -> Dict[str, Any]:
+    """
+    Export a sentence-transformers text model (kind 'mean_pooling') or the text tower of a
+    sentence-transformers CLIP model (kind 'clip_text') to out_dir and check it against the
+    torch model on sample_texts. Returns the export's metadata, including the parity cosine.
+    """
+    import torch
+
+    module = model[0]
+    hf_model = module.model if kind == 'clip_text' else module.auto_model
+
+    class TextEncoder(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = hf_model
+
+        def forward(self, input_ids, attention_mask):
+            if kind == 'clip_text':
+                features = self.model.get_text_features(input_ids=input_ids, attention_mask=attention_mask)
+                return features if isinstance(features, torch.Tensor) else features.pooler_output
+            tokens = self.model(input_ids=input_ids, attention_mask=attention_mask)[0]
+            mask = attention_mask.unsqueeze(-1).to(tokens.dtype)
+            return (tokens * mask).sum(1) / mask.sum(1).clamp(min=1e-9)
+
+    tokenizer = _hf_tokenizer(module)
+    max_length = getattr(module, 'max_seq_length', None) or tokenizer.model_max_length
+    # Tokenizers without a configured limit report a huge model_max_length
+    model_config = getattr(hf_model.config, 'text_config', hf_model.config)
+    max_length = min(max_length, getattr(model_config, 'max_position_embeddings', max_length))
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    tokenizer.backend_tokenizer.save(str(out_dir / "tokenizer.json"))
+
+    example = tokenizer(sample_texts[:2], padding=True, truncation=True, max_length=max_length, return_tensors='pt')
+    # Recent torch releases default to the dynamo exporter; these models export with the tracing one
+    export_kwargs = {'dynamo': False} if 'dynamo' in inspect.signature(torch.onnx.export).parameters else {}
+    with torch.no_grad():
+        torch.onnx.export(
+            TextEncoder().eval(), (example['input_ids'], example['attention_mask']), str(out_dir / "model.onnx"),
+            input_names=['input_ids', 'attention_mask'], output_names=['embedding'],
+            dynamic_axes={'input_ids': {0: 'batch', 1: 'tokens'}, 'attention_mask': {0: 'batch', 1: 'tokens'},
+                          'embedding': {0: 'batch'}},
+            opset_version=14, **export_kwargs
+        )
+
+    dim = model.get_sentence_embedding_dimension()
+    config = {'kind': kind, 'max_length': int(max_length), 'pad_id': int(tokenizer.pad_token_id),
+              'pad_token': tokenizer.pad_token, 'dim': int(dim)}
+    with open(out_dir / "config.json", 'w') as f:
+        json.dump(config, f, indent=2)
+
+    parity = parity_cosine(model, OnnxTextEncoder(out_dir), sample_texts)
+    if parity < MIN_PARITY_COSINE:
+        raise ValueError(f"ONNX export of {kind} diverges from torch: min cosine {parity:.5f} < {MIN_PARITY_COSINE}")
+    return {**config, 'parity_min_cosine': round(parity, 6)}
+
+
+def parity_cosine(model, encoder: OnnxTextEncoder, texts: List[str]) -> float:
+    """Smallest cosine between the torch and ONNX embeddings of texts."""
+    reference = np.asarray(model.encode(texts), dtype=np.float32)
+    exported = encoder.encode(texts)
+    reference /= np.linalg.norm(reference, axis=1, keepdims=True)
+    exported = exported / np.linalg.norm(exported, axis=1, keepdims=True)
+    return float((reference * exported).sum(axis=1).min())
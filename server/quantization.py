@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Int8 dynamic quantization of the query-time models.
+Weights of nn.Linear layers are stored as int8 and activations are quantized per batch at run time,
+which covers nearly all of the FLOPs and parameters of MiniLM, the CLIP text tower and the
+cross-encoder.
+"""
+
+import torch
+import torch.ao.nn.quantized.dynamic as nnqd
+from typing import Iterable, Optional
+from torch.ao.quantization import quantize_dynamic
+
+
+def quantize_linear_layers(module: torch.nn.Module, names: Optional[Iterable[str]] = None) -> torch.nn.Module:
+    """Swap the Linear layers of module, or only of its submodules called names, for int8 ones in place."""
+    # Only Linear layers are swapped; named submodules would otherwise take their Embeddings along
+    quantize_dynamic(module, set(names) if names else {torch.nn.Linear}, dtype=torch.qint8,
+                     mapping={torch.nn.Linear: nnqd.Linear}, inplace=True)
+    return module
+
+
+def quantize_sentence_transformer(model) -> None:
+    quantize_linear_layers(model)
+
+
+def quantize_clip_text_tower(model) -> None:
+    """
+    Quantize the text side of a sentence-transformers CLIP model only. Queries never go through
+    the vision tower, and product images must keep the embeddings the index was built with.
+    """
+    quantize_linear_layers(model[0].model, ['text_model', 'text_projection'])
+
+
+def quantize_cross_encoder(reranker) -> None:
+    quantize_linear_layers(reranker.model)
@@ -5,25 +5,144 @@ Provides hybrid retrieval with text embeddings, image embeddings, and BM25.
 """
 
 import os
-import json
 import time
-import pickle
+import secrets
+import sys
+import subprocess
+import threading
 import numpy as np
 import pandas as pd
 from pathlib import Path
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any, Optional, Tuple
-import faiss
-from sentence_transformers import SentenceTransformer, CrossEncoder
-from rank_bm25 import BM25Okapi
 from sklearn.preprocessing import normalize
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 import uvicorn
 import warnings
+from fusion import FUSION_MODES, FusedCandidates, candidate_rows, combine_scores, gather_sparse, top_order
+from caches import LRUCache, decode_cursor, encode_cursor, normalize_query
+from bm25_index import BM25Index
+from catalog import ColumnarCatalog, product_text
+from concurrency import BoundedExecutor, ExecutorSaturated, MicroBatcher
+from ann import (INDEX_PARAM_FLAGS, index_config, merge_results, search as ann_search, search_rows,
+                 selector_may_miss_rows)
+from artifacts import ONNX_DIR, ArtifactStore, SearchArtifacts, check_artifacts, load_artifacts
+from image_pipeline import ImageManifest, encode_images
+from attributes import AttributeFilter
+from delta import (DeltaLog, DeltaSegment, apply_segment, compact, embedding_rows, pending_rows, rebase_log,
+                   replay)
 warnings.filterwarnings("ignore")
 
+# Model names
+TEXT_MODEL_NAME = 'all-MiniLM-L6-v2'
+CLIP_MODEL_NAME = 'clip-ViT-B-32'
+RERANKER_MODEL_NAME = 'cross-encoder/ms-marco-MiniLM-L-6-v2'
+
+# Query embedding cache bounds
+EMBEDDING_CACHE_SIZE = 4096
+EMBEDDING_CACHE_TTL = 3600.0
+
+# Search result cache bounds; a stale TTL > 0 serves expired results while refreshing them
+RESULT_CACHE_SIZE = 2048
+RESULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+RESULT_CACHE_TTL = 300.0
+RESULT_CACHE_STALE_TTL = 0.0
+
+# Number of fused candidates passed to the cross-encoder
+RERANK_DEPTH = 40
+
+# Default fusion of the modality scores: "weighted" (w_text * s_text + ...) or "rrf"
+FUSION_MODE = os.environ.get("FUSION_MODE", "weighted")
+# Upper bound on the per-modality candidate depths (text_depth, img_depth, kw_depth)
+MAX_CANDIDATE_DEPTH = 2000
+
+# Cross-encoder score cache bounds, keyed by (normalized query, product id)
+RERANK_CACHE_SIZE = 100_000
+RERANK_CACHE_TTL = 3600.0
+
+# Filters leaving at most this many rows are searched exactly over those rows on HNSW and IVF
+# indices, whose searches behind a very selective ID selector can come back with fewer than k
+# hits; the rows are gathered and scored FILTER_EXACT_CHUNK_ROWS at a time
+FILTER_EXACT_ROWS = int(os.environ.get("FILTER_EXACT_ROWS", 20_000))
+FILTER_EXACT_CHUNK_ROWS = 4096
+
+# Search results with facets=true count facet values over this many top fused candidates
+FACET_DEPTH = int(os.environ.get("FACET_DEPTH", 200))
+MAX_FACET_DEPTH = 2000
+
+# Paginated searches rank this many candidates up front and keep them for later pages, bounded
+# by count, bytes and age (cursors of an evicted or expired list get 410)
+SEARCH_PAGE_DEPTH = int(os.environ.get("SEARCH_PAGE_DEPTH", 200))
+MAX_PAGE_DEPTH = 1000
+PAGE_CACHE_SIZE = 1024
+PAGE_CACHE_MAX_BYTES = 128 * 1024 * 1024
+PAGE_CACHE_TTL = float(os.environ.get("PAGE_CACHE_TTL", 600.0))
+
+# Upper bound on queries accepted by /search/batch
+MAX_BATCH_QUERIES = 1000
+
+# Query encoder micro-batching: when other requests are queued, wait up to this long to share one encode() call
+ENCODE_BATCH_MAX_WAIT_MS = float(os.environ.get("ENCODE_BATCH_MAX_WAIT_MS", 2.0))
+ENCODE_BATCH_MAX_SIZE = int(os.environ.get("ENCODE_BATCH_MAX_SIZE", 64))
+
+# Search worker pool: running calls, waiting calls, and the Retry-After sent once both are full
+SEARCH_WORKERS = int(os.environ.get("SEARCH_WORKERS", 4))
+SEARCH_QUEUE_DEPTH = int(os.environ.get("SEARCH_QUEUE_DEPTH", 32))
+SEARCH_RETRY_AFTER = int(os.environ.get("SEARCH_RETRY_AFTER", 1))
+
+# Map embeddings and FAISS indices read-only instead of copying them to the heap, so uvicorn
+# workers on one host share a single page-cache copy
+MMAP_ARTIFACTS = os.environ.get("MMAP_ARTIFACTS", "0") == "1"
+
+# Background rebuilds: artifact versions kept on disk, build output lines kept for /rebuild/status,
+# and how often each worker checks for a version published elsewhere
+BUILD_SCRIPT = Path(__file__).parent / "build_index.py"
+REBUILD_KEEP_VERSIONS = int(os.environ.get("REBUILD_KEEP_VERSIONS", 3))
+REBUILD_LOG_LINES = 20
+ARTIFACT_POLL_INTERVAL = float(os.environ.get("ARTIFACT_POLL_INTERVAL", 5.0))
+# Encoder processes used by background builds (build_index.py --workers)
+REBUILD_WORKERS = int(os.environ.get("REBUILD_WORKERS", 1))
+# Encoded and searched against a new artifact set before it replaces the live one
+VALIDATION_QUERY = "black dress"
+
+# Load models and artifacts at startup instead of on the first search, then run the warm-up
+# queries through the whole pipeline; /readyz fails until both are done
+EAGER_LOAD = os.environ.get("EAGER_LOAD", "0") == "1"
+WARMUP_QUERIES = ["black dress", "vintage linen shirt with short sleeves", "wool coat"]
+# Int8 dynamic quantization of MiniLM, the CLIP text tower and the cross-encoder (CPU only)
+QUANTIZE_MODELS = os.environ.get("QUANTIZE_MODELS", "0") == "1"
+
+# Query encoders: "torch" (sentence-transformers) or "onnx" (onnxruntime, needs a build with
+# --export-onnx); the onnx backend imports torch only for the reranker and product image upserts
+ENCODER_BACKEND = os.environ.get("ENCODER_BACKEND", "torch")
+# The cross-encoder is optional; without it rerank requests return fused scores
+LOAD_RERANKER = os.environ.get("LOAD_RERANKER", "1") == "1"
+
+# Loaded concurrently by load_models, reported with their load times by /readyz
+LOAD_COMPONENTS = ('text_model', 'clip_model', 'reranker', 'artifacts')
+
+# Incremental product updates are folded into a new artifact version once this many rows were
+# added or retired since the last build (0 disables automatic compaction)
+DELTA_COMPACT_ROWS = int(os.environ.get("DELTA_COMPACT_ROWS", 10_000))
+# Product image_path values are relative to public/; images per CLIP call and decoding threads
+PUBLIC_DIR = Path(__file__).parent.parent / "public"
+IMAGE_BATCH_SIZE = 32
+IMAGE_WORKERS = 4
+
 # Request/Response models
+class SearchFilters(BaseModel):
+    """Applied before ranking; each list matches any of its values (case-insensitive)."""
+    price_min: Optional[float] = None
+    price_max: Optional[float] = None
+    color: Optional[List[str]] = None
+    material: Optional[List[str]] = None
+    size: Optional[List[str]] = None
+    store: Optional[List[str]] = None
+
 class SearchRequest(BaseModel):
     query: str
     k: int = 20
@@ -31,6 +150,22 @@ class SearchRequest(BaseModel):
     w_img: float = 0.3
     w_kw: float = 0.2
     rerank: bool = True
+    # ANN query-time knobs, ignored by index types they do not apply to
+    nprobe: Optional[int] = None
+    ef_search: Optional[int] = None
+    filters: Optional[SearchFilters] = None
+    # Facet counts over the top facet_depth candidates (default FACET_DEPTH)
+    facets: bool = False
+    facet_depth: Optional[int] = None
+    # Return k results plus a next_cursor into page_depth ranked results (default SEARCH_PAGE_DEPTH)
+    paginate: bool = False
+    page_depth: Optional[int] = None
+    # "weighted" or "rrf"; candidates are the top text_depth / img_depth / kw_depth hits of each
+    # modality (default k each), all scored exactly in every modality
+    fusion: str = FUSION_MODE
+    text_depth: Optional[int] = None
+    img_depth: Optional[int] = None
+    kw_depth: Optional[int] = None
 
 class SearchResult(BaseModel):
     product_id: str
@@ -46,14 +181,75 @@ class SearchResult(BaseModel):
     score_kw: float
     why_chips: List[str]
 
+class PriceBucket(BaseModel):
+    price_min: float
+    # Exclusive; None for the open top bucket
+    price_max: Optional[float]
+    count: int
+
+class SearchFacets(BaseModel):
+    """Products per value among the top candidates, most frequent first."""
+    color: Dict[str, int]
+    material: Dict[str, int]
+    size: Dict[str, int]
+    price: List[PriceBucket]
+    depth: int
+
 class SearchResponse(BaseModel):
     results: List[SearchResult]
     total_time: float
     num_results: int
+    facets: Optional[SearchFacets] = None
+    # Paginated searches: pass to GET /search/next for the following page; None on the last page
+    next_cursor: Optional[str] = None
+
+class SearchBatchRequest(BaseModel):
+    queries: List[str]
+    k: int = 20
+    w_text: float = 0.5
+    w_img: float = 0.3
+    w_kw: float = 0.2
+    rerank: bool = True
+    nprobe: Optional[int] = None
+    ef_search: Optional[int] = None
+    # Applied to every query of the batch
+    filters: Optional[SearchFilters] = None
+    facets: bool = False
+    facet_depth: Optional[int] = None
+    fusion: str = FUSION_MODE
+    text_depth: Optional[int] = None
+    img_depth: Optional[int] = None
+    kw_depth: Optional[int] = None
+
+class SearchBatchResponse(BaseModel):
+    responses: List[SearchResponse]
+    total_time: float
+    num_queries: int
 
 class AugmentRequest(BaseModel):
     count: int = 10
-    rebuild: bool = True
+    # Augmented products are searchable right away; a rebuild only re-embeds the whole catalog
+    rebuild: bool = False
+
+class Product(BaseModel):
+    product_id: str
+    title: str
+    description: Optional[str] = None
+    tags: Optional[str] = None
+    color: Optional[str] = None
+    material: Optional[str] = None
+    sizes: Optional[str] = None
+    price: int = 0
+    image_path: Optional[str] = None
+    image_paths: Optional[str] = None
+    source_url: Optional[str] = None
+    store: Optional[str] = None
+
+class UpsertProductsRequest(BaseModel):
+    products: List[Product]
+
+class DeleteProductsRequest(BaseModel):
+    product_ids: List[str]
 
 class EvaluateRequest(BaseModel):
     queries: List[str]
@@ -65,60 +261,107 @@ class EvaluateResponse(BaseModel):
     ndcg_at_10: float
     zero_result_rate: float
     total_queries: int
+    latency_p50_ms: float
+    latency_p99_ms: float
+    quantized: bool
 
 class SemanticSearchEngine:
-    def __init__(self, artifacts_dir: str = "artifacts"):
-        self.artifacts_dir = Path(artifacts_dir)
+    def __init__(self, artifacts_dir: str = "artifacts",
+                 embedding_cache_size: int = EMBEDDING_CACHE_SIZE,
+                 embedding_cache_ttl: float = EMBEDDING_CACHE_TTL,
+                 result_cache_size: int = RESULT_CACHE_SIZE,
+                 result_cache_max_bytes: int = RESULT_CACHE_MAX_BYTES,
+                 result_cache_ttl: float = RESULT_CACHE_TTL,
+                 result_cache_stale_ttl: float = RESULT_CACHE_STALE_TTL,
+                 encode_batch_max_wait_ms: float = ENCODE_BATCH_MAX_WAIT_MS,
+                 encode_batch_max_size: int = ENCODE_BATCH_MAX_SIZE,
+                 rerank_cache_size: int = RERANK_CACHE_SIZE,
+                 rerank_cache_ttl: float = RERANK_CACHE_TTL,
+                 mmap_artifacts: bool = MMAP_ARTIFACTS,
+                 eager_load: bool = EAGER_LOAD,
+                 quantize: bool = QUANTIZE_MODELS,
+                 encoder_backend: str = ENCODER_BACKEND,
+                 use_reranker: bool = LOAD_RERANKER):
+        self.store = ArtifactStore(artifacts_dir)
+        self.mmap_artifacts = mmap_artifacts
         self.models_loaded = False
-        self.catalog = None
-        self.text_index = None
-        self.img_index = None
-        self.bm25 = None
-        self.text_embeddings = None
-        self.img_embeddings = None
+        # Startup loading: seconds taken per component (and 'warmup'), and components that failed
+        self.eager_load = eager_load
+        self.load_times: Dict[str, float] = {}
+        self.load_errors: Dict[str, str] = {}
+        self.warmed_up = False
+        # Indices, embeddings, BM25, catalog and metadata of the served version, swapped as a whole
+        self.artifacts: Optional[SearchArtifacts] = None
         self.text_model = None
         self.clip_model = None
         self.reranker = None
-        self.metadata = {}
+        self.quantize = quantize
+        self.encoder_backend = encoder_backend
+        self.use_reranker = use_reranker
+        # Full CLIP model for product images when the query encoders are ONNX graphs
+        self._image_model = None
+        # (model name, normalized query) -> normalized float32 embedding
+        self.embedding_cache = LRUCache(embedding_cache_size, embedding_cache_ttl)
+        # Result cache keys include the index generation, bumped whenever indices or catalog change
+        self.index_generation = 0
+        self.result_cache = LRUCache(result_cache_size, result_cache_ttl,
+                                     max_bytes=result_cache_max_bytes, stale_ttl=result_cache_stale_ttl)
+        # (normalized query, product id) -> raw cross-encoder score
+        self.rerank_cache = LRUCache(rerank_cache_size, rerank_cache_ttl)
+        # Pagination list id -> ranked results; kept across index changes, so every page of a
+        # search comes from the same ranking
+        self.page_cache = LRUCache(PAGE_CACHE_SIZE, PAGE_CACHE_TTL, max_bytes=PAGE_CACHE_MAX_BYTES)
+        self._refreshing = set()
+        self._refresh_lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        # Held while loading, validating and installing a new artifact version
+        self._swap_lock = threading.Lock()
+        self._last_version_check = 0.0
+        self._rebuild_lock = threading.Lock()
+        self.rebuild_state: Dict[str, Any] = {'state': 'idle'}
+        # One micro-batcher per query encoder, keyed by model name
+        self.encoders = {
+            name: MicroBatcher(
+                lambda texts, attr=attr: normalize(getattr(self, attr).encode(texts), axis=1).astype('float32'),
+                max_batch_size=encode_batch_max_size,
+                max_wait=encode_batch_max_wait_ms / 1000,
+                name=f"encode-{name}"
+            )
+            for name, attr in ((TEXT_MODEL_NAME, 'text_model'), (CLIP_MODEL_NAME, 'clip_model'))
+        }
         
     def load_models(self):
         """Load all models and indices."""
+        # Concurrent first requests must not load everything twice
+        with self._load_lock:
+            self._load_models()
+    
+    def _load_models(self):
         if self.models_loaded:
             return
             
         print("Loading models and indices...")
         
+        self.load_errors.clear()
         try:
-            # Load models
-            self.text_model = SentenceTransformer('all-MiniLM-L6-v2')
-            self.clip_model = SentenceTransformer('clip-ViT-B-32')
+            # Models and artifacts are independent, and loading them is mostly file reads and
+            # tensor copies that release the GIL, so they load side by side
+            loaders = {
+                'text_model': self._load_text_model,
+                'clip_model': self._load_clip_model,
+                'reranker': self._load_reranker,
+                'artifacts': self._load_served_artifacts
+            }
+            with ThreadPoolExecutor(max_workers=len(loaders), thread_name_prefix="load") as pool:
+                futures = {name: pool.submit(self._timed, name, loader) for name, loader in loaders.items()}
+                loaded = {name: future.result() for name, future in futures.items()}
+            self.text_model = loaded['text_model']
+            self.clip_model = loaded['clip_model']
+            self.reranker = loaded['reranker']
             
-            # Optional reranker
-            try:
-                self.reranker = CrossEncoder('cross-encoder/ms-marco-MiniLM-L-6-v2')
-                print("Reranker loaded successfully")
-            except Exception as e:
-                print(f"Warning: Could not load reranker: {e}")
-                self.reranker = None
-            
-            # Load indices
-            self.text_index = faiss.read_index(str(self.artifacts_dir / "text.index"))
-            self.img_index = faiss.read_index(str(self.artifacts_dir / "img.index"))
-            
-            # Load embeddings
-            self.text_embeddings = np.load(str(self.artifacts_dir / "E_text.npy"))
-            self.img_embeddings = np.load(str(self.artifacts_dir / "E_img.npy"))
-            
-            # Load BM25
-            with open(self.artifacts_dir / "bm25.pkl", 'rb') as f:
-                self.bm25 = pickle.load(f)
-            
-            # Load catalog
-            self.catalog = pd.read_parquet(self.artifacts_dir / "catalog.parquet")
-            
-            # Load metadata
-            with open(self.artifacts_dir / "metadata.json", 'r') as f:
-                self.metadata = json.load(f)
+            # Embeddings and scores from previously loaded models are no longer valid
+            self.embedding_cache.clear()
+            self.rerank_cache.clear()
             
             self.models_loaded = True
             print("All models and indices loaded successfully!")
@@ -127,187 +370,728 @@ class SemanticSearchEngine:
             print(f"Error loading models: {e}")
             raise HTTPException(status_code=500, detail=f"Failed to load models: {str(e)}")
     
+    def _timed(self, name: str, fn):
+        """Run one startup step, recording its duration or error under name."""
+        start = time.perf_counter()
+        try:
+            result = fn()
+        except Exception as e:
+            self.load_errors[name] = str(e)
+            raise
+        self.load_times[name] = round(time.perf_counter() - start, 3)
+        return result
+    
+    def _load_text_model(self):
+        if self.encoder_backend == 'onnx':
+            return self._load_onnx_encoder('text')
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(TEXT_MODEL_NAME)
+        if self.quantize:
+            # Product texts embedded by upserts then come from the int8 model too (cosine ~0.99
+            # to the fp32 build); rebuilds re-embed them in fp32
+            from quantization import quantize_sentence_transformer
+            quantize_sentence_transformer(model)
+        return model
+    
+    def _load_clip_model(self):
+        if self.encoder_backend == 'onnx':
+            return self._load_onnx_encoder('clip_text')
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(CLIP_MODEL_NAME)
+        if self.quantize:
+            from quantization import quantize_clip_text_tower
+            quantize_clip_text_tower(model)
+        return model
+    
+    def _load_onnx_encoder(self, name: str):
+        """An encoder exported with the published version; the models are the same in every version."""
+        from onnx_encoder import OnnxTextEncoder
+        return OnnxTextEncoder(self.store.current_path() / ONNX_DIR / name)
+    
+    def _load_reranker(self):
+        """The optional cross-encoder; search works without it."""
+        if not self.use_reranker:
+            return None
+        try:
+            from sentence_transformers import CrossEncoder
+            reranker = CrossEncoder(RERANKER_MODEL_NAME)
+            if self.quantize:
+                from quantization import quantize_cross_encoder
+                quantize_cross_encoder(reranker)
+            print("Reranker loaded successfully")
+            return reranker
+        except Exception as e:
+            print(f"Warning: Could not load reranker: {e}")
+            self.load_errors['reranker'] = str(e)
+            return None
+    
+    def _load_served_artifacts(self):
+        """Load the published version plus the product updates logged against it since it was built."""
+        with self._swap_lock:
+            version = self.store.current_version()
+            self.artifacts = replay(load_artifacts(self.store.current_path(), version, mmap=self.mmap_artifacts))
+            self._last_version_check = time.monotonic()
+    
+    def warm_up(self):
+        """
+        Run WARMUP_QUERIES through encoding, both FAISS searches, BM25 and the reranker, one at a
+        time and as one batch, so the first real requests do not pay for allocator and kernel
+        initialization. Bypasses the result cache.
+        """
+        def run():
+            for query in WARMUP_QUERIES:
+                self._search_uncached([query], 20, 0.5, 0.3, 0.2, True)
+            self._search_uncached(WARMUP_QUERIES, 20, 0.5, 0.3, 0.2, True)
+        self._timed('warmup', run)
+        self.warmed_up = True
+    
+    def start_up(self):
+        """Eager startup: load everything, then warm up; failures are reported by /readyz."""
+        try:
+            self.load_models()
+            self.warm_up()
+            print(f"Ready: {self.load_times}")
+        except Exception as e:
+            print(f"Startup failed: {getattr(e, 'detail', e)}")
+    
+    def readiness(self) -> Dict[str, Any]:
+        """Whether to route traffic here, with the load state and time of each component."""
+        components = {}
+        for name in LOAD_COMPONENTS + ('warmup',):
+            status = 'failed' if name in self.load_errors else 'loaded' if name in self.load_times else 'pending'
+            components[name] = {'status': status, 'seconds': self.load_times.get(name)}
+            if name in self.load_errors:
+                components[name]['error'] = self.load_errors[name]
+        # Lazy servers load on the first search, so they take traffic right away
+        ready = self.models_loaded and self.warmed_up if self.eager_load else True
+        return {'ready': ready, 'eager_load': self.eager_load, 'models_loaded': self.models_loaded,
+                'components': components}
+    
     def search(self, query: str, k: int = 20, w_text: float = 0.5, 
-               w_img: float = 0.3, w_kw: float = 0.2, rerank: bool = True) -> SearchResponse:
+               w_img: float = 0.3, w_kw: float = 0.2, rerank: bool = True,
+               nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+               filters: Optional[Dict[str, Any]] = None, facet_depth: Optional[int] = None,
+               fusion: str = FUSION_MODE, text_depth: Optional[int] = None, img_depth: Optional[int] = None,
+               kw_depth: Optional[int] = None) -> SearchResponse:
         """Perform hybrid semantic search."""
+        return self.search_many([query], k, w_text, w_img, w_kw, rerank, nprobe, ef_search, filters,
+                                facet_depth, fusion, text_depth, img_depth, kw_depth)[0]
+    
+    def search_many(self, queries: List[str], k: int = 20, w_text: float = 0.5,
+                    w_img: float = 0.3, w_kw: float = 0.2, rerank: bool = True,
+                    nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                    filters: Optional[Dict[str, Any]] = None,
+                    facet_depth: Optional[int] = None, fusion: str = FUSION_MODE,
+                    text_depth: Optional[int] = None, img_depth: Optional[int] = None,
+                    kw_depth: Optional[int] = None) -> List[SearchResponse]:
+        """
+        Perform hybrid semantic search for several queries with shared encoding and FAISS passes.
+        filters (SearchFilters fields) restrict every query to matching products; with a
+        facet_depth, responses carry facet counts over that many top candidates. Candidates are
+        the top text_depth, img_depth and kw_depth hits of each modality (default k).
+        """
+        if facet_depth is not None and not 0 < facet_depth <= MAX_FACET_DEPTH:
+            raise HTTPException(status_code=400, detail=f"facet_depth must be between 1 and {MAX_FACET_DEPTH}")
+        if fusion not in FUSION_MODES:
+            raise HTTPException(status_code=400, detail=f"fusion must be one of {FUSION_MODES}")
+        if not 0 < k <= MAX_CANDIDATE_DEPTH:
+            raise HTTPException(status_code=400, detail=f"k must be between 1 and {MAX_CANDIDATE_DEPTH}")
+        text_depth, img_depth, kw_depth = (k if depth is None else depth for depth in (text_depth, img_depth, kw_depth))
+        if not (0 < text_depth <= MAX_CANDIDATE_DEPTH and 0 < img_depth <= MAX_CANDIDATE_DEPTH
+                and 0 <= kw_depth <= MAX_CANDIDATE_DEPTH):
+            raise HTTPException(status_code=400, detail=f"text_depth and img_depth must be between 1 and "
+                                                        f"{MAX_CANDIDATE_DEPTH}, kw_depth between 0 and {MAX_CANDIDATE_DEPTH}")
         if not self.models_loaded:
             self.load_models()
         
+        if not queries:
+            return []
+        
+        self._follow_published()
         start_time = time.time()
+        options = (k, w_text, w_img, w_kw, rerank, nprobe, ef_search, AttributeFilter.from_dict(filters),
+                   facet_depth, fusion, text_depth, img_depth, kw_depth)
+        keys = [self._result_key(query, *options) for query in queries]
+        responses = [None] * len(queries)
+        pending = []
+        
+        for i, key in enumerate(keys):
+            entry = self.result_cache.get_stale(key)
+            if entry is None:
+                pending.append(i)
+                continue
+            response, stale = entry
+            responses[i] = response.model_copy(update={'total_time': time.time() - start_time})
+            if stale:
+                self._schedule_refresh(key, queries[i], *options)
         
+        if pending:
+            computed = self._search_uncached([queries[i] for i in pending], *options)
+            for i, response in zip(pending, computed):
+                self.result_cache.put(keys[i], response, size=len(response.model_dump_json()))
+                responses[i] = response
+        
+        return responses
+    
+    def search_page(self, query: str, k: int = 20, page_depth: int = SEARCH_PAGE_DEPTH,
+                    **options) -> SearchResponse:
+        """
+        First page of a paginated search. The query is ranked page_depth deep once (as a search
+        with k=page_depth, so through the result cache); later pages are slices of that ranking
+        served by next_page() from the cursor in the response.
+        """
+        if not 0 < k <= page_depth <= MAX_PAGE_DEPTH:
+            raise HTTPException(status_code=400, detail=f"Need 0 < k <= page_depth <= {MAX_PAGE_DEPTH}")
+        start_time = time.time()
+        ranked = self.search(query, page_depth, **options)
+        list_id = None
+        if len(ranked.results) > k:
+            list_id = secrets.token_urlsafe(12)
+            self.page_cache.put(list_id, ranked.results, size=len(ranked.model_dump_json()))
+        return self._page(list_id, ranked.results, 0, k, start_time, facets=ranked.facets)
+    
+    def next_page(self, cursor: str, k: int = 20) -> SearchResponse:
+        """The k results after a cursor from search_page() or a previous page."""
+        start_time = time.time()
+        if k <= 0:
+            raise HTTPException(status_code=400, detail="k must be positive")
         try:
-            # Encode query
-            query_text_embedding = self.text_model.encode([query])
-            query_text_embedding = normalize(query_text_embedding, axis=1)[0]
-            
-            # CLIP text-to-image embedding
-            query_img_embedding = self.clip_model.encode([query])
-            query_img_embedding = normalize(query_img_embedding, axis=1)[0]
-            
-            # Text search
-            text_scores, text_indices = self.text_index.search(
-                query_text_embedding.reshape(1, -1).astype('float32'), k
-            )
-            text_scores = text_scores[0]
-            text_indices = text_indices[0]
-            
-            # Image search
-            img_scores, img_indices = self.img_index.search(
-                query_img_embedding.reshape(1, -1).astype('float32'), k
+            list_id, offset = decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        results = self.page_cache.get(list_id)
+        if results is None:
+            raise HTTPException(status_code=410, detail="Cursor expired, repeat the search")
+        return self._page(list_id, results, offset, k, start_time)
+    
+    @staticmethod
+    def _page(list_id: Optional[str], results: List[SearchResult], offset: int, k: int, start_time: float,
+              facets: Optional[SearchFacets] = None) -> SearchResponse:
+        page = results[offset:offset + k]
+        end = offset + len(page)
+        return SearchResponse(
+            results=page,
+            total_time=time.time() - start_time,
+            num_results=len(page),
+            facets=facets,
+            next_cursor=encode_cursor(list_id, end) if list_id and end < len(results) else None
+        )
+    
+    def bump_index_generation(self):
+        """Invalidate cached results after the indices or catalog changed."""
+        self.index_generation += 1
+        self.result_cache.clear()
+        # Product passages may have changed
+        self.rerank_cache.clear()
+    
+    def start_rebuild(self) -> Dict[str, Any]:
+        """Build a new artifact version in the background; the current one keeps serving meanwhile."""
+        return self._start_build('rebuild', self._run_rebuild)
+    
+    def start_compaction(self) -> Dict[str, Any]:
+        """Fold logged product updates into a new artifact version in the background."""
+        return self._start_build('compaction', self._run_compaction)
+    
+    def _start_build(self, kind: str, target) -> Dict[str, Any]:
+        with self._rebuild_lock:
+            if self.rebuild_state['state'] in ('building', 'validating'):
+                raise HTTPException(status_code=409, detail=f"A {self.rebuild_state['kind']} is already running")
+            version = self.store.new_version()
+            self.rebuild_state = {
+                'kind': kind,
+                'state': 'building',
+                'version': version,
+                'phase': 'starting',
+                'started_at': time.time(),
+                'log': []
+            }
+        threading.Thread(target=target, args=(version,), name=kind, daemon=True).start()
+        return self.rebuild_status()
+    
+    def rebuild_status(self) -> Dict[str, Any]:
+        with self._rebuild_lock:
+            status = dict(self.rebuild_state)
+        status['serving_version'] = self.artifacts.version if self.artifacts else None
+        return status
+    
+    def _update_rebuild(self, **fields):
+        with self._rebuild_lock:
+            self.rebuild_state.update(fields)
+    
+    def _run_rebuild(self, version: str):
+        """Build into the version directory, validate it, then publish and swap it in."""
+        log = deque(maxlen=REBUILD_LOG_LINES)
+        try:
+            if not self.models_loaded:
+                self.load_models()
+            # Keep the index configuration and embedding storage currently served
+            index_type, index_params = index_config(self.artifacts.metadata)
+            embedding_dtype = self.artifacts.metadata.get('embedding_dtype', 'float32')
+            # The build runs from the script's directory, so the output path must not be relative to ours
+            output_dir = self.store.version_path(version).resolve()
+            proc = subprocess.Popen(
+                [sys.executable, "-u", str(BUILD_SCRIPT), "--output-dir", str(output_dir),
+                 "--index-type", index_type, "--embedding-dtype", embedding_dtype, "--workers", str(REBUILD_WORKERS)]
+                + [arg for key, value in index_params.items() for arg in (INDEX_PARAM_FLAGS[key], str(value))]
+                + (["--export-onnx"] if self.encoder_backend == 'onnx' else []),
+                cwd=BUILD_SCRIPT.parent, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
             )
-            img_scores = img_scores[0]
-            img_indices = img_indices[0]
+            # Text mode splits progress-bar redraws (\r) into lines too
+            for line in proc.stdout:
+                line = line.strip()
+                if line:
+                    log.append(line)
+                    self._update_rebuild(phase=line, log=list(log))
+            if proc.wait() != 0:
+                raise RuntimeError(f"build_index.py exited with code {proc.returncode}")
             
-            # BM25 search
-            bm25_scores = self.bm25.get_scores(query.lower().split())
-            bm25_scores = np.array(bm25_scores)
-            # Normalize BM25 scores to 0-1
-            if bm25_scores.max() > 0:
-                bm25_scores = bm25_scores / bm25_scores.max()
+            # products.csv never sees changes made through /products; the served log holds all of them
+            # (compactions keep theirs as history) and is rebased onto the build
+            self._publish_build(version, from_served=True)
+        except Exception as e:
+            print(f"Rebuild {version} failed: {e}")
+            self.store.discard(version)
+            self._update_rebuild(state='failed', error=str(e), finished_at=time.time())
+    
+    def _run_compaction(self, version: str):
+        """Write the served set with its delta applied as a new version; nothing is re-embedded."""
+        try:
+            if not self.models_loaded:
+                self.load_models()
+            source = self.artifacts
+            self._update_rebuild(phase=f"compacting {pending_rows(source)} changed rows")
+            compact(source, self.store.version_path(version))
+            self._publish_build(version, source=source)
+        except Exception as e:
+            print(f"Compaction {version} failed: {e}")
+            self.store.discard(version)
+            self._update_rebuild(state='failed', error=str(e), finished_at=time.time())
+    
+    def _publish_build(self, version: str, source: Optional[SearchArtifacts] = None, from_served: bool = False):
+        """
+        Carry pending product updates over to a built version, validate it, then publish and swap it
+        in. Updates are the served set's delta log rebased onto the build (from_served) or those
+        logged after source.
+        """
+        self._update_rebuild(state='validating', phase='validating new artifacts')
+        with self._swap_lock:
+            target_path = self.store.version_path(version)
+            if from_served:
+                # Only the net changes the build does not already have, as one segment
+                source = self.artifacts
+                after = rebase_log(DeltaLog(source.path), DeltaLog(target_path),
+                                   built=pd.read_parquet(target_path / "catalog.parquet"))
+            else:
+                after = source.delta_seq
+            DeltaLog(source.path).copy_to(DeltaLog(target_path), after=after)
+            artifacts = self._load_validated(version)
+            self.store.publish(version)
+            # Segments other workers logged to the previous set meanwhile
+            DeltaLog(source.path).copy_to(DeltaLog(target_path), after=after)
+            self._install_artifacts(artifacts)
+        self.store.prune(REBUILD_KEEP_VERSIONS)
+        num_products = self._num_products(artifacts)
+        self._update_rebuild(state='succeeded', phase='serving new artifacts',
+                             finished_at=time.time(), num_products=num_products)
+        print(f"{self.rebuild_state['kind'].capitalize()} {version} is now serving {num_products} products")
+    
+    def _load_validated(self, version: str) -> SearchArtifacts:
+        """Load an artifact version and check it is complete and searchable with the loaded models."""
+        artifacts = load_artifacts(self.store.version_path(version), version, mmap=self.mmap_artifacts)
+        check_artifacts(artifacts)
+        artifacts = replay(artifacts)
+        for index, embeddings in zip((artifacts.text_index, artifacts.img_index),
+                                     self._encode_queries([VALIDATION_QUERY])):
+            if index.d != embeddings.shape[1]:
+                raise ValueError(f"Index dimension {index.d} does not match encoder dimension {embeddings.shape[1]}")
+            ann_search(index, embeddings, 1)
+        return artifacts
+    
+    def _install_artifacts(self, artifacts: SearchArtifacts):
+        """Serve from artifacts from now on; searches already running finish on the previous set."""
+        self.artifacts = artifacts
+        self.bump_index_generation()
+    
+    def _follow_published(self):
+        """
+        Switch to a version published by another worker or an offline build, and apply product
+        updates other workers logged, checked every few seconds.
+        """
+        now = time.monotonic()
+        if now - self._last_version_check < ARTIFACT_POLL_INTERVAL or self._swap_lock.locked():
+            return
+        self._last_version_check = now
+        if (self.store.current_version() not in (None, self.artifacts.version)
+                or DeltaLog(self.artifacts.path).last_seq() > self.artifacts.delta_seq):
+            threading.Thread(target=self._install_published, daemon=True).start()
+    
+    def _install_published(self):
+        with self._swap_lock:
+            try:
+                self._catch_up()
+            except Exception as e:
+                print(f"Could not switch to artifact version {self.store.current_version()}: {e}")
+    
+    def _catch_up(self):
+        """Install the published version and delta segments logged elsewhere (caller holds the swap lock)."""
+        version = self.store.current_version()
+        if version not in (None, self.artifacts.version):
+            self._install_artifacts(self._load_validated(version))
+            print(f"Switched to artifact version {version}")
+        artifacts = replay(self.artifacts)
+        if artifacts is not self.artifacts:
+            self._install_artifacts(artifacts)
+    
+    @staticmethod
+    def _num_products(artifacts: SearchArtifacts) -> int:
+        return len(artifacts.catalog) if artifacts.live is None else int(artifacts.live.sum())
+    
+    def upsert_products(self, products: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Add products or replace them by product_id. Only these products are embedded."""
+        if not self.models_loaded:
+            self.load_models()
+        
+        # The last record of a repeated id wins
+        products = list({str(product['product_id']): product for product in products}.values())
+        if not products:
+            return {"upserted": 0, "total_products": self._num_products(self.artifacts)}
+        
+        text_embeddings, img_embeddings, manifest = self._encode_products(products)
+        artifacts = self._apply_update(DeltaSegment(products, text_embeddings, img_embeddings, []))
+        return {
+            "upserted": len(products),
+            "total_products": self._num_products(artifacts),
+            "delta_seq": artifacts.delta_seq,
+            "pending_rows": pending_rows(artifacts),
+            "missing_images": manifest.missing,
+            "failed_images": manifest.failed
+        }
+    
+    def delete_products(self, product_ids: List[str]) -> Dict[str, Any]:
+        """Remove products from search by product_id."""
+        if not self.models_loaded:
+            self.load_models()
+        
+        artifacts = self.artifacts
+        rows = artifacts.catalog.rows_of(product_ids) if product_ids else np.empty(0, dtype=np.int64)
+        if artifacts.live is not None:
+            rows = rows[artifacts.live[rows]]
+        found = set(artifacts.catalog.ids_for(rows))
+        
+        if found:
+            empty_text = np.empty((0, artifacts.text_index.d), dtype='float32')
+            empty_img = np.empty((0, artifacts.img_index.d), dtype='float32')
+            artifacts = self._apply_update(DeltaSegment([], empty_text, empty_img, sorted(found)))
+        return {
+            "deleted": len(found),
+            "not_found": [product_id for product_id in product_ids if product_id not in found],
+            "total_products": self._num_products(artifacts),
+            "delta_seq": artifacts.delta_seq,
+            "pending_rows": pending_rows(artifacts)
+        }
+    
+    def _apply_update(self, segment: DeltaSegment) -> SearchArtifacts:
+        """Apply a segment to the served set, append it to the set's delta log and swap it in."""
+        with self._swap_lock:
+            # Apply other workers' segments first, so every worker assigns rows in log order
+            self._catch_up()
+            artifacts = self.artifacts
+            log = DeltaLog(artifacts.path)
+            while True:
+                updated = apply_segment(artifacts, segment, artifacts.delta_seq + 1)
+                if log.write(updated.delta_seq, segment):
+                    break
+                artifacts = replay(artifacts)
+            self._install_artifacts(updated)
+        
+        if DELTA_COMPACT_ROWS > 0 and pending_rows(updated) >= DELTA_COMPACT_ROWS:
+            try:
+                self.start_compaction()
+            except HTTPException:
+                # A rebuild or compaction is already running and carries the log over
+                pass
+        return updated
+    
+    def _clip_image_model(self):
+        """CLIP with its vision tower; loaded on the first product upsert under the onnx backend."""
+        if self.encoder_backend != 'onnx':
+            return self.clip_model
+        with self._load_lock:
+            if self._image_model is None:
+                from sentence_transformers import SentenceTransformer
+                self._image_model = SentenceTransformer(CLIP_MODEL_NAME)
+        return self._image_model
+    
+    def _encode_products(self, products: List[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray, ImageManifest]:
+        """Text and image embeddings of catalog records, computed as build_index.py does."""
+        texts = [product_text(product) for product in products]
+        text_embeddings = normalize(self.text_model.encode(texts), axis=1).astype('float32')
+        
+        # Products without a readable image get a zero image embedding; no image_path means no image
+        image_paths = [str(product.get('image_path') or '').strip().lstrip('/') for product in products]
+        manifest = ImageManifest()
+        img_embeddings = encode_images(
+            [PUBLIC_DIR / image_path if image_path else None for image_path in image_paths],
+            self._clip_image_model().encode, self.artifacts.img_index.d, batch_size=IMAGE_BATCH_SIZE,
+            workers=IMAGE_WORKERS, manifest=manifest, labels=[str(p['product_id']) for p in products]
+        )
+        img_embeddings = normalize(img_embeddings, axis=1).astype('float32')
+        
+        return text_embeddings, img_embeddings, manifest
+    
+    def _result_key(self, query: str, *options) -> Tuple:
+        """Cache key of a query and the _search_uncached options it runs with."""
+        return (normalize_query(query), *options, self.index_generation)
+    
+    def _schedule_refresh(self, key: Tuple, query: str, *options):
+        """Recompute a stale cached result in the background (at most one refresh per key)."""
+        with self._refresh_lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        
+        def refresh():
+            try:
+                response = self._search_uncached([query], *options)[0]
+                self.result_cache.put(key, response, size=len(response.model_dump_json()))
+            except Exception as e:
+                print(f"Background refresh failed for '{query}': {e}")
+            finally:
+                with self._refresh_lock:
+                    self._refreshing.discard(key)
+        
+        threading.Thread(target=refresh, daemon=True).start()
+    
+    def _search_uncached(self, queries: List[str], k: int, w_text: float, w_img: float,
+                         w_kw: float, rerank: bool, nprobe: Optional[int] = None,
+                         ef_search: Optional[int] = None,
+                         filters: Optional[AttributeFilter] = None,
+                         facet_depth: Optional[int] = None, fusion: str = FUSION_MODE,
+                         text_depth: Optional[int] = None, img_depth: Optional[int] = None,
+                         kw_depth: Optional[int] = None) -> List[SearchResponse]:
+        """Run the full retrieval pipeline, bypassing the result cache."""
+        text_depth, img_depth, kw_depth = (k if depth is None else depth for depth in (text_depth, img_depth, kw_depth))
+        start_time = time.time()
+        # A rebuild may swap artifact sets meanwhile; this search finishes on the one it started with
+        artifacts = self.artifacts
+        
+        try:
+            # Rows that may be returned: live and passing the filters (None when every row may)
+            allowed = self._allowed_rows(artifacts, filters)
             
-            # Combine results
-            all_indices = set(text_indices) | set(img_indices)
-            if len(all_indices) < k:
-                # Add more indices if needed
-                remaining = set(range(len(self.catalog))) - all_indices
-                all_indices.update(list(remaining)[:k-len(all_indices)])
+            # Encode all queries in one forward pass per model
+            query_text_embeddings, query_img_embeddings = self._encode_queries(queries)
             
-            # Calculate combined scores
-            results = []
-            for idx in all_indices:
-                if idx >= len(self.catalog):
-                    continue
-                    
-                # Get individual scores
-                text_score = 0.0
-                if idx in text_indices:
-                    text_pos = np.where(text_indices == idx)[0]
-                    if len(text_pos) > 0:
-                        text_score = float(text_scores[text_pos[0]])
-                
-                img_score = 0.0
-                if idx in img_indices:
-                    img_pos = np.where(img_indices == idx)[0]
-                    if len(img_pos) > 0:
-                        img_score = float(img_scores[img_pos[0]])
-                
-                kw_score = float(bm25_scores[idx])
-                
-                # Combined score
-                combined_score = (w_text * text_score + 
-                                w_img * img_score + 
-                                w_kw * kw_score)
-                
-                results.append({
-                    'idx': idx,
-                    'score': combined_score,
-                    'text_score': text_score,
-                    'img_score': img_score,
-                    'kw_score': kw_score
-                })
+            # One matrix search per index, restricted to the allowed rows; facets need deeper hits
+            _, text_indices = self._ann_search(artifacts.text_index, artifacts.text_embeddings, query_text_embeddings,
+                                               max(text_depth, facet_depth or 0), nprobe, ef_search, allowed)
+            _, img_indices = self._ann_search(artifacts.img_index, artifacts.img_embeddings, query_img_embeddings,
+                                              max(img_depth, facet_depth or 0), nprobe, ef_search, allowed)
             
-            # Sort by combined score
-            results.sort(key=lambda x: x['score'], reverse=True)
+            # BM25 search
+            bm25_scores = self._bm25_scores(artifacts.bm25, queries, allowed)
             
-            # Reranking (optional)
-            if rerank and self.reranker and len(results) > 0:
-                try:
-                    # Take top candidates for reranking
-                    top_k = min(40, len(results))
-                    rerank_candidates = results[:top_k]
-                    
-                    # Prepare pairs for reranking
-                    pairs = []
-                    for result in rerank_candidates:
-                        idx = result['idx']
-                        row = self.catalog.iloc[idx]
-                        text = f"{row['title']} {row['description']}"
-                        pairs.append([query, text])
-                    
-                    # Rerank
-                    rerank_scores = self.reranker.predict(pairs)
-                    rerank_scores = (rerank_scores - rerank_scores.min()) / (rerank_scores.max() - rerank_scores.min() + 1e-8)
-                    
-                    # Blend scores
-                    for i, result in enumerate(rerank_candidates):
-                        result['score'] = 0.8 * result['score'] + 0.2 * rerank_scores[i]
-                    
-                    # Re-sort
-                    results = rerank_candidates + results[top_k:]
-                    results.sort(key=lambda x: x['score'], reverse=True)
-                    
-                except Exception as e:
-                    print(f"Reranking failed: {e}")
-                    # Continue without reranking
+            responses = []
+            for i, query in enumerate(queries):
+                # Reranked scores can drop below the next k, so keep those candidates too
+                fused = self._fuse(artifacts, query_text_embeddings[i], query_img_embeddings[i],
+                                   text_indices[i, :text_depth], img_indices[i, :img_depth], *bm25_scores[i], kw_depth,
+                                   k + RERANK_DEPTH if rerank else k, w_text, w_img, w_kw, fusion)
+                response = self._rank(artifacts.catalog, query, fused, k, rerank, start_time)
+                if facet_depth:
+                    candidates = self._fuse(artifacts, query_text_embeddings[i], query_img_embeddings[i],
+                                            text_indices[i], img_indices[i], *bm25_scores[i],
+                                            max(kw_depth, facet_depth), facet_depth, w_text, w_img, w_kw, fusion)
+                    response.facets = SearchFacets(**artifacts.attributes.facet_counts(candidates.indices),
+                                                   depth=len(candidates))
+                    response.total_time = time.time() - start_time
+                responses.append(response)
+            return responses
             
-            # Prepare final results
-            search_results = []
-            for result in results[:k]:
-                idx = result['idx']
-                row = self.catalog.iloc[idx]
+        except Exception as e:
+            print(f"Search error: {e}")
+            raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
+    
+    @staticmethod
+    def _allowed_rows(artifacts: SearchArtifacts, filters: Optional[AttributeFilter]) -> Optional[np.ndarray]:
+        """Mask of the live rows passing filters, or None without filters."""
+        mask = artifacts.attributes.mask(filters)
+        if mask is not None and artifacts.live is not None:
+            mask &= artifacts.live
+        return mask
+    
+    @staticmethod
+    def _ann_search(index, embeddings: np.ndarray, queries: np.ndarray, k: int, nprobe: Optional[int],
+                    ef_search: Optional[int], allowed: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        FAISS search skipping rows outside allowed. On HNSW and IVF indices, small allowed sets are
+        scored exactly instead; flat and SQ searches already scan every allowed row.
+        """
+        if allowed is not None and selector_may_miss_rows(index):
+            rows = np.flatnonzero(allowed)
+            if len(rows) <= FILTER_EXACT_ROWS:
+                hits = search_rows(embedding_rows(embeddings, index, rows[:FILTER_EXACT_CHUNK_ROWS]),
+                                   rows[:FILTER_EXACT_CHUNK_ROWS], queries, k)
+                for start in range(FILTER_EXACT_CHUNK_ROWS, len(rows), FILTER_EXACT_CHUNK_ROWS):
+                    chunk = rows[start:start + FILTER_EXACT_CHUNK_ROWS]
+                    hits = merge_results(hits, search_rows(embedding_rows(embeddings, index, chunk), chunk,
+                                                           queries, k), k)
+                return hits
+        return ann_search(index, queries, k, nprobe, ef_search, mask=allowed)
+    
+    @staticmethod
+    def _fuse(artifacts: SearchArtifacts, query_text_embedding: np.ndarray, query_img_embedding: np.ndarray,
+              text_indices: np.ndarray, img_indices: np.ndarray, kw_ids: np.ndarray, kw_scores: np.ndarray,
+              kw_depth: int, depth: int, w_text: float, w_img: float, w_kw: float, fusion: str) -> FusedCandidates:
+        """
+        Fuse the union of one query's text hits, image hits and kw_depth best BM25 matches. Text
+        and image similarities of every candidate are computed exactly from the stored embeddings
+        (one gather and dot product per modality), so a product found through one modality is
+        scored on its real similarity in the other rather than 0.
+        """
+        candidates = candidate_rows(len(artifacts.catalog), text_indices, img_indices,
+                                    kw_ids[top_order(kw_scores, kw_depth)])
+        text_scores = embedding_rows(artifacts.text_embeddings, artifacts.text_index, candidates) @ query_text_embedding
+        img_scores = embedding_rows(artifacts.img_embeddings, artifacts.img_index, candidates) @ query_img_embedding
+        kw = gather_sparse(candidates, kw_ids, kw_scores)
+        return combine_scores(candidates, text_scores, img_scores, kw, depth, w_text, w_img, w_kw, mode=fusion)
+    
+    def _encode_queries(self, queries: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Encode queries with the text model and the CLIP text tower."""
+        normalized = [normalize_query(query) for query in queries]
+        query_text_embeddings = self._encode_cached(TEXT_MODEL_NAME, normalized)
+        
+        # CLIP text-to-image embedding
+        query_img_embeddings = self._encode_cached(CLIP_MODEL_NAME, normalized)
+        
+        return query_text_embeddings, query_img_embeddings
+    
+    def _encode_cached(self, model_name: str, queries: List[str]) -> np.ndarray:
+        """Encode normalized queries, running the model (micro-batched) only on cache misses."""
+        rows = [self.embedding_cache.get((model_name, query)) for query in queries]
+        missing = list(dict.fromkeys(q for q, row in zip(queries, rows) if row is None))
+        
+        if missing:
+            encoded = self.encoders[model_name].submit(missing)
+            fresh = dict(zip(missing, encoded))
+            for query, embedding in fresh.items():
+                embedding.flags.writeable = False
+                self.embedding_cache.put((model_name, query), embedding)
+            rows = [row if row is not None else fresh[q] for q, row in zip(queries, rows)]
+        
+        return np.vstack(rows)
+    
+    def _bm25_scores(self, bm25: BM25Index, queries: List[str],
+                     allowed: Optional[np.ndarray] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Sparse BM25 scores (matching doc ids, scores) per query, normalized to 0-1."""
+        results = []
+        for query in queries:
+            doc_ids, scores = bm25.score_sparse(query.lower().split(), allowed)
+            # Normalize BM25 scores to 0-1
+            if len(scores) and scores.max() > 0:
+                scores = scores / scores.max()
+            results.append((doc_ids, scores))
+        return results
+    
+    def _rank(self, catalog: ColumnarCatalog, query: str, fused: FusedCandidates, k: int,
+              rerank: bool, start_time: float) -> SearchResponse:
+        """Rerank and materialize fused results for a single query."""
+        scores = fused.scores
+        
+        # Reranking (optional)
+        if rerank and self.reranker and len(fused) > 0:
+            try:
+                # Take top candidates for reranking
+                top_k = min(RERANK_DEPTH, len(fused))
                 
-                # Generate "why" chips
-                why_chips = self._generate_why_chips(query, row, result)
+                # Rerank
+                rerank_scores = self._rerank_scores(catalog, query, fused.indices[:top_k])
+                rerank_scores = (rerank_scores - rerank_scores.min()) / (rerank_scores.max() - rerank_scores.min() + 1e-8)
                 
-                # Handle image path - prefer image_path, fallback to first image from image_paths
-                image_path = ''
-                if pd.notna(row['image_path']) and str(row['image_path']).strip():
-                    image_path = str(row['image_path']).strip()
-                elif pd.notna(row.get('image_paths', '')) and str(row.get('image_paths', '')).strip():
-                    # Get first image from image_paths
-                    image_paths = str(row.get('image_paths', '')).strip()
-                    if image_paths:
-                        first_image = image_paths.split('|')[0].strip()
-                        if first_image:
-                            image_path = first_image
+                # Blend scores (final ordering below re-sorts)
+                scores = scores.copy()
+                scores[:top_k] = 0.8 * scores[:top_k] + 0.2 * rerank_scores
                 
-                search_result = SearchResult(
-                    product_id=str(row['product_id']),
-                    title=str(row['title']),
-                    price=int(row['price']) if pd.notna(row['price']) else 0,
-                    color=str(row['color']) if pd.notna(row['color']) else 'mixed',
-                    material=str(row['material']) if pd.notna(row['material']) else 'mixed',
-                    sizes=str(row['sizes']) if pd.notna(row['sizes']) else 'One Size',
-                    image_path=image_path,
-                    score=result['score'],
-                    score_text=result['text_score'],
-                    score_img=result['img_score'],
-                    score_kw=result['kw_score'],
-                    why_chips=why_chips
-                )
-                search_results.append(search_result)
-            
-            total_time = time.time() - start_time
+            except Exception as e:
+                print(f"Reranking failed: {e}")
+                # Continue without reranking
+        
+        # Prepare final results from catalog columns (values are pre-resolved, so skip validation)
+        order = top_order(scores, k)
+        rows = catalog.gather(fused.indices[order])
+        search_results = []
+        for i, pos in enumerate(order):
+            result = {
+                'score': float(scores[pos]),
+                'text_score': float(fused.text_scores[pos]),
+                'img_score': float(fused.img_scores[pos]),
+                'kw_score': float(fused.kw_scores[pos])
+            }
             
-            return SearchResponse(
-                results=search_results,
-                total_time=total_time,
-                num_results=len(search_results)
+            # Generate "why" chips
+            why_chips = self._generate_why_chips(
+                query, rows['title'][i], rows['color_match'][i], rows['material_match'][i], result
             )
             
-        except Exception as e:
-            print(f"Search error: {e}")
-            raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
+            search_result = SearchResult.model_construct(
+                product_id=rows['product_id'][i],
+                title=rows['title'][i],
+                price=rows['price'][i],
+                color=rows['color'][i],
+                material=rows['material'][i],
+                sizes=rows['sizes'][i],
+                image_path=rows['image_path'][i],
+                score=result['score'],
+                score_text=result['text_score'],
+                score_img=result['img_score'],
+                score_kw=result['kw_score'],
+                why_chips=why_chips
+            )
+            search_results.append(search_result)
+        
+        total_time = time.time() - start_time
+        
+        return SearchResponse(
+            results=search_results,
+            total_time=total_time,
+            num_results=len(search_results)
+        )
+    
+    def _rerank_scores(self, catalog: ColumnarCatalog, query: str, indices: np.ndarray) -> np.ndarray:
+        """Cross-encoder scores for (query, product) pairs; only uncached pairs are predicted."""
+        query = normalize_query(query)
+        keys = [(query, product_id) for product_id in catalog.ids_for(indices)]
+        cached = [self.rerank_cache.get(key) for key in keys]
+        scores = np.array([0.0 if c is None else c for c in cached])
+        
+        missing = [i for i, c in enumerate(cached) if c is None]
+        if missing:
+            passages = catalog.passages_for(indices[missing])
+            predicted = self.reranker.predict([[query, passage] for passage in passages])
+            for i, score in zip(missing, predicted):
+                scores[i] = score
+                self.rerank_cache.put(keys[i], float(score))
+        
+        return scores
     
-    def _generate_why_chips(self, query: str, row: pd.Series, result: Dict) -> List[str]:
+    def _generate_why_chips(self, query: str, title: str, color_lower: str,
+                            material_lower: str, result: Dict) -> List[str]:
         """Generate explanation chips for why a result matched."""
         chips = []
         query_lower = query.lower()
         
         # Check title matches
-        title_lower = str(row['title']).lower()
+        title_lower = title.lower()
         for word in query_lower.split():
             if word in title_lower and len(word) > 2:
                 chips.append(f"Title: {word}")
         
         # Check color matches
-        color_lower = str(row['color']).lower()
         for word in query_lower.split():
             if word in color_lower and len(word) > 2:
                 chips.append(f"Color: {word}")
         
         # Check material matches
-        material_lower = str(row['material']).lower()
         for word in query_lower.split():
             if word in material_lower and len(word) > 2:
                 chips.append(f"Material: {word}")
@@ -333,22 +1117,24 @@ class SemanticSearchEngine:
         sys.path.append(str(Path(__file__).parent))
         from util.ingest_from_public import augment_products
         
-        # Convert catalog to list of dicts
-        products = self.catalog.to_dict('records')
-        
-        # Generate augmented products
-        augmented = augment_products(products, count)
+        # Variations of live built products (the serving catalog is columnar, so read the full table)
+        artifacts = self.artifacts
+        built = pd.read_parquet(artifacts.path / "catalog.parquet")
+        if artifacts.live is not None:
+            built = built[artifacts.live[:len(built)]]
+        # New ids must not replace products added or retired through the delta log
+        taken_ids = artifacts.catalog.ids_for(np.arange(len(artifacts.catalog)))
         
-        # Append to catalog
-        new_df = pd.DataFrame(augmented)
-        self.catalog = pd.concat([self.catalog, new_df], ignore_index=True)
-        
-        # Save updated catalog
-        self.catalog.to_parquet(self.artifacts_dir / "catalog.parquet", index=False)
+        # Generate augmented products and index them like any other upsert
+        augmented = augment_products(built.to_dict('records'), count, taken_ids)
+        total_before = self._num_products(artifacts)
+        result = self.upsert_products(augmented)
+        added = result["total_products"] - total_before
         
         return {
-            "message": f"Added {count} synthetic products",
-            "total_products": len(self.catalog)
+            "message": f"Added {added} synthetic products",
+            "added": added,
+            "total_products": result["total_products"]
         }
     
     def evaluate(self, queries: List[str], labels: Optional[Dict[str, List[str]]] = None) -> EvaluateResponse:
@@ -361,10 +1147,14 @@ class SemanticSearchEngine:
         recall_at_10 = 0
         ndcg_at_10 = 0
         zero_results = 0
+        latencies = []
         
         for query in queries:
             try:
-                results = self.search(query, k=10)
+                # Uncached, so latencies measure the full pipeline on every evaluation
+                start = time.perf_counter()
+                results = self._search_uncached([query], 10, 0.5, 0.3, 0.2, True)[0]
+                latencies.append((time.perf_counter() - start) * 1000)
                 
                 if len(results.results) == 0:
                     zero_results += 1
@@ -409,7 +1199,10 @@ class SemanticSearchEngine:
             recall_at_10=recall_at_10 / total_queries,
             ndcg_at_10=ndcg_at_10 / total_queries,
             zero_result_rate=zero_results / total_queries,
-            total_queries=total_queries
+            total_queries=total_queries,
+            latency_p50_ms=float(np.percentile(latencies, 50)) if latencies else 0.0,
+            latency_p99_ms=float(np.percentile(latencies, 99)) if latencies else 0.0,
+            quantized=self.quantize
         )
 
 # Initialize FastAPI app
@@ -426,42 +1219,104 @@ app.add_middleware(
 
 # Initialize search engine
 search_engine = SemanticSearchEngine()
+search_executor = BoundedExecutor(SEARCH_WORKERS, SEARCH_QUEUE_DEPTH)
+
+async def run_search_work(fn, *args, **kwargs):
+    """Run blocking engine work on the search pool so the event loop stays responsive."""
+    try:
+        return await search_executor.run(fn, *args, **kwargs)
+    except ExecutorSaturated:
+        raise HTTPException(
+            status_code=503,
+            detail="Search capacity exhausted, retry shortly",
+            headers={"Retry-After": str(SEARCH_RETRY_AFTER)}
+        )
+
+def requested_facet_depth(facets: bool, facet_depth: Optional[int]) -> Optional[int]:
+    """Candidates to count facets over, or None when the request did not ask for facets."""
+    if not facets:
+        return None
+    return FACET_DEPTH if facet_depth is None else facet_depth
+
+def requested_page_depth(page_depth: Optional[int]) -> int:
+    return SEARCH_PAGE_DEPTH if page_depth is None else page_depth
+
+@app.on_event("startup")
+async def start_loading():
+    """With EAGER_LOAD, load and warm up in the background while liveness probes already pass."""
+    if search_engine.eager_load:
+        threading.Thread(target=search_engine.start_up, name="eager-load", daemon=True).start()
+
+@app.get("/healthz")
+async def liveness():
+    """Liveness: the process is up and serving requests, whether or not it has loaded anything."""
+    return {"status": "alive"}
+
+@app.get("/readyz")
+async def readiness(response: Response):
+    """Readiness: 200 once models and artifacts are loaded (and warmed up under EAGER_LOAD), else 503."""
+    status = search_engine.readiness()
+    if not status['ready']:
+        response.status_code = 503
+    return status
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
-    return {"status": "healthy", "models_loaded": search_engine.models_loaded}
+    return {
+        "status": "healthy",
+        "models_loaded": search_engine.models_loaded,
+        "ready": search_engine.readiness()['ready'],
+        "embedding_cache": search_engine.embedding_cache.stats(),
+        "result_cache": search_engine.result_cache.stats(),
+        "index_generation": search_engine.index_generation,
+        "artifact_version": search_engine.artifacts.version if search_engine.artifacts else None,
+        "delta": {
+            "seq": search_engine.artifacts.delta_seq,
+            "pending_rows": pending_rows(search_engine.artifacts)
+        } if search_engine.artifacts else None,
+        "mmap_artifacts": search_engine.mmap_artifacts,
+        "quantized": search_engine.quantize,
+        "encoder_backend": search_engine.encoder_backend,
+        "search_executor": search_executor.stats(),
+        "rerank_cache": search_engine.rerank_cache.stats(),
+        "encode_batching": {name: batcher.stats() for name, batcher in search_engine.encoders.items()}
+    }
 
-@app.post("/rebuild")
+@app.post("/rebuild", status_code=202)
 async def rebuild_indices():
-    """Rebuild all indices."""
-    try:
-        import subprocess
-        import sys
-        result = subprocess.run([sys.executable, "server/build_index.py"], 
-                              capture_output=True, text=True)
-        if result.returncode != 0:
-            raise HTTPException(status_code=500, detail=f"Build failed: {result.stderr}")
-        
-        # Reload models
-        search_engine.models_loaded = False
-        search_engine.load_models()
-        
-        return {"message": "Indices rebuilt successfully"}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    """Start rebuilding all indices in the background; poll /rebuild/status for progress."""
+    status = await run_in_threadpool(search_engine.start_rebuild)
+    return {"message": f"Rebuild {status['version']} started", **status}
+
+@app.get("/rebuild/status")
+async def rebuild_status():
+    """Progress of the latest rebuild and the artifact version being served."""
+    return search_engine.rebuild_status()
 
 @app.post("/search")
 async def search(request: SearchRequest):
     """Perform semantic search."""
-    return search_engine.search(
+    options = dict(
         query=request.query,
         k=request.k,
         w_text=request.w_text,
         w_img=request.w_img,
         w_kw=request.w_kw,
-        rerank=request.rerank
+        rerank=request.rerank,
+        nprobe=request.nprobe,
+        ef_search=request.ef_search,
+        filters=request.filters.model_dump() if request.filters else None,
+        facet_depth=requested_facet_depth(request.facets, request.facet_depth),
+        fusion=request.fusion,
+        text_depth=request.text_depth,
+        img_depth=request.img_depth,
+        kw_depth=request.kw_depth
     )
+    if request.paginate:
+        return await run_search_work(search_engine.search_page, page_depth=requested_page_depth(request.page_depth),
+                                     **options)
+    return await run_search_work(search_engine.search, **options)
 
 @app.get("/search")
 async def search_get(
@@ -470,34 +1325,119 @@ async def search_get(
     w_text: float = Query(0.5, description="Text weight"),
     w_img: float = Query(0.3, description="Image weight"),
     w_kw: float = Query(0.2, description="Keyword weight"),
-    rerank: bool = Query(True, description="Enable reranking")
+    rerank: bool = Query(True, description="Enable reranking"),
+    nprobe: Optional[int] = Query(None, description="IVF lists to probe (ivf/ivfpq indices)"),
+    ef_search: Optional[int] = Query(None, description="HNSW search depth (hnsw indices)"),
+    price_min: Optional[float] = Query(None, description="Lowest price"),
+    price_max: Optional[float] = Query(None, description="Highest price"),
+    color: Optional[List[str]] = Query(None, description="Colors (repeat for several)"),
+    material: Optional[List[str]] = Query(None, description="Materials (repeat for several)"),
+    size: Optional[List[str]] = Query(None, description="Sizes (repeat for several)"),
+    store: Optional[List[str]] = Query(None, description="Stores (repeat for several)"),
+    facets: bool = Query(False, description="Include facet counts over the top candidates"),
+    facet_depth: Optional[int] = Query(None, description=f"Candidates counted for facets (default {FACET_DEPTH})"),
+    paginate: bool = Query(False, description="Return a next_cursor for the following pages"),
+    page_depth: Optional[int] = Query(None, description=f"Results ranked for all pages (default {SEARCH_PAGE_DEPTH})"),
+    fusion: str = Query(FUSION_MODE, description=f"Score fusion, one of {FUSION_MODES}"),
+    text_depth: Optional[int] = Query(None, description="Text hits taken as candidates (default k)"),
+    img_depth: Optional[int] = Query(None, description="Image hits taken as candidates (default k)"),
+    kw_depth: Optional[int] = Query(None, description="BM25 matches taken as candidates (default k)")
 ):
     """GET endpoint for search."""
-    return search_engine.search(
+    options = dict(
         query=q,
         k=k,
         w_text=w_text,
         w_img=w_img,
         w_kw=w_kw,
-        rerank=rerank
+        rerank=rerank,
+        nprobe=nprobe,
+        ef_search=ef_search,
+        filters=SearchFilters(price_min=price_min, price_max=price_max, color=color, material=material,
+                              size=size, store=store).model_dump(),
+        facet_depth=requested_facet_depth(facets, facet_depth),
+        fusion=fusion,
+        text_depth=text_depth,
+        img_depth=img_depth,
+        kw_depth=kw_depth
+    )
+    if paginate:
+        return await run_search_work(search_engine.search_page, page_depth=requested_page_depth(page_depth), **options)
+    return await run_search_work(search_engine.search, **options)
+
+@app.get("/search/next")
+async def search_next(
+    cursor: str = Query(..., description="next_cursor of the previous page"),
+    k: int = Query(20, description="Number of results")
+):
+    """Next page of a paginated search; a slice of the ranking computed by the first page."""
+    return search_engine.next_page(cursor, k)
+
+@app.post("/search/batch")
+async def search_batch(request: SearchBatchRequest):
+    """Perform semantic search for many queries in one pass."""
+    if len(request.queries) > MAX_BATCH_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_QUERIES} queries per batch")
+    
+    start_time = time.time()
+    responses = await run_search_work(
+        search_engine.search_many,
+        queries=request.queries,
+        k=request.k,
+        w_text=request.w_text,
+        w_img=request.w_img,
+        w_kw=request.w_kw,
+        rerank=request.rerank,
+        nprobe=request.nprobe,
+        ef_search=request.ef_search,
+        filters=request.filters.model_dump() if request.filters else None,
+        facet_depth=requested_facet_depth(request.facets, request.facet_depth),
+        fusion=request.fusion,
+        text_depth=request.text_depth,
+        img_depth=request.img_depth,
+        kw_depth=request.kw_depth
+    )
+    return SearchBatchResponse(
+        responses=responses,
+        total_time=time.time() - start_time,
+        num_queries=len(responses)
     )
 
 @app.post("/augment")
 async def augment_catalog(request: AugmentRequest):
     """Augment catalog with synthetic products."""
-    result = search_engine.augment_catalog(request.count)
+    result = await run_search_work(search_engine.augment_catalog, request.count)
     
     if request.rebuild:
-        # Rebuild indices
-        await rebuild_indices()
-        result["message"] += " and indices rebuilt"
+        # Rebuild indices in the background
+        try:
+            result["rebuild"] = await run_in_threadpool(search_engine.start_rebuild)
+            result["message"] += "; index rebuild started"
+        except HTTPException as e:
+            result["message"] += f"; {e.detail}"
     
     return result
 
+@app.post("/products")
+async def upsert_products(request: UpsertProductsRequest):
+    """Add or replace products; they are searchable as soon as this returns."""
+    return await run_search_work(search_engine.upsert_products, [p.model_dump() for p in request.products])
+
+@app.delete("/products")
+async def delete_products(request: DeleteProductsRequest):
+    """Remove products from search."""
+    return await run_search_work(search_engine.delete_products, request.product_ids)
+
+@app.post("/products/compact", status_code=202)
+async def compact_products():
+    """Fold logged product updates into a new artifact version; poll /rebuild/status for progress."""
+    status = await run_in_threadpool(search_engine.start_compaction)
+    return {"message": f"Compaction {status['version']} started", **status}
+
 @app.post("/evaluate")
 async def evaluate(request: EvaluateRequest):
     """Evaluate search performance."""
-    return search_engine.evaluate(request.queries, request.labels)
+    return await run_search_work(search_engine.evaluate, request.queries, request.labels)
 
 @app.get("/eval/queries")
 async def get_eval_queries():
@@ -0,0 +1,99 @@
+"""
+Shared fixtures. Artifact sets are written directly with save_artifacts from a small catalog,
+and the query/product encoders are replaced by deterministic hash encoders, so the tests need
+no model downloads.
+"""
+
+import sys
+import hashlib
+import numpy as np
+import pandas as pd
+import pytest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from ann import build_ann_index
+from artifacts import ArtifactStore, save_artifacts
+from bm25_index import BM25Index, tokenize_product
+from catalog import product_text
+
+TEXT_DIM = 384
+IMG_DIM = 512
+WORDS = "red blue black green linen silk wool cotton dress shirt coat skirt vintage tailored".split()
+
+
+class HashEncoder:
+    """Unit vectors seeded by the text, standing in for a SentenceTransformer."""
+
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    def encode(self, texts, **kwargs) -> np.ndarray:
+        out = np.empty((len(texts), self.dim), dtype='float32')
+        for row, text in enumerate(texts):
+            data = text.encode() if isinstance(text, str) else np.asarray(text).tobytes()
+            rng = np.random.default_rng(int(hashlib.md5(data).hexdigest()[:8], 16))
+            out[row] = rng.standard_normal(self.dim)
+        return out / np.linalg.norm(out, axis=1, keepdims=True)
+
+
+def make_catalog(n: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'product_id': [f"prod_{i:03d}" for i in range(n)],
+        'title': [' '.join(rng.choice(WORDS, 3)) for _ in range(n)],
+        'description': [' '.join(rng.choice(WORDS, 8)) for _ in range(n)],
+        'tags': [','.join(rng.choice(WORDS, 2)) for _ in range(n)],
+        'price': rng.integers(10, 300, n).astype(float),
+        'color': rng.choice(['red', 'blue', 'black', 'green'], n),
+        'material': rng.choice(['linen', 'silk', 'wool', 'cotton'], n),
+        'sizes': rng.choice(['S', 'M', 'L', 'S, M', 'M, L, XL'], n),
+        'store': rng.choice(['Alpha', 'Beta'], n),
+        'image_path': [f"/images/missing_{i}.jpg" for i in range(n)],
+        'source_url': [''] * n
+    })
+
+
+def write_artifact_set(path: Path, catalog: pd.DataFrame, index_type: str = 'flat', **index_params):
+    """What build_index.py writes for catalog, with hash text embeddings and no images."""
+    path.mkdir(parents=True, exist_ok=True)
+    records = catalog.to_dict('records')
+    text_embeddings = HashEncoder(TEXT_DIM).encode([product_text(product) for product in records])
+    img_embeddings = np.zeros((len(catalog), IMG_DIM), dtype='float32')
+    text_index, text_params = build_ann_index(text_embeddings, index_type, **index_params)
+    img_index, img_params = build_ann_index(img_embeddings, index_type, **index_params)
+    bm25 = BM25Index.from_tokenized([tokenize_product(product) for product in records])
+    metadata = {'num_products': len(catalog), 'text_dim': TEXT_DIM, 'img_dim': IMG_DIM,
+                'index': {'text': text_params, 'image': img_params}, 'index_params': index_params}
+    save_artifacts(path, text_index, img_index, text_embeddings, img_embeddings, bm25, catalog, metadata)
+
+
+def publish_artifact_set(root: Path, catalog: pd.DataFrame, index_type: str = 'flat', **index_params) -> ArtifactStore:
+    """An artifact root with one published version written by write_artifact_set."""
+    store = ArtifactStore(root)
+    version = store.new_version()
+    write_artifact_set(store.version_path(version), catalog, index_type, **index_params)
+    store.publish(version)
+    return store
+
+
+def start_engine(store: ArtifactStore, monkeypatch):
+    """A SemanticSearchEngine serving store with hash encoders, no reranker and no automatic compaction."""
+    import serve
+    monkeypatch.setattr(serve, 'DELTA_COMPACT_ROWS', 0)
+    engine = serve.SemanticSearchEngine(str(store.root), eager_load=False, use_reranker=False)
+    monkeypatch.setattr(engine, '_load_text_model', lambda: HashEncoder(TEXT_DIM))
+    monkeypatch.setattr(engine, '_load_clip_model', lambda: HashEncoder(IMG_DIM))
+    engine.load_models()
+    return engine
+
+
+@pytest.fixture
+def artifact_store(tmp_path) -> ArtifactStore:
+    """An artifact root with one published version built from make_catalog(40)."""
+    return publish_artifact_set(tmp_path / "artifacts", make_catalog(40))
+
+
+@pytest.fixture
+def engine(artifact_store, monkeypatch):
+    return start_engine(artifact_store, monkeypatch)
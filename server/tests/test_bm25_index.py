@@ -0,0 +1,103 @@
+"""Inverted-index BM25 against rank_bm25.BM25Okapi."""
+
+import numpy as np
+import pytest
+from rank_bm25 import BM25Okapi
+from bm25_index import BM25Index, tokenize_product
+from conftest import make_catalog
+
+QUERIES = [
+    ['silk', 'dress'],
+    ['red', 'red', 'linen'],
+    ['vintage', 'coat', 'wool', 'blue'],
+    # In most documents: idf falls back to epsilon * average idf
+    ['the'],
+    ['missing'],
+    [],
+]
+
+
+@pytest.fixture
+def corpus():
+    docs = [tokenize_product(product) for product in make_catalog(60).to_dict('records')]
+    # A term in more than half of the documents gets a negative BM25Okapi idf
+    return [doc + ['the'] if i % 4 else doc for i, doc in enumerate(docs)]
+
+
+def dense(index: BM25Index, tokens, size=None) -> np.ndarray:
+    docs, values = index.score_sparse(tokens)
+    scores = np.zeros(size or index.corpus_size)
+    scores[docs] = values
+    return scores
+
+
+def assert_scores_equal(index: BM25Index, okapi: BM25Okapi, ids=None):
+    """score_sparse of index (restricted to ids, in order) equals okapi.get_scores for every query."""
+    for tokens in QUERIES:
+        scores = dense(index, tokens)
+        np.testing.assert_allclose(scores if ids is None else scores[ids], okapi.get_scores(tokens),
+                                   rtol=1e-12, atol=1e-12, err_msg=str(tokens))
+
+
+def test_scores_match_okapi(corpus):
+    assert_scores_equal(BM25Index.from_tokenized(corpus), BM25Okapi(corpus))
+
+
+def test_sparse_scores_cover_matching_documents_only(corpus):
+    index = BM25Index.from_tokenized(corpus)
+    docs, values = index.score_sparse(['silk', 'dress'])
+    assert np.all(np.diff(docs) > 0)
+    assert set(docs) == {i for i, doc in enumerate(corpus) if 'silk' in doc or 'dress' in doc}
+    assert index.score_sparse(['missing'])[0].size == 0
+
+
+def test_from_okapi_and_save_load(corpus, tmp_path):
+    okapi = BM25Okapi(corpus)
+    assert_scores_equal(BM25Index.from_okapi(okapi), okapi)
+    BM25Index.from_tokenized(corpus).remove_documents(np.array([3])).save(tmp_path / "bm25_index.npz")
+    loaded = BM25Index.load(tmp_path / "bm25_index.npz")
+    assert_scores_equal(loaded, BM25Okapi(corpus[:3] + corpus[4:]), ids=[i for i in range(len(corpus)) if i != 3])
+
+
+def test_add_documents_matches_okapi_over_all_documents(corpus):
+    index = BM25Index.from_tokenized(corpus[:40]).add_documents(corpus[40:50]).add_documents(corpus[50:])
+    assert index.corpus_size == len(corpus)
+    assert_scores_equal(index, BM25Okapi(corpus))
+
+
+def test_remove_documents_matches_okapi_over_remaining_documents(corpus):
+    removed = np.array([0, 5, 17, 59])
+    kept = np.setdiff1d(np.arange(len(corpus)), removed)
+    index = BM25Index.from_tokenized(corpus).remove_documents(removed)
+    assert index.num_live == len(kept)
+    assert_scores_equal(index, BM25Okapi([corpus[i] for i in kept]), ids=kept)
+    for tokens in QUERIES:
+        assert not np.isin(index.score_sparse(tokens)[0], removed).any()
+
+
+def test_add_then_remove_matches_okapi(corpus):
+    # An upsert: the replaced document is removed and its new version appended
+    updated = corpus[7] + ['silk', 'kimono']
+    index = BM25Index.from_tokenized(corpus).add_documents([updated]).remove_documents(np.array([7, 12]))
+    kept = [i for i in range(len(corpus) + 1) if i not in (7, 12)]
+    assert_scores_equal(index, BM25Okapi([(corpus + [updated])[i] for i in kept]), ids=kept)
+
+
+def test_mask_keeps_scores_of_allowed_documents(corpus):
+    index = BM25Index.from_tokenized(corpus)
+    mask = np.zeros(len(corpus), dtype=bool)
+    mask[::3] = True
+    docs, values = index.score_sparse(['silk', 'dress'], mask=mask)
+    all_docs, all_values = index.score_sparse(['silk', 'dress'])
+    assert mask[docs].all()
+    np.testing.assert_array_equal(values, all_values[np.isin(all_docs, docs)])
+
+
+def test_top_n_matches_okapi_order(corpus):
+    okapi = BM25Okapi(corpus)
+    index = BM25Index.from_tokenized(corpus)
+    tokens = ['vintage', 'coat', 'wool', 'blue']
+    docs, values = index.top_n(tokens, 10)
+    expected = okapi.get_scores(tokens)
+    np.testing.assert_allclose(values, np.sort(expected)[::-1][:10], rtol=1e-12)
+    np.testing.assert_allclose(expected[docs], values, rtol=1e-12)
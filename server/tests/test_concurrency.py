@@ -0,0 +1,39 @@
+"""MicroBatcher latency for a lone caller and coalescing under concurrent load."""
+
+import time
+import threading
+import numpy as np
+from concurrency import MicroBatcher
+
+
+def slow_rows(items, delay=0.02):
+    time.sleep(delay)
+    return np.array([[len(str(item))] for item in items], dtype='float32')
+
+
+def test_lone_request_does_not_wait_for_the_window():
+    batcher = MicroBatcher(slow_rows, max_wait=0.5)
+    for _ in range(3):
+        started = time.monotonic()
+        assert batcher.submit(["abc"]).tolist() == [[3.0]]
+        assert time.monotonic() - started < 0.25
+    assert batcher.stats()['batches'] == 3
+
+
+def test_concurrent_requests_are_batched():
+    batcher = MicroBatcher(slow_rows, max_wait=0.05)
+    results = {}
+
+    def client(i):
+        results[i] = batcher.submit([f"query {i}", "shared"])
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all(results[i].tolist() == [[len(f"query {i}")], [6.0]] for i in range(16))
+    stats = batcher.stats()
+    assert stats['requests'] == 16
+    assert stats['batches'] < 16
@@ -0,0 +1,180 @@
+"""Product upserts and deletes through compaction and full rebuilds."""
+
+import time
+import numpy as np
+import pandas as pd
+from artifacts import load_artifacts
+from conftest import make_catalog, write_artifact_set
+from delta import DeltaLog, apply_segment, publish_build, replay
+
+NEW_PRODUCT = {
+    'product_id': 'NEW1', 'title': 'zebra print kimono', 'description': 'zebra print silk kimono',
+    'tags': 'zebra,kimono', 'price': 120.0, 'color': 'black', 'material': 'silk', 'sizes': 'M',
+    'store': 'Alpha', 'image_path': '/images/missing_new1.jpg', 'source_url': ''
+}
+
+
+def live_ids(engine):
+    artifacts = engine.artifacts
+    rows = range(len(artifacts.catalog)) if artifacts.live is None else artifacts.live.nonzero()[0]
+    return set(artifacts.catalog.ids_for(list(rows)))
+
+
+def wait_for_build(engine, timeout=60):
+    deadline = time.time() + timeout
+    while engine.rebuild_status()['state'] in ('building', 'validating'):
+        assert time.time() < deadline, "build did not finish"
+        time.sleep(0.05)
+    status = engine.rebuild_status()
+    assert status['state'] == 'succeeded', status
+    return status
+
+
+def rebuild_from_catalog(engine, catalog=None):
+    """/rebuild with build_index.py replaced by writing the products.csv catalog directly."""
+    version = engine.store.new_version()
+    engine.rebuild_state = {'kind': 'rebuild', 'state': 'building', 'version': version}
+    write_artifact_set(engine.store.version_path(version), make_catalog(40) if catalog is None else catalog)
+    engine._publish_build(version, from_served=True)
+    return version
+
+
+def search_ids(engine, query):
+    return [result.product_id for result in engine.search(query, k=10, rerank=False).results]
+
+
+def test_upsert_compact_rebuild_search(engine):
+    engine.upsert_products([NEW_PRODUCT])
+    engine.delete_products(['prod_001'])
+    assert 'NEW1' in live_ids(engine) and 'prod_001' not in live_ids(engine)
+
+    engine.start_compaction()
+    wait_for_build(engine)
+    assert engine.artifacts.live is None
+    assert 'NEW1' in live_ids(engine) and 'prod_001' not in live_ids(engine)
+
+    # Changes made after the compaction are carried over as well
+    engine.delete_products(['prod_002'])
+    rebuild_from_catalog(engine)
+    ids = live_ids(engine)
+    assert 'NEW1' in ids
+    assert 'prod_001' not in ids and 'prod_002' not in ids
+    assert len(ids) == 40 - 2 + 1
+
+    assert search_ids(engine, 'zebra kimono')[0] == 'NEW1'
+    assert 'prod_001' not in search_ids(engine, make_catalog(40).title[1])
+
+
+def test_compaction_twice_keeps_history(engine):
+    engine.upsert_products([NEW_PRODUCT])
+    engine.start_compaction()
+    wait_for_build(engine)
+    engine.delete_products(['prod_003'])
+    engine.start_compaction()
+    wait_for_build(engine)
+    assert 'NEW1' in live_ids(engine) and 'prod_003' not in live_ids(engine)
+
+    rebuild_from_catalog(engine)
+    assert 'NEW1' in live_ids(engine) and 'prod_003' not in live_ids(engine)
+    assert search_ids(engine, 'zebra kimono')[0] == 'NEW1'
+
+
+def test_offline_build_keeps_api_updates(engine, artifact_store):
+    engine.upsert_products([NEW_PRODUCT])
+    engine.delete_products(['prod_001'])
+
+    # build_index.py / integrate_flyingsolo.py publishing while the server runs
+    version = artifact_store.new_version()
+    write_artifact_set(artifact_store.version_path(version), make_catalog(40))
+    publish_build(artifact_store, version)
+    engine._install_published()
+
+    assert engine.artifacts.version == version
+    assert 'NEW1' in live_ids(engine) and 'prod_001' not in live_ids(engine)
+    assert search_ids(engine, 'zebra kimono')[0] == 'NEW1'
+
+
+def test_upsert_without_image_path_reports_missing_image(engine):
+    product = {key: value for key, value in NEW_PRODUCT.items() if key != 'image_path'}
+    result = engine.upsert_products([product])
+    assert result['failed_images'] == []
+    assert result['missing_images'] == [{'product_id': 'NEW1', 'path': ''}]
+    assert 'NEW1' in live_ids(engine)
+
+
+def test_repeated_augment_adds_products(engine):
+    totals = []
+    for _ in range(3):
+        result = engine.augment_catalog(5)
+        assert result['added'] == 5
+        totals.append(result['total_products'])
+    assert totals == [45, 50, 55]
+    assert len(live_ids(engine)) == 55
+
+
+def make_changes(engine):
+    """Upserts and deletes touching built products, new products and the same product repeatedly."""
+    engine.upsert_products([NEW_PRODUCT])
+    engine.upsert_products([dict(NEW_PRODUCT, product_id='prod_005', title='striped linen shirt')])
+    engine.delete_products(['prod_001'])
+    engine.upsert_products([dict(NEW_PRODUCT, product_id='NEW2', title='paisley scarf')])
+    engine.delete_products(['NEW2'])
+    engine.upsert_products([dict(NEW_PRODUCT, product_id='prod_005', title='striped wool shirt')])
+
+
+def test_replay_matches_applying_segments_one_by_one(engine):
+    make_changes(engine)
+    log = DeltaLog(engine.artifacts.path)
+    built = load_artifacts(engine.artifacts.path, engine.artifacts.version)
+
+    sequential = built
+    for seq in log.segments():
+        sequential = apply_segment(sequential, log.read(seq), seq)
+    batched = replay(built)
+
+    assert batched.delta_seq == sequential.delta_seq == log.last_seq()
+    rows = np.arange(len(sequential.catalog))
+    assert batched.catalog.ids_for(rows) == sequential.catalog.ids_for(rows)
+    assert (batched.live == sequential.live).all()
+    tokens = ['striped', 'shirt', 'zebra', 'paisley']
+    np.testing.assert_allclose(batched.bm25.get_scores(tokens), sequential.bm25.get_scores(tokens))
+    np.testing.assert_array_equal(batched.text_index.added_vectors, sequential.text_index.added_vectors)
+
+
+def test_rebuild_rebases_log_onto_the_build(engine):
+    make_changes(engine)
+    last_seq = DeltaLog(engine.artifacts.path).last_seq()
+
+    # products.csv has meanwhile picked up NEW1 as it was upserted
+    rebuild_from_catalog(engine, pd.concat([make_catalog(40), pd.DataFrame([NEW_PRODUCT])], ignore_index=True))
+
+    log = DeltaLog(engine.artifacts.path)
+    assert log.segments() == [last_seq]
+    segment = log.read(last_seq)
+    assert [(product['product_id'], product['title']) for product in segment.products] == \
+        [('prod_005', 'striped wool shirt')]
+    assert segment.deleted == ['prod_001']
+
+    ids = live_ids(engine)
+    assert 'NEW1' in ids and 'NEW2' not in ids and 'prod_001' not in ids
+    assert len(ids) == 40 + 1 - 1
+    assert search_ids(engine, 'striped wool shirt')[0] == 'prod_005'
+
+    # Later changes continue the numbering
+    engine.delete_products(['prod_002'])
+    assert DeltaLog(engine.artifacts.path).segments() == [last_seq, last_seq + 1]
+
+
+def test_compaction_keeps_one_history_segment(engine):
+    make_changes(engine)
+    engine.start_compaction()
+    wait_for_build(engine)
+    engine.delete_products(['prod_003'])
+    engine.start_compaction()
+    wait_for_build(engine)
+
+    log = DeltaLog(engine.artifacts.path)
+    assert log.segments() == [engine.artifacts.delta_seq]
+    segment = log.read(engine.artifacts.delta_seq)
+    assert sorted(product['product_id'] for product in segment.products) == ['NEW1', 'prod_005']
+    assert sorted(segment.deleted) == ['NEW2', 'prod_001', 'prod_003']
@@ -0,0 +1,161 @@
+"""
+Parity of the ONNX exports and the int8 quantized encoders with the fp32 torch encoders.
+Small randomly initialized MiniLM-style and CLIP models exercise the export and quantization
+code on every run; the served models are checked too when they are in the Hugging Face cache.
+"""
+
+import json
+import numpy as np
+import pytest
+from pathlib import Path
+from conftest import WORDS, make_catalog
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("sentence_transformers")
+from sentence_transformers import SentenceTransformer, models
+
+from catalog import product_text
+from onnx_encoder import ENCODERS, MIN_PARITY_COSINE, OnnxTextEncoder, export_encoder, parity_cosine
+from quantization import quantize_clip_text_tower, quantize_sentence_transformer
+
+TOP_K = 10
+# Mean share of the fp32 top-k corpus texts a query still retrieves
+MIN_ONNX_TOPK_OVERLAP = 0.95
+# int8 weights and activations are approximate, so the bounds are looser than for the exports
+MIN_INT8_COSINE = 0.98
+MIN_INT8_TOPK_OVERLAP = 0.8
+EVAL_QUERIES = [line.strip() for line in open(Path(__file__).parent.parent / "eval" / "queries.txt") if line.strip()]
+QUANTIZERS = {'mean_pooling': quantize_sentence_transformer, 'clip_text': quantize_clip_text_tower}
+
+
+def tiny_text_model(path: Path):
+    """MiniLM-shaped BERT with random weights, pooled like all-MiniLM-L6-v2."""
+    from transformers import BertConfig, BertModel, BertTokenizerFast
+    vocab = ['[PAD]', '[UNK]', '[CLS]', '[SEP]', '[MASK]'] + WORDS + list("abcdefghijklmnopqrstuvwxyz")
+    path.mkdir(parents=True)
+    (path / "vocab.txt").write_text('\n'.join(vocab))
+    BertTokenizerFast(vocab_file=str(path / "vocab.txt")).save_pretrained(path)
+    config = BertConfig(vocab_size=len(vocab), hidden_size=64, num_hidden_layers=2, num_attention_heads=4,
+                        intermediate_size=128, max_position_embeddings=64)
+    BertModel(config).save_pretrained(path)
+    return SentenceTransformer(modules=[models.Transformer(str(path), max_seq_length=32), models.Pooling(64, 'mean')])
+
+
+def tiny_clip_model(path: Path):
+    """CLIP with random weights and a character-level byte BPE tokenizer."""
+    from tokenizers.pre_tokenizers import ByteLevel
+    from transformers import CLIPConfig, CLIPImageProcessor, CLIPModel, CLIPProcessor, CLIPTokenizerFast
+    path.mkdir(parents=True)
+    vocab = {'<|startoftext|>': 0, '<|endoftext|>': 1}
+    for suffix in ('', '</w>'):
+        for char in sorted(ByteLevel.alphabet()):
+            vocab[char + suffix] = len(vocab)
+    with open(path / "vocab.json", 'w') as f:
+        json.dump(vocab, f)
+    (path / "merges.txt").write_text("#version: 0.2\n")
+    # Like the real CLIP tokenizer, truncate to the position embeddings
+    tokenizer = CLIPTokenizerFast.from_pretrained(str(path), model_max_length=64)
+    config = CLIPConfig(
+        text_config=dict(vocab_size=len(vocab), hidden_size=64, intermediate_size=128, num_hidden_layers=2,
+                         num_attention_heads=4, max_position_embeddings=64, bos_token_id=0, eos_token_id=1,
+                         pad_token_id=1),
+        vision_config=dict(hidden_size=32, intermediate_size=64, num_hidden_layers=1, num_attention_heads=2,
+                           image_size=32, patch_size=16),
+        projection_dim=32)
+    CLIPModel(config).save_pretrained(path)
+    image_processor = CLIPImageProcessor(size={'shortest_edge': 32}, crop_size={'height': 32, 'width': 32})
+    CLIPProcessor(image_processor=image_processor, tokenizer=tokenizer).save_pretrained(path)
+    return SentenceTransformer(modules=[models.CLIPModel(str(path))])
+
+
+def served_model(name: str):
+    """A model serve.py loads, or a skip if it has not been downloaded (loading would hit the network)."""
+    from huggingface_hub import try_to_load_from_cache
+    if not isinstance(try_to_load_from_cache(f"sentence-transformers/{name}", "config.json"), str):
+        pytest.skip(f"{name} is not in the Hugging Face cache")
+    return SentenceTransformer(name)
+
+
+def unit(embeddings) -> np.ndarray:
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+def topk_overlap(reference, candidate, queries: list, corpus: list) -> float:
+    """Mean share of each query's top-k corpus texts under reference that candidate also ranks top-k."""
+    def top(model):
+        scores = unit(model.encode(queries)) @ unit(model.encode(corpus)).T
+        return np.argsort(-scores, axis=1, kind='stable')[:, :TOP_K]
+    return float(np.mean([len(set(a) & set(b)) / TOP_K for a, b in zip(top(reference), top(candidate))]))
+
+
+@pytest.fixture(scope="module")
+def texts():
+    catalog = make_catalog(200, seed=1)
+    return {'queries': list(catalog.title.drop_duplicates()[:50]),
+            'corpus': [product_text(product) for product in catalog.to_dict('records')]}
+
+
+@pytest.fixture(scope="module", params=list(ENCODERS.items()), ids=list(ENCODERS))
+def encoder_model(request, tmp_path_factory):
+    """(kind, fp32 model, model directory) for each exported encoder, with random weights."""
+    name, kind = request.param
+    path = tmp_path_factory.mktemp(name)
+    torch.manual_seed(0)
+    model = tiny_text_model(path / "model") if kind == 'mean_pooling' else tiny_clip_model(path / "model")
+    return kind, model, path
+
+
+def check_onnx_export(kind, model, out_dir, texts):
+    export = export_encoder(model, kind, out_dir, texts['corpus'][:20])
+    encoder = OnnxTextEncoder(out_dir)
+    assert export['dim'] == model.get_sentence_embedding_dimension() == encoder.encode(['x']).shape[1]
+    assert parity_cosine(model, encoder, EVAL_QUERIES + texts['corpus']) >= MIN_PARITY_COSINE
+    assert topk_overlap(model, encoder, texts['queries'], texts['corpus']) >= MIN_ONNX_TOPK_OVERLAP
+
+
+def check_int8(kind, model, texts):
+    reference = {key: model.encode(values) for key, values in texts.items()}
+    QUANTIZERS[kind](model)
+    quantized = {key: model.encode(values) for key, values in texts.items()}
+    cosine = (unit(reference['corpus']) * unit(quantized['corpus'])).sum(axis=1)
+    assert cosine.min() >= MIN_INT8_COSINE
+
+    scores = unit(reference['queries']) @ unit(reference['corpus']).T
+    int8_scores = unit(quantized['queries']) @ unit(quantized['corpus']).T
+    overlap = [len(set(np.argsort(-a)[:TOP_K]) & set(np.argsort(-b)[:TOP_K])) / TOP_K
+               for a, b in zip(scores, int8_scores)]
+    assert np.mean(overlap) >= MIN_INT8_TOPK_OVERLAP
+
+
+def test_onnx_export_matches_torch(encoder_model, texts):
+    kind, model, path = encoder_model
+    check_onnx_export(kind, model, path / "onnx", texts)
+
+
+def test_onnx_export_handles_padding_and_truncation(encoder_model):
+    kind, model, path = encoder_model
+    export_encoder(model, kind, path / "onnx_lengths", ["red dress", "blue coat"])
+    encoder = OnnxTextEncoder(path / "onnx_lengths")
+    # Batches mix short and over-long texts, unlike the two-text example the graph was traced with
+    texts = ["silk", ' '.join(WORDS * 10), "vintage wool coat", ' '.join(WORDS)]
+    assert parity_cosine(model, encoder, texts) >= MIN_PARITY_COSINE
+    np.testing.assert_allclose(unit(encoder.encode(texts[:1])), unit(encoder.encode(texts))[:1], atol=1e-5)
+
+
+def test_int8_quantization_stays_close_to_fp32(encoder_model, texts):
+    kind, _, path = encoder_model
+    # Quantization swaps layers in place, so it gets a model of its own
+    torch.manual_seed(0)
+    model = tiny_text_model(path / "int8") if kind == 'mean_pooling' else tiny_clip_model(path / "int8")
+    check_int8(kind, model, texts)
+
+
+@pytest.mark.parametrize("name", list(ENCODERS))
+def test_served_encoders(name, texts, tmp_path):
+    from serve import CLIP_MODEL_NAME, TEXT_MODEL_NAME
+    kind = ENCODERS[name]
+    model_name = TEXT_MODEL_NAME if kind == 'mean_pooling' else CLIP_MODEL_NAME
+    check_onnx_export(kind, served_model(model_name), tmp_path / name, texts)
+    check_int8(kind, served_model(model_name), texts)
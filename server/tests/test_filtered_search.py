@@ -0,0 +1,39 @@
+"""Filtered ANN searches: exact scoring over the allowed rows only where FAISS could miss them."""
+
+import numpy as np
+import pytest
+from conftest import make_catalog, publish_artifact_set, start_engine
+
+INDEX_PARAMS = {'flat': {}, 'sq8': {}, 'hnsw': {'M': 8, 'efSearch': 16}, 'ivf': {'nlist': 4, 'nprobe': 1}}
+
+
+def filtered_search(engine, queries, allowed, k=10):
+    artifacts = engine.artifacts
+    return engine._ann_search(artifacts.text_index, artifacts.text_embeddings, queries, k, None, None, allowed)
+
+
+@pytest.mark.parametrize('index_type', sorted(INDEX_PARAMS))
+def test_filtered_search_returns_top_allowed_rows(tmp_path, monkeypatch, index_type):
+    import serve
+    store = publish_artifact_set(tmp_path / "artifacts", make_catalog(200), index_type, **INDEX_PARAMS[index_type])
+    engine = start_engine(store, monkeypatch)
+    exact_calls = []
+    search_rows = serve.search_rows
+    monkeypatch.setattr(serve, 'search_rows', lambda *args: exact_calls.append(len(args[1])) or search_rows(*args))
+    monkeypatch.setattr(serve, 'FILTER_EXACT_CHUNK_ROWS', 16)
+
+    allowed = np.zeros(200, dtype=bool)
+    allowed[::5] = True
+    queries = engine._encode_queries(["red linen dress"])[0]
+    scores, ids = filtered_search(engine, queries, allowed)
+
+    assert set(ids[0]) <= set(np.flatnonzero(allowed))
+    if index_type in ('hnsw', 'ivf'):
+        # 40 allowed rows in chunks of 16
+        assert exact_calls == [16, 16, 8]
+        similarities = engine.artifacts.text_embeddings[allowed] @ queries[0]
+        expected = np.flatnonzero(allowed)[np.argsort(-similarities)[:10]]
+        assert list(ids[0]) == list(expected)
+    else:
+        assert exact_calls == []
+        assert (ids[0] >= 0).all()
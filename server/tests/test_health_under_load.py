@@ -0,0 +1,58 @@
+"""/health stays responsive while searches saturate the search pool, and the overflow gets 503."""
+
+import time
+import asyncio
+import httpx
+import pytest
+
+WORKERS = 2
+QUEUE_DEPTH = 2
+CONCURRENT_SEARCHES = 8
+SEARCH_SECONDS = 0.5
+# Well below SEARCH_SECONDS: a health check never waits behind a search
+MAX_HEALTH_SECONDS = 0.1
+
+
+@pytest.fixture
+def saturated_app(monkeypatch):
+    import serve
+    from concurrency import BoundedExecutor
+
+    def slow_search(*args, **kwargs):
+        """Blocks its worker thread like a real search with reranking."""
+        time.sleep(SEARCH_SECONDS)
+        return serve.SearchResponse(results=[], total_time=SEARCH_SECONDS, num_results=0)
+
+    executor = BoundedExecutor(WORKERS, QUEUE_DEPTH)
+    monkeypatch.setattr(serve, 'search_executor', executor)
+    monkeypatch.setattr(serve.search_engine, 'search', slow_search)
+    yield serve.app
+    executor.shutdown()
+
+
+def test_health_responsive_under_search_saturation(saturated_app):
+    import serve
+
+    async def run():
+        transport = httpx.ASGITransport(app=saturated_app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            searches = [asyncio.create_task(client.get("/search", params={"q": f"dress {i}"}))
+                        for i in range(CONCURRENT_SEARCHES)]
+            await asyncio.sleep(0.05)
+            latencies = []
+            for _ in range(10):
+                start = time.perf_counter()
+                response = await client.get("/health")
+                latencies.append(time.perf_counter() - start)
+                assert response.status_code == 200
+                await asyncio.sleep(0.01)
+            return latencies, await asyncio.gather(*searches)
+
+    latencies, responses = asyncio.run(run())
+
+    assert max(latencies) < MAX_HEALTH_SECONDS
+    completed = [r for r in responses if r.status_code == 200]
+    rejected = [r for r in responses if r.status_code == 503]
+    assert len(completed) == WORKERS + QUEUE_DEPTH
+    assert len(rejected) == CONCURRENT_SEARCHES - WORKERS - QUEUE_DEPTH
+    assert all(r.headers['Retry-After'] == str(serve.SEARCH_RETRY_AFTER) for r in rejected)
@@ -0,0 +1,76 @@
+"""Index type and build parameters carried through rebuilds and compactions."""
+
+import pytest
+from pathlib import Path
+from ann import index_config
+from conftest import make_catalog, publish_artifact_set, start_engine
+from test_delta import NEW_PRODUCT, wait_for_build
+
+HNSW_PARAMS = {'M': 16, 'efConstruction': 80, 'efSearch': 40}
+
+
+@pytest.fixture
+def hnsw_engine(tmp_path, monkeypatch):
+    store = publish_artifact_set(tmp_path / "artifacts", make_catalog(40), 'hnsw', **HNSW_PARAMS)
+    return start_engine(store, monkeypatch)
+
+
+def test_index_config_prefers_requested_params():
+    metadata = {'index': {'text': {'type': 'ivf', 'nlist': 2, 'nprobe': 2}}, 'index_params': {'nlist': 256}}
+    assert index_config(metadata) == ('ivf', {'nlist': 256})
+
+
+def test_index_config_of_older_sets_skips_clamped_params():
+    metadata = {'index': {'text': {'type': 'ivfpq', 'nlist': 2, 'nprobe': 2, 'pq_m': 16, 'pq_nbits': 4}}}
+    assert index_config(metadata) == ('ivfpq', {'pq_m': 16})
+    assert index_config({}) == ('flat', {})
+
+
+def test_rebuild_passes_index_params(hnsw_engine, monkeypatch):
+    import serve
+    commands = []
+
+    def record(args, **kwargs):
+        commands.append(args)
+        raise RuntimeError("build not run")
+
+    monkeypatch.setattr(serve.subprocess, 'Popen', record)
+    version = hnsw_engine.store.new_version()
+    hnsw_engine.rebuild_state = {'kind': 'rebuild', 'state': 'building', 'version': version}
+    hnsw_engine._run_rebuild(version)
+
+    command = commands[0]
+    flags = dict(zip(command[command.index("--index-type"):][::2], command[command.index("--index-type") + 1:][::2]))
+    assert flags['--index-type'] == 'hnsw'
+    assert (flags['--hnsw-m'], flags['--ef-construction'], flags['--ef-search']) == ('16', '80', '40')
+
+
+def test_rebuild_output_dir_is_absolute(tmp_path, monkeypatch):
+    import serve
+    commands = []
+
+    def record(args, **kwargs):
+        commands.append(args)
+        raise RuntimeError("build not run")
+
+    # Served from an artifact root relative to a directory other than the build script's
+    monkeypatch.chdir(tmp_path)
+    engine = start_engine(publish_artifact_set(Path("artifacts"), make_catalog(20)), monkeypatch)
+    monkeypatch.setattr(serve.subprocess, 'Popen', record)
+    version = engine.store.new_version()
+    engine.rebuild_state = {'kind': 'rebuild', 'state': 'building', 'version': version}
+    engine._run_rebuild(version)
+
+    command = commands[0]
+    assert command[command.index("--output-dir") + 1] == str(tmp_path / "artifacts" / "versions" / version)
+
+
+def test_compaction_keeps_index_params(hnsw_engine):
+    hnsw_engine.upsert_products([NEW_PRODUCT])
+    hnsw_engine.start_compaction()
+    wait_for_build(hnsw_engine)
+
+    metadata = hnsw_engine.artifacts.metadata
+    assert metadata['index']['text'] == {'type': 'hnsw', **HNSW_PARAMS}
+    assert metadata['index_params'] == HNSW_PARAMS
+    assert hnsw_engine.artifacts.text_index.hnsw.efSearch == 40
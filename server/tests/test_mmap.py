@@ -0,0 +1,36 @@
+"""FAISS indices loaded with MMAP_ARTIFACTS are mapped from the file and search like heap copies."""
+
+import numpy as np
+import pytest
+from ann import build_ann_index, read_index, search, write_index
+
+INDEX_TYPES = {
+    'flat': {},
+    'sq8': {},
+    'hnsw': {'M': 16, 'efConstruction': 40},
+    'ivf': {'nlist': 16, 'nprobe': 16},
+}
+
+
+def mapped_files():
+    with open("/proc/self/maps") as f:
+        return {line.split(maxsplit=5)[-1].strip() for line in f if '/' in line}
+
+
+@pytest.mark.parametrize('index_type', sorted(INDEX_TYPES))
+def test_mmap_index_matches_heap_index(tmp_path, index_type):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((2000, 32)).astype('float32')
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    path = tmp_path / f"{index_type}.index"
+    write_index(build_ann_index(vectors, index_type, **INDEX_TYPES[index_type])[0], path)
+
+    heap = read_index(path)
+    mapped = read_index(path, mmap=True)
+    assert str(path) in mapped_files()
+
+    queries = vectors[:20]
+    heap_scores, heap_ids = search(heap, queries, 10)
+    mapped_scores, mapped_ids = search(mapped, queries, 10)
+    np.testing.assert_array_equal(mapped_ids, heap_ids)
+    np.testing.assert_allclose(mapped_scores, heap_scores, rtol=1e-6)
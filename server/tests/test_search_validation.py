@@ -0,0 +1,24 @@
+"""Search parameters out of range are rejected with a message naming the parameter."""
+
+import pytest
+from fastapi import HTTPException
+
+
+@pytest.mark.parametrize('k', [0, -1, 2001])
+def test_k_out_of_range(engine, k):
+    with pytest.raises(HTTPException) as error:
+        engine.search("red dress", k=k, rerank=False)
+    assert error.value.status_code == 400
+    assert error.value.detail == "k must be between 1 and 2000"
+
+
+@pytest.mark.parametrize('depths', [{'text_depth': 0}, {'img_depth': 2001}, {'kw_depth': -1}])
+def test_candidate_depths_out_of_range(engine, depths):
+    with pytest.raises(HTTPException) as error:
+        engine.search("red dress", k=10, rerank=False, **depths)
+    assert error.value.status_code == 400
+    assert "depth" in error.value.detail
+
+
+def test_kw_depth_zero_is_allowed(engine):
+    assert engine.search("red dress", k=5, rerank=False, kw_depth=0).num_results == 5
@@ -9,7 +9,7 @@ import re
 import csv
 import json
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable
 import random
 
 def extract_product_info(filename: str) -> Dict[str, Any]:
@@ -182,9 +182,15 @@ def scan_products_directory(public_dir: str) -> List[Dict[str, Any]]:
     
     return products
 
-def augment_products(products: List[Dict[str, Any]], count: int) -> List[Dict[str, Any]]:
-    """Generate synthetic products by cloning and perturbing existing ones."""
+def augment_products(products: List[Dict[str, Any]], count: int,
+                     taken_ids: Iterable[str] = ()) -> List[Dict[str, Any]]:
+    """
+    Generate synthetic products by cloning and perturbing existing ones.
+    Their aug_NNN ids are unique among products and taken_ids.
+    """
     augmented = []
+    taken = set(taken_ids) | {str(product['product_id']) for product in products}
+    next_id = len(products) + 1
     
     # Variation templates
     color_variations = {
@@ -212,7 +218,10 @@ def augment_products(products: List[Dict[str, Any]], count: int) -> List[Dict[st
         
         # Create variation
         new_product = base_product.copy()
-        new_product['product_id'] = f"aug_{len(products) + len(augmented) + 1:03d}"
+        while f"aug_{next_id:03d}" in taken:
+            next_id += 1
+        new_product['product_id'] = f"aug_{next_id:03d}"
+        taken.add(new_product['product_id'])
         
         # Vary the title
         title_parts = new_product['title'].split()
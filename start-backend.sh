@@ -20,7 +20,7 @@ cd server
 source .venv/bin/activate
 
 # Build indices if they don't exist
-if [ ! -f "artifacts/text.index" ]; then
+if [ ! -f "artifacts/text.index" ] && [ ! -f "artifacts/CURRENT" ]; then
     echo "Building search indices..."
     python build_index.py
 fi